@@ -0,0 +1,124 @@
+# -*- encoding: utf-8
+
+"""
+Compare the json backends on the payloads of wechat api.
+
+Usage::
+
+    python benchmarks/bench_json.py [number]
+
+"""
+
+import sys
+import timeit
+
+from wechat import jsonbackend
+
+
+def _user_info(index):
+    return {
+        u'subscribe': 1,
+        u'openid': u'o6_bmjrPTlm6_2sgVt7hMZOPfL2M{}'.format(index),
+        u'nickname': u'微信用户{}'.format(index),
+        u'sex': 1,
+        u'language': u'zh_CN',
+        u'city': u'广州',
+        u'province': u'广东',
+        u'country': u'中国',
+        u'headimgurl': u'http://thirdwx.qlogo.cn/mmopen/g3MonUZtNHkdmzicI'
+                       u'lib3sdxPFgibEcRbnanHmRbE3V3Q3r9MJMiagNtKSUfn8yHjR0'
+                       u'5zxnpGQE52ZyEPIPOAGZjn0pj4dO9ribg/0',
+        u'subscribe_time': 1382694957,
+        u'unionid': u'o6_bmasdasdsad6_2sgVt7hMZOPfL',
+        u'remark': u'',
+        u'groupid': 0,
+        u'tagid_list': [128, 2],
+        u'subscribe_scene': u'ADD_SCENE_QR_CODE',
+        u'qr_scene': 98765,
+        u'qr_scene_str': u'',
+    }
+
+
+PAYLOADS = {
+    # response of user/info/batchget
+    u'user_info_batch': {
+        u'user_info_list': [_user_info(index) for index in range(100)]
+    },
+    # response of material/batchget_material
+    u'news_batch': {
+        u'total_count': 20,
+        u'item_count': 20,
+        u'item': [{
+            u'media_id': u'media_id_{}'.format(index),
+            u'content': {u'news_item': [{
+                u'title': u'标题{}'.format(index),
+                u'thumb_media_id': u'thumb_media_id',
+                u'show_cover_pic': 1,
+                u'author': u'作者',
+                u'digest': u'图文消息的摘要，仅有单图文消息才有摘要',
+                u'content': u'<p>图文消息的具体内容，支持HTML标签</p>' * 20,
+                u'url': u'http://mp.weixin.qq.com/s?__biz=MzA',
+                u'content_source_url': u'http://www.qq.com/',
+            }]},
+            u'update_time': 1520000000,
+        } for index in range(20)]
+    },
+    # body of message/template/send
+    u'template_message': {
+        u'touser': u'OPENID',
+        u'template_id': u'ngqIpbwh8bUfcSsECmogfXcV14J0tQlEpBO27izEYtY',
+        u'url': u'http://weixin.qq.com/download',
+        u'data': {
+            u'first': {u'value': u'恭喜你购买成功！', u'color': u'#173177'},
+            u'keyword1': {u'value': u'巧克力', u'color': u'#173177'},
+            u'keyword2': {u'value': u'39.8元', u'color': u'#173177'},
+            u'keyword3': {u'value': u'2014年9月22日', u'color': u'#173177'},
+            u'remark': {u'value': u'欢迎再次购买！', u'color': u'#173177'},
+        },
+    },
+    # response of the access token
+    u'access_token': {
+        u'access_token': u'ACCESS_TOKEN' * 10,
+        u'expires_in': 7200,
+    },
+}
+
+
+def _installed_backends():
+    for name in jsonbackend.BACKENDS:
+        try:
+            __import__(name)
+        except ImportError:
+            continue
+        yield name
+
+
+def _bench(func, number):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+
+def main(number=1000):
+    row = u'{:<18} {:<12} {:>12} {:>12}'
+    print(row.format(u'payload', u'backend', u'loads (us)', u'dumps (us)'))
+
+    for payload_name, payload in sorted(PAYLOADS.items()):
+        document = jsonbackend.dumps_bytes(payload)
+        for backend in _installed_backends():
+            jsonbackend.use(backend)
+            loads_time = _bench(lambda: jsonbackend.loads(document), number)
+            dumps_time = _bench(
+                lambda: jsonbackend.dumps_bytes(payload),
+                number
+            )
+            print(row.format(
+                payload_name,
+                backend,
+                u'{:.1f}'.format(loads_time * 1e6),
+                u'{:.1f}'.format(dumps_time * 1e6)
+            ))
+
+    jsonbackend.use()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
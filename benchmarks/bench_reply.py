@@ -0,0 +1,99 @@
+# -*- encoding: utf-8
+
+"""
+Replies per second built by XMLMessageBuilder for every message type,
+and the text reply encrypted for a safe mode account.
+
+Usage::
+
+    python benchmarks/bench_reply.py [number]
+
+"""
+
+import sys
+import timeit
+
+from wechat.message import XMLMessageBuilder, build_message_crypto_for
+
+
+TOKEN = u'spamtest'
+AES_KEY = u'jWmYm7qr5nMoAUwZRjGtBxmz3KA1tkAj3ykkR6q2B2C'
+APPID = u'wx2c2769f8efd9abc2'
+
+RECEIVED_XML = u"""<xml>
+<ToUserName><![CDATA[gh_e136c6e50636]]></ToUserName>
+<FromUserName><![CDATA[oMgHVjngRipVsoxg6TuX3vz6glDg]]></FromUserName>
+<CreateTime>1348831860</CreateTime>
+<MsgType><![CDATA[text]]></MsgType>
+<Content><![CDATA[你好]]></Content>
+<MsgId>1234567890123456</MsgId>
+</xml>"""
+
+
+def _article(index):
+    return {
+        'Title': u'图文消息标题{}'.format(index),
+        'Description': u'图文消息描述{}'.format(index),
+        'PicUrl': u'http://mmbiz.qpic.cn/mmbiz_jpg/{}/0'.format(index),
+        'Url': u'http://mp.weixin.qq.com/s/{}'.format(index),
+    }
+
+
+def _replies(message):
+    builder = XMLMessageBuilder
+    crypto = build_message_crypto_for(TOKEN, AES_KEY, APPID)
+    media_id = u'MPtS1_eNbjfF5z1R7kBpVDfI8r0aA5ssuJfhQ7IQb3w'
+    articles = [_article(index) for index in range(8)]
+    return [
+        (u'text', lambda: builder.build_reply_textmsg_for(
+            message,
+            u'感谢关注，回复 1 查看最新活动'
+        )),
+        (u'image', lambda: builder.build_reply_imgmsg_for(message, media_id)),
+        (u'voice', lambda: builder.build_reply_voicemsg_for(
+            message,
+            media_id
+        )),
+        (u'video', lambda: builder.build_reply_videomsg_for(
+            message,
+            media_id,
+            u'视频标题',
+            u'视频描述'
+        )),
+        (u'music', lambda: builder.build_reply_musicmsg_for(
+            message,
+            media_id,
+            u'音乐标题',
+            u'http://a.com/music.mp3',
+            u'音乐描述',
+            u'http://a.com/hq_music.mp3'
+        )),
+        (u'news(1)', lambda: builder.build_reply_newsmsg_for(
+            message,
+            articles[:1]
+        )),
+        (u'news(8)', lambda: builder.build_reply_newsmsg_for(
+            message,
+            articles
+        )),
+        (u'encrypted', lambda: builder.build_encrypted_reply(
+            crypto,
+            builder.build_reply_textmsg_for,
+            message,
+            u'感谢关注，回复 1 查看最新活动'
+        )),
+    ]
+
+
+def main(number=10000):
+    message = XMLMessageBuilder.parse(RECEIVED_XML)
+
+    row = u'{:<10} {:>16}'
+    print(row.format(u'reply', u'replies/s'))
+    for name, build in _replies(message):
+        seconds = min(timeit.repeat(build, number=number, repeat=3))
+        print(row.format(name, u'{:,.0f}'.format(number / seconds)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,100 @@
+# -*- encoding: utf-8
+
+"""
+Compare the xml parser of the results with BeautifulSoup on the responses
+of the pay api.
+
+Usage::
+
+    python benchmarks/bench_xml.py [number]
+
+"""
+
+import sys
+import timeit
+
+from wechat import result
+from wechat.xmlparser import parse_flat_xml
+
+
+def _xml(**fields):
+    return u'<xml>\n{}\n</xml>'.format(u'\n'.join(
+        u'  <{key}><![CDATA[{value}]]></{key}>'.format(key=key, value=value)
+        for key, value in sorted(fields.items())
+    ))
+
+
+_COMMON = dict(
+    return_code=u'SUCCESS',
+    return_msg=u'OK',
+    appid=u'wx2421b1c4370ec43b',
+    mch_id=u'10000100',
+    nonce_str=u'IITRi8Iabbblz1Jc',
+    sign=u'7921E432F65EB8ED0CE9755F0E86D72F',
+    result_code=u'SUCCESS',
+)
+
+
+PAYLOADS = {
+    u'unifiedorder': _xml(
+        prepay_id=u'wx201411101639507cbf6ffd8b0779950874',
+        trade_type=u'JSAPI',
+        code_url=u'weixin://wxpay/bizpayurl/up?pr=NwY5Mz9&groupid=00',
+        **_COMMON
+    ),
+    u'orderquery': _xml(
+        device_info=u'1000',
+        openid=u'oUpF8uN95-Ptaags6E_roPHg7AG0',
+        is_subscribe=u'Y',
+        trade_type=u'JSAPI',
+        bank_type=u'CMC',
+        total_fee=u'100',
+        fee_type=u'CNY',
+        cash_fee=u'100',
+        transaction_id=u'1008450740201411110005820873',
+        out_trade_no=u'1415757673',
+        attach=u'订单额外描述',
+        time_end=u'20141111170043',
+        trade_state=u'SUCCESS',
+        trade_state_desc=u'支付成功',
+        **_COMMON
+    ),
+    u'refund': _xml(
+        transaction_id=u'1008450740201411110005820873',
+        out_trade_no=u'1415757673',
+        out_refund_no=u'1415701182',
+        refund_id=u'2008450740201411110000174436',
+        refund_fee=u'1',
+        total_fee=u'1',
+        cash_fee=u'1',
+        coupon_refund_fee=u'0',
+        coupon_refund_count=u'0',
+        **_COMMON
+    ),
+}
+
+
+def _bench(func, number):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+
+def main(number=1000):
+    row = u'{:<14} {:>14} {:>16} {:>10}'
+    print(row.format(u'payload', u'expat (us)', u'soup (us)', u'speedup'))
+
+    for payload_name, payload in sorted(PAYLOADS.items()):
+        expat_time = _bench(lambda: parse_flat_xml(payload), number)
+        soup_time = _bench(
+            lambda: result._parse_xml_by_soup(payload),
+            number
+        )
+        print(row.format(
+            payload_name,
+            u'{:.1f}'.format(expat_time * 1e6),
+            u'{:.1f}'.format(soup_time * 1e6),
+            u'{:.1f}x'.format(soup_time / expat_time)
+        ))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
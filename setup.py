@@ -19,7 +19,8 @@ REQUIRED = [
     'requests>=2.18.4',
     'lxml',
     'bs4',
-    'pycrypto'
+    'pycrypto',
+    'futures; python_version < "3"'
 ]
 
 TEST_REQUIREMENTS = [
@@ -89,5 +90,8 @@ setup(
     extras_require={
         'dev': ['check-manifest'],
         'test': ['coverage'],
+        'async': ['aiohttp>=3.0'],
+        'tracing': ['opentelemetry-api'],
+        'speedups': ['orjson; python_version >= "3.6"'],
     },
 )
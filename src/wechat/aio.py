@@ -0,0 +1,1040 @@
+# -*- encoding: utf-8
+
+"""
+
+Asyncio Api Requests
+==============================
+
+Requires python3.5+ and `aiohttp`, install with
+``pip install wechat-requests[async]``
+
+Every client mirrors the blocking one (same ``_prepare_param_dict`` and
+``_retry`` override points, same RequestResult outputs), only the request
+methods become coroutines, so one event loop can keep many calls in flight.
+
+Usage:
+---------------------------
+
+.. code-block:: python
+
+    >>>from wechat import aio
+    >>>async with aio.formp(access_token) as mp:
+    ...    results = await asyncio.gather(*[
+    ...        mp.get('user/info', openid=openid) for openid in openids
+    ...    ])
+
+The body of the download is read by ``async for``:
+
+.. code-block:: python
+
+    >>>async with await mp.get_media(media_id) as result:
+    ...    async for chunk in result.iter_content():
+    ...        upload(chunk)
+
+"""
+
+import time
+import asyncio
+import inspect
+import logging
+import ssl
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+from .api import Api, _encode_json_body, _flight_timeout
+from .mpapi import MpApi
+from .auth import MpOuthApi, WebAuth
+from .pay import Wxpay
+from .result import (build_from_response, build_from_exception,
+                     StreamResult, _is_json_body)
+from .multipart import MultipartEncoder
+from .deadline import get_deadline
+from .compat import bytes, str
+from .exceptions import (RequestException, ConnectionError, Timeout,
+                         RetryError, RateLimitExceeded)
+from .settings import (DEFAULT_HEADERS, TIMEOUT, ENCODING, RETRYS,
+                       RETRY_BACKOFF_FACTOR, RETRY_STATUS_FORCELIST,
+                       AUTH_EXPIRED_CODES, ASYNC_CONNECTION_LIMIT,
+                       DOWNLOAD_CHUNK_SIZE, DOWNLOAD_SNIFF_BYTES,
+                       UPLOAD_CHUNK_SIZE, BATCH_MAX_CONCURRENCY)
+from . import metrics
+from . import tracing
+from . import jsonbackend
+
+
+__all__ = ['AsyncApi', 'AsyncMpApi', 'AsyncMpOuthApi', 'AsyncWxpay',
+           'AsyncWebAuth', 'AsyncStreamResult', 'formp', 'for_merchant',
+           'get_mp_access_token', 'web_auth']
+
+
+log = logging.getLogger(__name__)
+
+
+class _AsyncResponse(object):
+    """Adapt the aiohttp response (and its already read body) to the
+    requests.Response interface which build_from_response depends on
+    """
+
+    def __init__(self, response, content):
+        self.status_code = response.status
+        self.headers = response.headers
+        self.url = str(response.url)
+        self.request = response.request_info
+        self.content = content
+        self.encoding = None
+        self.raw = response
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or ENCODING, 'replace')
+
+    def json(self, **kwargs):
+        return jsonbackend.loads(self.content)
+
+    def close(self):
+        self.raw.close()
+
+
+class _AsyncChunkIterator(object):
+
+    def __init__(self, result, chunk_size):
+        self._result = result
+        self._head = result._head
+        self._chunks = result.response.raw.content.iter_chunked(chunk_size)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            if self._head:
+                chunk, self._head = self._head, b''
+            else:
+                chunk = await self._chunks.__anext__()
+        except BaseException:
+            # StopAsyncIteration at the end of the body too
+            self._result.close()
+            raise
+
+        self._result._add_size(len(chunk))
+        return chunk
+
+
+class AsyncStreamResult(StreamResult):
+    """StreamResult of the asyncio client, the body is read by
+    ``async for chunk in result.iter_content()`` or
+    ``await result.save(dest)``
+    """
+
+    __slots__ = ()
+
+    def iter_content(self, chunk_size=DOWNLOAD_CHUNK_SIZE):
+        """
+        Returns:
+          async iterator of the chunks of the body in bytes, can be iterated
+          once
+
+        """
+        return _AsyncChunkIterator(self, chunk_size)
+
+    async def save(self, dest, chunk_size=DOWNLOAD_CHUNK_SIZE):
+        """Same as StreamResult.save, the file is written in the blocking
+        way
+        """
+        if hasattr(dest, 'write'):
+            return await self._write(dest, chunk_size)
+
+        with open(dest, 'wb') as dest_file:
+            return await self._write(dest_file, chunk_size)
+
+    def _add_size(self, size):
+        object.__setattr__(self, '_size', self._size + size)
+
+    async def _write(self, dest_file, chunk_size):
+        async for chunk in self.iter_content(chunk_size):
+            dest_file.write(chunk)
+        return self._size
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+
+if aiohttp is not None:
+    class _MultipartPayload(aiohttp.payload.Payload):
+        """Body of MultipartEncoder with Content-Length, read chunk by chunk
+        while sending
+        """
+
+        def __init__(self, encoder):
+            super(_MultipartPayload, self).__init__(
+                encoder,
+                content_type=encoder.content_type
+            )
+            self._size = len(encoder)
+
+        async def write(self, writer):
+            loop = asyncio.get_event_loop()
+            while True:
+                # the file is read off the event loop
+                chunk = await loop.run_in_executor(
+                    None,
+                    self._value.read,
+                    UPLOAD_CHUNK_SIZE
+                )
+                if len(chunk) == 0:
+                    return
+                await writer.write(chunk)
+
+        def decode(self, encoding='utf-8', errors='strict'):
+            raise TypeError('multipart body is streamed')
+
+
+async def _read_head(resp):
+    head = b''
+    while len(head) < DOWNLOAD_SNIFF_BYTES:
+        chunk = await resp.content.read(DOWNLOAD_SNIFF_BYTES - len(head))
+        if len(chunk) == 0:
+            break
+        head += chunk
+    return head
+
+
+def _build_params(params_dict):
+    if params_dict is None:
+        return None
+
+    params = {}
+    for k, v in params_dict.items():
+        if v is None:
+            continue
+
+        if isinstance(v, bytes):
+            v = v.decode(ENCODING)
+        elif not isinstance(v, str):
+            v = str(v)
+        params[k] = v
+
+    return params
+
+
+def _build_timeout(timeout):
+    deadline = get_deadline(timeout)
+    if deadline is not None:
+        # the attempt gets the remaining budget
+        return _build_timeout(deadline.attempt_timeout(timeout.timeout))
+
+    if timeout is None:
+        return aiohttp.ClientTimeout(total=None)
+
+    if isinstance(timeout, tuple):
+        connect_timeout, read_timeout = timeout
+        return aiohttp.ClientTimeout(
+            sock_connect=connect_timeout,
+            sock_read=read_timeout
+        )
+
+    return aiohttp.ClientTimeout(total=timeout)
+
+
+class _AsyncSingleFlight(object):
+    """SingleFlight of coroutines, the calls are keyed by event loop too"""
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, coro_func, timeout=None):
+        loop = asyncio.get_event_loop()
+        key = (id(loop), key)
+
+        future = self._calls.get(key)
+        if future is not None:
+            try:
+                return await asyncio.wait_for(
+                    asyncio.shield(future),
+                    timeout
+                )
+            except asyncio.TimeoutError:
+                if future.done():
+                    raise
+                # the call in flight hangs, not the follower
+                return await coro_func()
+
+        future = self._calls[key] = loop.create_future()
+        # retrieve the exception even there is no follower
+        future.add_done_callback(
+            lambda f: f.cancelled() or f.exception()
+        )
+        try:
+            result = await coro_func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as call_error:
+            future.set_exception(call_error)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+
+_default_async_flight = _AsyncSingleFlight()
+
+
+class AsyncApi(Api):
+
+    def __init__(self, root_path=u'/', headers=DEFAULT_HEADERS,
+                 timeout=TIMEOUT, connection_limit=ASYNC_CONNECTION_LIMIT,
+                 **kwargs):
+        if aiohttp is None:
+            raise ImportError(
+                'aiohttp is required, pip install wechat-requests[async]'
+            )
+
+        self._connection_limit = connection_limit
+        self._ssl_context = None
+        self._client_cert = None
+        self._session_loop = None
+
+        super(AsyncApi, self).__init__(
+            root_path=root_path,
+            headers=headers,
+            timeout=timeout,
+            **kwargs
+        )
+
+    async def request(self, method, api_path, params_dict=None, **kwargs):
+        """
+        Raises:
+          RequestException
+
+        """
+        coalesce_key = kwargs.pop('coalesce_key', None)
+        url = self._prepare_api_url(api_path)
+        self._prepare_request_options(url, kwargs)
+        params_dict = await self._prepare_param_dict_async(params_dict)
+
+        cache_key, cache_ttl = self._lookup_cache_key(
+            method,
+            url,
+            params_dict,
+            kwargs
+        )
+        if cache_key is not None:
+            cached_result = self._response_cache.get(cache_key)
+            if cached_result is not None:
+                return cached_result
+
+        flight_key = self._lookup_flight_key(
+            method,
+            url,
+            params_dict,
+            kwargs,
+            coalesce_key
+        )
+        start = time.time()
+        with tracing.span(u'wechat.request', {
+            u'http.method': method,
+            u'http.url': url
+        }) as request_span:
+            try:
+                if flight_key is None:
+                    result = await self._send(
+                        method,
+                        url,
+                        params_dict,
+                        **kwargs
+                    )
+                else:
+                    result = await _default_async_flight.do(
+                        flight_key,
+                        lambda: self._send(method, url, params_dict, **kwargs),
+                        _flight_timeout(kwargs.get('timeout'))
+                    )
+            except RequestException as request_error:
+                metrics.observe_request(
+                    method,
+                    url,
+                    time.time() - start,
+                    error=request_error
+                )
+                raise
+            metrics.observe_request(method, url, time.time() - start, result)
+            if result.is_failed:
+                request_span.set_attribute(u'wechat.errcode', result.errcode)
+
+        if cache_key is not None:
+            self._response_cache.set(cache_key, result, cache_ttl)
+
+        return result
+
+    async def _send(self, method, url, params_dict, **kwargs):
+        policy = self._retry_policy
+        if policy is None:
+            return await self._send_once(method, url, params_dict, **kwargs)
+
+        policy.record_request()
+        retries = 0
+        while True:
+            error = result = None
+            try:
+                result = await self._send_once(
+                    method,
+                    url,
+                    params_dict,
+                    **kwargs
+                )
+            except RequestException as request_error:
+                error = request_error
+
+            if not policy.should_retry(
+                method,
+                url,
+                retries,
+                error=error,
+                result=result
+            ):
+                if error is not None:
+                    raise error
+                return result
+
+            metrics.observe_retry(url, u'policy')
+            await asyncio.sleep(
+                self._retry_backoff(retries, kwargs.get('timeout'))
+            )
+            retries += 1
+
+    async def _send_once(self, method, url, params_dict, **kwargs):
+        if self._rate_limiter is not None:
+            await self._acquire_rate_limit(
+                url,
+                get_deadline(kwargs.get('timeout'))
+            )
+
+        if self._host_pool is None:
+            result = await self._guarded_execute_request(
+                method,
+                url,
+                params_dict=params_dict,
+                **kwargs
+            )
+        else:
+            url, result = await self._execute_with_failover(
+                method,
+                url,
+                params_dict,
+                **kwargs
+            )
+
+        if result.is_failed:
+            with tracing.span(u'wechat.retry', {
+                u'wechat.errcode': result.errcode
+            }):
+                retry_result = self._retry(
+                    result,
+                    method,
+                    url,
+                    params_dict,
+                    **kwargs
+                )
+                if inspect.isawaitable(retry_result):
+                    retry_result = await retry_result
+
+            if retry_result is None:
+                log.warning(u'{} retry result is None'.format(
+                    self.__class__.__name__)
+                )
+                retry_result = result
+            elif retry_result is not result:
+                metrics.observe_retry(url, u'hook')
+
+            return retry_result
+        else:
+            return result
+
+    async def _guarded_execute_request(self, method, url, params_dict=None,
+                                       **kwargs):
+        deadline = get_deadline(kwargs.get('timeout'))
+        if deadline is not None:
+            deadline.check(url)
+
+        if not self._rewind_body(kwargs):
+            raise RequestException(
+                u'body of {} can not be rewound to send again'.format(url)
+            )
+
+        return await self._execute_observed(
+            method,
+            url,
+            params_dict=params_dict,
+            **kwargs
+        )
+
+    async def _execute_attempt(self, execute, method, url, params_dict=None,
+                               **kwargs):
+        if self._circuit_breaker is None:
+            return await execute(
+                method,
+                url,
+                params_dict=params_dict,
+                **kwargs
+            )
+
+        breaker = self._circuit_breaker
+        breaker.before_request(url)
+        try:
+            result = await execute(
+                method,
+                url,
+                params_dict=params_dict,
+                **kwargs
+            )
+        except Exception as request_error:
+            breaker.record(url, breaker.is_failure(error=request_error))
+            raise
+        else:
+            breaker.record(url, breaker.is_failure(result=result))
+            return result
+
+    async def _execute_observed(self, method, url, params_dict=None,
+                                **kwargs):
+        if self._adaptive_timeout is None:
+            return await self._execute_attempt(
+                self._execute_request,
+                method,
+                url,
+                params_dict=params_dict,
+                **kwargs
+            )
+
+        hedge_delay = None
+        if method.upper() == 'GET' and not kwargs.get('stream'):
+            hedge_delay = self._adaptive_timeout.hedge_delay(url)
+
+        def _attempt():
+            return self._execute_attempt(
+                self._execute_timed,
+                method,
+                url,
+                params_dict=params_dict,
+                **kwargs
+            )
+
+        async def _hedge():
+            if self._rate_limiter is not None:
+                if self._rate_limiter.try_acquire(url) > 0:
+                    raise RateLimitExceeded(
+                        u'no rate limit budget to hedge {}'.format(url)
+                    )
+            return await _attempt()
+
+        if hedge_delay is None:
+            return await _attempt()
+
+        attempts = [asyncio.ensure_future(_attempt())]
+        done, _ = await asyncio.wait(attempts, timeout=hedge_delay)
+        if not done:
+            attempts.append(asyncio.ensure_future(_hedge()))
+
+        pending = attempts
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                for attempt in done:
+                    if attempt.exception() is None:
+                        return attempt.result()
+
+            return attempts[0].result()
+        finally:
+            for attempt in attempts:
+                if not attempt.done():
+                    attempt.cancel()
+
+    async def _execute_timed(self, method, url, params_dict=None, **kwargs):
+        start = time.time()
+        try:
+            result = await self._execute_request(
+                method,
+                url,
+                params_dict=params_dict,
+                **kwargs
+            )
+        except Timeout:
+            self._adaptive_timeout.observe(url, time.time() - start)
+            raise
+
+        self._adaptive_timeout.observe(url, time.time() - start)
+        return result
+
+    async def _execute_with_failover(self, method, url, params_dict,
+                                     **kwargs):
+        candidate_urls = self._host_pool.candidates(url)
+        for index, candidate_url in enumerate(candidate_urls):
+            is_last = index == len(candidate_urls) - 1
+            start = time.time()
+            try:
+                result = await self._guarded_execute_request(
+                    method,
+                    candidate_url,
+                    params_dict=params_dict,
+                    **kwargs
+                )
+            except RequestException as request_error:
+                self._host_pool.report(candidate_url, error=request_error)
+                if is_last or not self._host_pool.should_failover(
+                    method,
+                    error=request_error
+                ):
+                    raise
+            else:
+                self._host_pool.report(
+                    candidate_url,
+                    latency=time.time() - start,
+                    result=result
+                )
+                if is_last or not self._host_pool.should_failover(
+                    method,
+                    result=result
+                ):
+                    return candidate_url, result
+
+            log.warning(u'{} failover from {}'.format(
+                self.__class__.__name__,
+                candidate_url
+            ))
+
+    async def _acquire_rate_limit(self, url, deadline=None):
+        waited = 0
+        while True:
+            wait = self._rate_limiter.try_acquire(url, waited, deadline)
+            if wait == 0:
+                return
+
+            await asyncio.sleep(wait)
+            waited += wait
+
+    async def _retry(self, result, method, url, params_dict, **kwargs):
+        """Same as Api._retry, both coroutine and plain function
+        overrides are supported
+        """
+        return result
+
+    async def _prepare_param_dict_async(self, params_dict):
+        """_prepare_param_dict on the event loop, override it when the
+        preparation blocks, like fetching the access token
+        """
+        return self._prepare_param_dict(params_dict)
+
+    async def download(self, api_path, dest=None, method='GET', data=None,
+                       json=None, chunk_size=DOWNLOAD_CHUNK_SIZE,
+                       timeout=None, deadline=None, **params):
+        """Same as Api.download, the body of AsyncStreamResult is read by
+        ``async for`` of iter_content(), or saved by ``await save()``
+        """
+        kwargs = {'deadline': deadline, 'stream': True}
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        if method.upper() != 'GET':
+            kwargs.update(data=data, json=json)
+
+        result = await self.request(
+            method,
+            api_path,
+            params_dict=params,
+            **kwargs
+        )
+        if dest is not None and isinstance(result, AsyncStreamResult):
+            await result.save(dest, chunk_size)
+        return result
+
+    async def upload(self, api_path, files, fields=None, timeout=None,
+                     deadline=None, **params):
+        """Same as Api.upload, the body is rewound when the request is sent
+        again
+        """
+        kwargs = {'deadline': deadline}
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+
+        with MultipartEncoder(fields, files) as encoder:
+            return await self.request(
+                'POST',
+                api_path,
+                params_dict=params,
+                data=encoder,
+                headers={'Content-Type': encoder.content_type},
+                **kwargs
+            )
+
+    async def map(self, calls, max_concurrency=BATCH_MAX_CONCURRENCY):
+        """Same as Api.map, the calls run as coroutines on the event loop,
+        at most max_concurrency of them in flight
+
+        Returns:
+          list of RequestResult in the order of calls
+
+        """
+        calls = [self._build_batch_call(call) for call in calls]
+        if len(calls) == 0:
+            return []
+
+        semaphore = asyncio.Semaphore(max(max_concurrency, 1))
+
+        async def _request(call):
+            args, kwargs = call
+            async with semaphore:
+                try:
+                    return await self.request(*args, **kwargs)
+                except Exception as request_error:
+                    log.warning(u'{} batch call failed: {}'.format(
+                        self.__class__.__name__,
+                        request_error
+                    ))
+                    return build_from_exception(request_error)
+
+        return list(await asyncio.gather(*[_request(call) for call in calls]))
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _build_session(self):
+        # aiohttp session must be created within the running loop
+        return None
+
+    def _init_session(self, headers):
+        self._headers = {}
+        if headers is not None:
+            self._headers.update(headers)
+
+        self._headers.update(DEFAULT_HEADERS)
+
+    async def _get_session(self):
+        loop = asyncio.get_event_loop()
+        session = self._session
+
+        if any([session is None,
+                session is not None and session.closed,
+                self._session_loop is not loop]):
+            stale_session = session
+            connector = self._transport_registry.get_async_connector(
+                loop,
+                ssl_context=self._ssl_context,
+                cert=self._client_cert,
+                limit=self._connection_limit
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                connector_owner=False,
+                headers=self._headers
+            )
+            object.__setattr__(self, '_session', session)
+            self._session_loop = loop
+            if stale_session is not None and not stale_session.closed:
+                # the session of the previous loop, its connector is shared
+                # and left open
+                await stale_session.close()
+
+        return session
+
+    async def _execute_request(self, method, url, params_dict=None, **kwargs):
+        if not tracing.is_enabled():
+            return await self._send_request(
+                method,
+                url,
+                params_dict,
+                **kwargs
+            )
+
+        with tracing.span(u'wechat.execute', {
+            u'http.method': method,
+            u'http.url': url
+        }) as execute_span:
+            result = await self._send_request(
+                method,
+                url,
+                params_dict,
+                **kwargs
+            )
+            execute_span.set_attribute(
+                u'http.status_code',
+                result.status_code
+            )
+            return result
+
+    async def _send_request(self, method, url, params_dict=None, **kwargs):
+        session = await self._get_session()
+        stream = kwargs.pop('stream', False)
+        _encode_json_body(kwargs)
+        encoder = kwargs.get('data')
+        if not isinstance(encoder, MultipartEncoder):
+            encoder = None
+        kwargs['params'] = _build_params(params_dict)
+        timeout = kwargs.get('timeout')
+        deadline = get_deadline(timeout)
+        # retried by the retry policy, or sent to the next host of the host
+        # pool if set
+        max_retries = 0
+        if all([self._retry_policy is None, self._host_pool is None]):
+            max_retries = RETRYS
+
+        attempt = 0
+        while True:
+            backoff = RETRY_BACKOFF_FACTOR * (2 ** attempt)
+            if deadline is not None:
+                deadline.check(url)
+                backoff = min(backoff, deadline.remaining())
+            kwargs['timeout'] = _build_timeout(timeout)
+            if encoder is not None:
+                if not encoder.rewind():
+                    raise RequestException(
+                        u'body of {} can not be rewound to send again'.format(
+                            url
+                        )
+                    )
+                kwargs['data'] = _MultipartPayload(encoder)
+
+            try:
+                resp = await session.request(method, url, **kwargs)
+                if all([
+                    resp.status in RETRY_STATUS_FORCELIST,
+                    max_retries > 0
+                ]):
+                    resp.release()
+                    if attempt < max_retries:
+                        attempt += 1
+                        await asyncio.sleep(backoff)
+                        continue
+
+                    raise RetryError(
+                        u'Max retries exceeded with url: {} '
+                        u'(too many {} error responses)'.format(
+                            url,
+                            resp.status
+                        )
+                    )
+
+                return await self._read_response(resp, stream)
+            except asyncio.TimeoutError:
+                if deadline is not None and deadline.expired:
+                    deadline.check(url)
+                raise Timeout(u'{} {} timed out'.format(method, url))
+            except aiohttp.ClientConnectionError as error:
+                if attempt < max_retries:
+                    attempt += 1
+                    await asyncio.sleep(backoff)
+                    continue
+
+                raise ConnectionError(error)
+
+    async def _read_response(self, resp, stream=False):
+        """
+        Returns:
+          result of the response, the body of AsyncStreamResult is left
+          unread like build_from_stream()
+        """
+        try:
+            if stream and 200 <= resp.status < 300:
+                head = await _read_head(resp)
+                stream_response = _AsyncResponse(resp, None)
+                if not _is_json_body(stream_response, head):
+                    return AsyncStreamResult(stream_response, head)
+                content = head + await resp.read()
+            else:
+                content = await resp.read()
+        except BaseException:
+            resp.close()
+            raise
+        resp.release()
+
+        with tracing.span(u'wechat.parse'):
+            return build_from_response(
+                _AsyncResponse(resp, content),
+                lazy=self._lazy_result
+            )
+
+
+class AsyncMpApi(MpApi, AsyncApi):
+
+    async def _retry(self, result, method, url, params_dict, **kwargs):
+        """
+        When access token expired, update and then retry, the
+        auth_update_callback can be a coroutine function
+
+        """
+        is_auth_expired = all([
+            result.is_failed,
+            result.errcode in AUTH_EXPIRED_CODES
+        ])
+        # the body is rewound only when it is sent again
+        if is_auth_expired and self._rewind_body(kwargs):
+            stale_auth_token = (params_dict or {}).get(
+                self.AUTH_QS_KEY,
+                self._auth_token
+            )
+            new_auth_token = await self._update_auth(
+                result.response,
+                stale_auth_token
+            )
+            if new_auth_token == stale_auth_token:
+                return result
+            else:
+                self._auth_token = new_auth_token
+                params = await self._prepare_param_dict_async(params_dict)
+                return await self._guarded_execute_request(
+                    method,
+                    url,
+                    params_dict=params,
+                    **kwargs
+                )
+        else:
+            return result
+
+    async def _prepare_param_dict_async(self, params_dict):
+        """The token manager fetches the token in the blocking way, which
+        runs in the executor unless the cached token is fresh
+        """
+        if self._token_manager is None:
+            return self._prepare_param_dict(params_dict)
+
+        auth_token = self._token_manager.cached_token()
+        if auth_token is None:
+            auth_token = await asyncio.get_event_loop().run_in_executor(
+                None,
+                self._token_manager.get_token
+            )
+        return self._set_auth_token(params_dict, auth_token)
+
+    async def upload_media(self, media_type, media, **kwargs):
+        """Same as MpApi.upload_media, the media is hashed and the media
+        cache is accessed off the event loop
+        """
+        loop = asyncio.get_event_loop()
+        digest, cached_result = await loop.run_in_executor(
+            None,
+            self._lookup_media_cache,
+            media_type,
+            media
+        )
+        if cached_result is not None:
+            return cached_result
+
+        result = await self.upload(
+            'media/upload',
+            {'media': media},
+            type=media_type,
+            **kwargs
+        )
+        await loop.run_in_executor(
+            None,
+            self._cache_media,
+            media_type,
+            digest,
+            result
+        )
+        return result
+
+    async def _update_auth(self, response, stale_auth_token=None):
+        if self._token_manager is not None:
+            update_func = self._token_manager.refresh
+        elif self._auth_update_callback is not None:
+            update_func = self._auth_update_callback
+        else:
+            return self._auth_token
+
+        try:
+            if self._token_manager is not None:
+                # token manager fetches token in the blocking way
+                new_auth_token = asyncio.get_event_loop().run_in_executor(
+                    None,
+                    update_func,
+                    stale_auth_token
+                )
+            else:
+                new_auth_token = update_func()
+
+            if inspect.isawaitable(new_auth_token):
+                new_auth_token = await new_auth_token
+        except Exception as auth_update_error:
+            raise RequestException(
+                u'Update auth failed use {}'.format(
+                    getattr(update_func, '__name__', update_func)
+                ),
+                auth_update_error,
+                response=response
+            )
+        else:
+            return new_auth_token
+
+
+class AsyncMpOuthApi(MpOuthApi, AsyncApi):
+    pass
+
+
+class AsyncWxpay(Wxpay, AsyncApi):
+
+    def __init__(self, appid, mchid, signkey, client_cert,
+                 client_key, **kwargs):
+        super(AsyncWxpay, self).__init__(
+            appid,
+            mchid,
+            signkey,
+            None,
+            None,
+            **kwargs
+        )
+
+        if client_cert is not None and client_key is not None:
+            self._client_cert = (client_cert, client_key)
+            self._ssl_context = ssl.create_default_context()
+            self._ssl_context.load_cert_chain(client_cert, client_key)
+
+
+if aiohttp is not None:
+    _async_web_auth_api = AsyncApi()
+    _async_web_auth_api._base_url = u'https://api.weixin.qq.com/sns/'
+else:  # pragma: no cover
+    _async_web_auth_api = None
+
+
+class AsyncWebAuth(WebAuth):
+
+    _api = _async_web_auth_api
+
+
+async def get_mp_access_token(appid, secret, **kwargs):
+    """
+    Raises:
+      RequestException
+    """
+
+    async with AsyncMpOuthApi(appid, secret, **kwargs) as api:
+        return await api.get('/token', grant_type='client_credential')
+
+
+def formp(mp_access_token=None, **kwargs):
+    return AsyncMpApi(mp_access_token, **kwargs)
+
+
+def for_merchant(appid, mchid, signkey,
+                 client_cert=None, client_key=None, **kwargs):
+    return AsyncWxpay(appid, mchid, signkey, client_cert, client_key, **kwargs)
+
+
+web_auth = AsyncWebAuth
@@ -2,37 +2,127 @@
 
 
 import re
+import time
 import logging
-
-from urllib3.util.retry import Retry
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 import requests
-from requests.adapters import HTTPAdapter
+from six import iteritems
+from urllib3.util.retry import Retry
 
-from .result import build_from_response
-from .compat import bytes
-from .settings import (DEFAULT_HEADERS, TIMEOUT, RETRYS,
-                       RETRY_BACKOFF_FACTOR, RETRY_STATUS_FORCELIST)
+from .result import (build_from_response, build_from_exception,
+                     build_from_stream, StreamResult)
+from .utils import ApiPathRules
+from .multipart import MultipartEncoder
+from .compat import json, bytes
+from .exceptions import (RequestException, DeadlineExceeded,
+                         RateLimitExceeded, is_timeout_error)
+from .deadline import Deadline, DeadlineTimeout, DeadlineRetry, get_deadline
+from .settings import (DEFAULT_HEADERS, TIMEOUT, BATCH_MAX_CONCURRENCY,
+                       DOWNLOAD_CHUNK_SIZE, HEDGE_MAX_WORKERS)
+from . import transport
+from . import singleflight
+from . import metrics
+from . import tracing
+from . import jsonbackend
 
 
 log = logging.getLogger(__name__)
 
 
-def _build_retry_session(session=None):
+def _build_retry_session(session=None, transport_registry=None):
+    """the retry policy is set on the shared adapters of transport
+    registry, which keeps the connection pools for all the sessions
+    """
     session = session or requests.Session()
-    retry = Retry(
-        total=RETRYS,
-        read=RETRYS,
-        connect=RETRYS,
-        backoff_factor=RETRY_BACKOFF_FACTOR,
-        status_forcelist=RETRY_STATUS_FORCELIST,
-    )
+    registry = transport_registry or transport.default_registry
+    return registry.mount(session)
+
+
+_hedge_slots = threading.BoundedSemaphore(HEDGE_MAX_WORKERS)
+_hedge_executor_lock = threading.Lock()
+_hedge_executor = None
+
+
+def _get_hedge_executor():
+    global _hedge_executor
+    with _hedge_executor_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(
+                max_workers=HEDGE_MAX_WORKERS
+            )
+        return _hedge_executor
+
+
+def _start_attempt(func):
+    """run func on the shared executor of the hedged attempts, there is a
+    free worker for every slot, so the attempt never waits in the queue
+
+    Returns:
+      Future, None if all the workers are busy
+
+    """
+    if not _hedge_slots.acquire(False):
+        return None
+
+    try:
+        future = _get_hedge_executor().submit(tracing.wrap(func))
+    except Exception:
+        _hedge_slots.release()
+        raise
+
+    future.add_done_callback(lambda f: _hedge_slots.release())
+    return future
+
+
+def _close_result(attempt):
+    if attempt.cancelled() or attempt.exception() is not None:
+        return
+
+    response = attempt.result().response
+    if response is not None:
+        response.close()
+
+
+def _discard_attempt(attempt):
+    """cancel the lost attempt, or close its response when it finishes"""
+    if not attempt.cancel():
+        attempt.add_done_callback(_close_result)
+
+
+def _flight_timeout(timeout):
+    """
+    Returns:
+      seconds the coalesced caller waits for the call in flight, bounded by
+      its own deadline or timeout, None if the request has no timeout
+
+    """
+    deadline = get_deadline(timeout)
+    if deadline is not None:
+        return deadline.remaining()
+
+    if isinstance(timeout, tuple):
+        if None in timeout:
+            return None
+        return sum(timeout)
+
+    return timeout
 
-    adapter = HTTPAdapter()
-    adapter.max_retries = retry
-    session.mount('http://', adapter)
-    session.mount('https://', adapter)
-    return session
+
+def _encode_json_body(kwargs):
+    """Encode the json body to bytes by the json backend, instead of the
+    json of requests
+    """
+    body = kwargs.pop('json', None)
+    if any([body is None, kwargs.get('data') is not None]):
+        return
+
+    kwargs['data'] = jsonbackend.dumps_bytes(body)
+    headers = dict(kwargs.get('headers') or {})
+    if not any(key.lower() == 'content-type' for key in headers):
+        headers['Content-Type'] = 'application/json'
+    kwargs['headers'] = headers
 
 
 class Api(object):
@@ -41,14 +131,39 @@ class Api(object):
 
     API_BASE_URL = u'https://api.weixin.qq.com/cgi-bin'
 
+    # params excluded from the response cache key
+    AUTH_PARAM_KEYS = frozenset(['access_token', 'secret'])
+
     def __init__(self, root_path=u'/', headers=DEFAULT_HEADERS,
-                 timeout=TIMEOUT, **kwargs):
+                 timeout=TIMEOUT, transport_registry=None, rate_limiter=None,
+                 response_cache=None, coalesce=None, host_pool=None,
+                 circuit_breaker=None, deadline=None, adaptive_timeout=None,
+                 retry_policy=None, lazy_result=False, **kwargs):
         self._base_url = self.API_BASE_URL + u''
         self._base_url = self._prepare_api_url(root_path)
         self._timeout = timeout
+        self._rate_limiter = rate_limiter
+        self._response_cache = response_cache
+        self._host_pool = host_pool
+        self._circuit_breaker = circuit_breaker
+        self._deadline = deadline
+        self._adaptive_timeout = adaptive_timeout
+        self._retry_policy = retry_policy
+        self._lazy_result = lazy_result
+        self._flight = singleflight.default_flight
+        if coalesce is None or coalesce is False or coalesce is True:
+            self._coalesce_rules = coalesce or None
+        else:
+            self._coalesce_rules = ApiPathRules(
+                dict((api_path, True) for api_path in coalesce)
+            )
+        self._transport_registry = (
+            transport_registry or transport.default_registry
+        )
 
-        object.__setattr__(self, '_session', _build_retry_session())
+        object.__setattr__(self, '_session', self._build_session())
         self._init_session(headers)
+        self._instance_scope = object()
 
     def __setattr__(self, key, value):
         if key in self.IMMUTABLE_FIELDS:
@@ -58,41 +173,401 @@ class Api(object):
 
     def request(self, method, api_path, params_dict=None, **kwargs):
         """
+        Args:
+          coalesce_key: identity of the request for coalescing, default is
+            built from method, url, params and body
+          deadline: seconds of the whole call including all the retries,
+            default is the deadline of Api
+
         Raises:
           RequestException
+          RateLimitExceeded
+          DeadlineExceeded
 
         """
-        kwargs.setdefault('timeout', self._timeout)
-        kwargs.setdefault('allow_redirects', False)
-
+        coalesce_key = kwargs.pop('coalesce_key', None)
         url = self._prepare_api_url(api_path)
+        self._prepare_request_options(url, kwargs)
         params_dict = self._prepare_param_dict(params_dict)
 
-        result = self._execute_request(
+        cache_key, cache_ttl = self._lookup_cache_key(
             method,
             url,
-            params_dict=params_dict,
-            **kwargs
+            params_dict,
+            kwargs
         )
+        if cache_key is not None:
+            cached_result = self._response_cache.get(cache_key)
+            if cached_result is not None:
+                return cached_result
 
-        if result.is_failed:
-            retry_result = self._retry(
-                result,
+        flight_key = self._lookup_flight_key(
+            method,
+            url,
+            params_dict,
+            kwargs,
+            coalesce_key
+        )
+        start = time.time()
+        with tracing.span(u'wechat.request', {
+            u'http.method': method,
+            u'http.url': url
+        }) as request_span:
+            try:
+                if flight_key is None:
+                    result = self._send(method, url, params_dict, **kwargs)
+                else:
+                    result = self._flight.do(
+                        flight_key,
+                        lambda: self._send(method, url, params_dict, **kwargs),
+                        _flight_timeout(kwargs.get('timeout'))
+                    )
+            except RequestException as request_error:
+                metrics.observe_request(
+                    method,
+                    url,
+                    time.time() - start,
+                    error=request_error
+                )
+                raise
+            metrics.observe_request(method, url, time.time() - start, result)
+            if result.is_failed:
+                request_span.set_attribute(u'wechat.errcode', result.errcode)
+
+        if cache_key is not None:
+            self._response_cache.set(cache_key, result, cache_ttl)
+
+        return result
+
+    def _prepare_request_options(self, url, kwargs):
+        deadline = kwargs.pop('deadline', None) or self._deadline
+        if 'timeout' not in kwargs and self._adaptive_timeout is not None:
+            kwargs['timeout'] = self._adaptive_timeout.timeout_for(
+                url,
+                self._timeout
+            )
+        kwargs.setdefault('timeout', self._timeout)
+        kwargs.setdefault('allow_redirects', False)
+        if deadline is not None:
+            if not isinstance(deadline, Deadline):
+                deadline = Deadline(deadline)
+            # every attempt gets the remaining budget from the timeout
+            kwargs['timeout'] = DeadlineTimeout(deadline, kwargs['timeout'])
+
+    def _send(self, method, url, params_dict, **kwargs):
+        policy = self._retry_policy
+        if policy is None:
+            return self._send_once(method, url, params_dict, **kwargs)
+
+        policy.record_request()
+        retries = 0
+        while True:
+            error = result = None
+            try:
+                result = self._send_once(method, url, params_dict, **kwargs)
+            except RequestException as request_error:
+                error = request_error
+
+            if not policy.should_retry(
+                method,
+                url,
+                retries,
+                error=error,
+                result=result
+            ):
+                if error is not None:
+                    raise error
+                return result
+
+            metrics.observe_retry(url, u'policy')
+            time.sleep(self._retry_backoff(retries, kwargs.get('timeout')))
+            retries += 1
+
+    def _retry_backoff(self, retries, timeout):
+        backoff = self._retry_policy.backoff(retries)
+        deadline = get_deadline(timeout)
+        if deadline is not None:
+            backoff = min(backoff, deadline.remaining())
+
+        log.info(u'{} retry #{} after {:.3f}s'.format(
+            self.__class__.__name__,
+            retries + 1,
+            backoff
+        ))
+        return backoff
+
+    def _send_once(self, method, url, params_dict, **kwargs):
+        if self._rate_limiter is not None:
+            self._rate_limiter.acquire(
+                url,
+                get_deadline(kwargs.get('timeout'))
+            )
+
+        if self._host_pool is None:
+            result = self._guarded_execute_request(
+                method,
+                url,
+                params_dict=params_dict,
+                **kwargs
+            )
+        else:
+            url, result = self._execute_with_failover(
                 method,
                 url,
                 params_dict,
                 **kwargs
             )
+
+        if result.is_failed:
+            with tracing.span(u'wechat.retry', {
+                u'wechat.errcode': result.errcode
+            }):
+                retry_result = self._retry(
+                    result,
+                    method,
+                    url,
+                    params_dict,
+                    **kwargs
+                )
             if retry_result is None:
                 log.warn(u'{} retry result is None'.format(
                     self.__class__.__name__)
                 )
                 retry_result = result
+            elif retry_result is not result:
+                metrics.observe_retry(url, u'hook')
 
             return retry_result
         else:
             return result
 
+    def _guarded_execute_request(self, method, url, params_dict=None,
+                                 **kwargs):
+        """_execute_request guarded by the circuit breaker
+
+        Raises:
+          CircuitOpenError
+          DeadlineExceeded
+          RequestException: the body was read and can not be sent again
+
+        """
+        deadline = get_deadline(kwargs.get('timeout'))
+        if deadline is not None:
+            deadline.check(url)
+
+        if not self._rewind_body(kwargs):
+            raise RequestException(
+                u'body of {} can not be rewound to send again'.format(url)
+            )
+
+        return self._execute_observed(
+            method,
+            url,
+            params_dict=params_dict,
+            **kwargs
+        )
+
+    def _execute_attempt(self, execute, method, url, params_dict=None,
+                         **kwargs):
+        """One attempt of execute, every attempt (the hedged ones too) is
+        counted by the circuit breaker
+        """
+        if self._circuit_breaker is None:
+            return execute(method, url, params_dict=params_dict, **kwargs)
+
+        breaker = self._circuit_breaker
+        breaker.before_request(url)
+        try:
+            result = execute(method, url, params_dict=params_dict, **kwargs)
+        except Exception as request_error:
+            breaker.record(url, breaker.is_failure(error=request_error))
+            raise
+        else:
+            breaker.record(url, breaker.is_failure(result=result))
+            return result
+
+    def _execute_observed(self, method, url, params_dict=None, **kwargs):
+        """_execute_request observed by the adaptive timeout, the GET is
+        hedged if enabled, the hedge takes the rate limit too
+        """
+        if self._adaptive_timeout is None:
+            return self._execute_attempt(
+                self._execute_request,
+                method,
+                url,
+                params_dict=params_dict,
+                **kwargs
+            )
+
+        hedge_delay = None
+        if method.upper() == 'GET' and not kwargs.get('stream'):
+            # the body of the hedged stream would be left unread
+            hedge_delay = self._adaptive_timeout.hedge_delay(url)
+
+        def _attempt():
+            return self._execute_attempt(
+                self._execute_timed,
+                method,
+                url,
+                params_dict=params_dict,
+                **kwargs
+            )
+
+        def _hedge():
+            if self._rate_limiter is not None:
+                if self._rate_limiter.try_acquire(url) > 0:
+                    raise RateLimitExceeded(
+                        u'no rate limit budget to hedge {}'.format(url)
+                    )
+            return _attempt()
+
+        if hedge_delay is None:
+            return _attempt()
+
+        primary = _start_attempt(_attempt)
+        if primary is None:
+            log.debug(u'{} all hedge workers busy, {} not hedged'.format(
+                self.__class__.__name__,
+                url
+            ))
+            return _attempt()
+
+        attempts = [primary]
+        if not wait(attempts, timeout=hedge_delay).done:
+            hedge = _start_attempt(_hedge)
+            if hedge is not None:
+                log.debug(u'{} hedge {} after {:.3f}s'.format(
+                    self.__class__.__name__,
+                    url,
+                    hedge_delay
+                ))
+                attempts.append(hedge)
+
+        # first answer wins, fail only when all the attempts failed
+        pending = attempts
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for attempt in done:
+                if attempt.exception() is None:
+                    for lost_attempt in attempts:
+                        if lost_attempt is not attempt:
+                            _discard_attempt(lost_attempt)
+                    return attempt.result()
+
+        return attempts[0].result()
+
+    def _execute_timed(self, method, url, params_dict=None, **kwargs):
+        start = time.time()
+        try:
+            result = self._execute_request(
+                method,
+                url,
+                params_dict=params_dict,
+                **kwargs
+            )
+        except RequestException as request_error:
+            if is_timeout_error(request_error):
+                # latency of the timed out request is at least the elapsed
+                self._adaptive_timeout.observe(url, time.time() - start)
+            raise
+
+        self._adaptive_timeout.observe(url, time.time() - start)
+        return result
+
+    def _execute_with_failover(self, method, url, params_dict, **kwargs):
+        """Send the request to the hosts of host pool, healthiest first,
+        until one does not need failover
+
+        Returns:
+          tuple of (the url sent, RequestResult)
+
+        """
+        candidate_urls = self._host_pool.candidates(url)
+        for index, candidate_url in enumerate(candidate_urls):
+            is_last = index == len(candidate_urls) - 1
+            start = time.time()
+            try:
+                result = self._guarded_execute_request(
+                    method,
+                    candidate_url,
+                    params_dict=params_dict,
+                    **kwargs
+                )
+            except RequestException as request_error:
+                self._host_pool.report(candidate_url, error=request_error)
+                if is_last or not self._host_pool.should_failover(
+                    method,
+                    error=request_error
+                ):
+                    raise
+            else:
+                self._host_pool.report(
+                    candidate_url,
+                    latency=time.time() - start,
+                    result=result
+                )
+                if is_last or not self._host_pool.should_failover(
+                    method,
+                    result=result
+                ):
+                    return candidate_url, result
+
+            log.warning(u'{} failover from {}'.format(
+                self.__class__.__name__,
+                candidate_url
+            ))
+
+    @staticmethod
+    def _rewind_body(kwargs):
+        """
+        Returns:
+          False if the streaming body was read and can not be rewound
+        """
+        body = kwargs.get('data')
+        if isinstance(body, MultipartEncoder):
+            return body.rewind()
+        return True
+
+    def _lookup_cache_key(self, method, url, params_dict, kwargs):
+        """
+        Returns:
+          tuple of (cache key, ttl), (None, None) if the request is not
+          cacheable, only GET without body and with ttl is cacheable
+
+        """
+        if any([
+            self._response_cache is None,
+            method.upper() != 'GET',
+            kwargs.get('stream')
+        ]):
+            return None, None
+
+        if kwargs.get('data') is not None or kwargs.get('json') is not None:
+            return None, None
+
+        ttl = self._response_cache.ttl_for(url)
+        if ttl is None:
+            return None, None
+
+        cache_key = self._response_cache.build_key(
+            method,
+            url,
+            params_dict,
+            exclude=self.AUTH_PARAM_KEYS,
+            scope=self._cache_scope()
+        )
+        return cache_key, ttl
+
+    def _cache_scope(self):
+        """
+        Returns:
+          identity of the account in the response cache key, the Api
+          instance itself by default, sub class returns the appid so that
+          the Api of the same appid share the cached results
+
+        """
+        return self._instance_scope
+
     def _retry(self, result, method, url, params_dict, **kwargs):
         """Override this function to check Api result and decide
         whether to retry.
@@ -113,13 +588,12 @@ class Api(object):
         """
         return params_dict
 
-    def get(self, api_path, timeout=None, **params):
-        return self.request(
-            'GET',
-            api_path,
-            params_dict=params,
-            timeout=timeout or self._timeout
-        )
+    def get(self, api_path, timeout=None, deadline=None, **params):
+        kwargs = {'deadline': deadline}
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+
+        return self.request('GET', api_path, params_dict=params, **kwargs)
 
     def post(self, api_path, data=None, json=None, **params):
         return self.request(
@@ -130,10 +604,161 @@ class Api(object):
             **params
         )
 
+    def download(self, api_path, dest=None, method='GET', data=None,
+                 json=None, chunk_size=DOWNLOAD_CHUNK_SIZE, timeout=None,
+                 deadline=None, **params):
+        """Download the media like media/get and material/get_material
+        without buffering the whole body in memory
+
+        Args:
+          dest: file path or file object to write the body to, None to read
+            the body by iter_content() of the result
+          method: GET for media/get, POST for material/get_material
+          chunk_size: bytes of the chunks written to dest
+
+        Returns:
+          StreamResult, read to the end if dest is set. RequestResult if
+          the api answered JSON, like the error with errcode
+
+        Raises:
+          RequestException
+
+        """
+        kwargs = {'deadline': deadline, 'stream': True}
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        if method.upper() != 'GET':
+            kwargs.update(data=data, json=json)
+
+        result = self.request(method, api_path, params_dict=params, **kwargs)
+        if dest is not None and isinstance(result, StreamResult):
+            result.save(dest, chunk_size)
+        return result
+
+    def upload(self, api_path, files, fields=None, timeout=None,
+               deadline=None, **params):
+        """Upload the files in the streaming multipart/form-data body, the
+        files are read while sending, see MultipartEncoder
+
+        Args:
+          files: dict or list of (name, file), file is the path (mmap), file
+            object, bytes, or tuple of (filename, source[, content_type[,
+            length]]), length is required by the iterable source
+          fields: dict or list of (name, value) of the form fields
+
+        Raises:
+          RequestException
+
+        """
+        kwargs = {'deadline': deadline}
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+
+        with MultipartEncoder(fields, files) as encoder:
+            return self.request(
+                'POST',
+                api_path,
+                params_dict=params,
+                data=encoder,
+                headers={'Content-Type': encoder.content_type},
+                **kwargs
+            )
+
+    def map(self, calls, max_concurrency=BATCH_MAX_CONCURRENCY):
+        """Run the calls concurrently on a bounded thread pool, each call
+        goes through request(), so the _retry hook still works
+
+        Args:
+          calls: iterable of call, call is tuple like (method, api_path),
+            (method, api_path, params_dict) or
+            (method, api_path, params_dict, kwargs), or dict of request()
+            keyword arguments
+          max_concurrency: max count of calls in flight
+
+        Returns:
+          list of RequestResult in the order of calls, the call raised error
+          gets a failed RequestExceptionResult instead of aborting the batch
+
+        """
+        calls = [self._build_batch_call(call) for call in calls]
+        if len(calls) == 0:
+            return []
+
+        def _request(call):
+            args, kwargs = call
+            try:
+                return self.request(*args, **kwargs)
+            except Exception as request_error:
+                log.warning(u'{} batch call failed: {}'.format(
+                    self.__class__.__name__,
+                    request_error
+                ))
+                return build_from_exception(request_error)
+
+        max_workers = max(min(max_concurrency, len(calls)), 1)
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            return list(executor.map(_request, calls))
+        finally:
+            executor.shutdown(wait=True)
+
+    @staticmethod
+    def _build_batch_call(call):
+        if isinstance(call, dict):
+            kwargs = dict(call)
+            args = (kwargs.pop('method'), kwargs.pop('api_path'))
+            return args, kwargs
+
+        if len(call) not in (2, 3, 4):
+            raise ValueError('invalid batch call: {}'.format(call))
+
+        method, api_path = call[0], call[1]
+        kwargs = dict(call[3]) if len(call) == 4 else {}
+        if len(call) >= 3:
+            kwargs['params_dict'] = call[2]
+        return (method, api_path), kwargs
+
+    def _lookup_flight_key(self, method, url, params_dict, kwargs,
+                           coalesce_key=None):
+        """
+        Returns:
+          key of the in-flight request to share, None if not coalesced,
+          coalesce=True coalesces all GET, a list of api paths coalesces
+          those api with any method
+
+        """
+        if self._coalesce_rules is None or kwargs.get('stream'):
+            return None
+
+        if self._coalesce_rules is True:
+            if method.upper() != 'GET':
+                return None
+        elif not self._coalesce_rules.match(url, False):
+            return None
+
+        if coalesce_key is not None:
+            return method.upper(), url, coalesce_key
+
+        body = kwargs.get('data')
+        if kwargs.get('json') is not None:
+            body = json.dumps(kwargs['json'], sort_keys=True)
+        elif isinstance(body, dict):
+            body = tuple(sorted(iteritems(body)))
+
+        params = tuple(sorted(
+            (k, u'{}'.format(v)) for k, v in iteritems(params_dict or {})
+        ))
+        return method.upper(), url, params, body
+
     @property
     def session(self):
         return self._session
 
+    def _build_session(self):
+        return _build_retry_session(
+            transport_registry=self._transport_registry
+        )
+
     def _init_session(self, headers):
         if headers is not None:
             self._session.headers.update(headers)
@@ -152,11 +777,91 @@ class Api(object):
         return re.sub('(?<!:)//[/]?', '/', uri)
 
     def _execute_request(self, method, url, params_dict=None, **kwargs):
-        response = self._session.request(
-            method,
-            url,
-            params=params_dict,
-            **kwargs
-        )
+        if not tracing.is_enabled():
+            return self._build_result(
+                self._send_request(method, url, params_dict, **kwargs),
+                kwargs.get('stream')
+            )
+
+        with tracing.span(u'wechat.execute', {
+            u'http.method': method,
+            u'http.url': url
+        }) as execute_span:
+            with transport.record_phases() as phases:
+                response = self._send_request(
+                    method,
+                    url,
+                    params_dict,
+                    **kwargs
+                )
+            execute_span.set_attribute(
+                u'http.status_code',
+                response.status_code
+            )
+
+            start = time.time()
+            with tracing.span(u'wechat.parse'):
+                result = self._build_result(response, kwargs.get('stream'))
+            phases['parse'] = time.time() - start
+
+            for phase, seconds in iteritems(phases):
+                execute_span.set_attribute(
+                    u'wechat.phase.{}'.format(phase),
+                    seconds
+                )
+            return result
+
+    def _build_result(self, response, stream=False):
+        if stream:
+            return build_from_stream(response)
+
+        return build_from_response(response, lazy=self._lazy_result)
+
+    def _send_request(self, method, url, params_dict, **kwargs):
+        """
+        Returns:
+          requests.Response
+        """
+        _encode_json_body(kwargs)
+        deadline = get_deadline(kwargs.get('timeout'))
+        transport_retry = self._build_transport_retry(deadline)
+        if transport_retry is None:
+            return self._session.request(
+                method,
+                url,
+                params=params_dict,
+                **kwargs
+            )
+
+        try:
+            with transport.override_retry(transport_retry):
+                return self._session.request(
+                    method,
+                    url,
+                    params=params_dict,
+                    **kwargs
+                )
+        except RequestException as request_error:
+            if deadline is None or not deadline.expired:
+                raise
+            raise DeadlineExceeded(
+                u'deadline {}s exceeded: {}'.format(deadline.budget, url),
+                request_error,
+                response=getattr(request_error, 'response', None)
+            )
+
+    def _build_transport_retry(self, deadline):
+        """
+        Returns:
+          urllib3 Retry of this request, None to use the one of adapters
+
+        """
+        if any([self._retry_policy is not None, self._host_pool is not None]):
+            # retried by the retry policy, or sent to the next host of the
+            # host pool instead of the same one
+            return Retry(0, read=False)
+
+        if deadline is not None:
+            return DeadlineRetry.for_deadline(deadline)
 
-        return build_from_response(response)
+        return None
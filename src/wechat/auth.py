@@ -14,6 +14,8 @@ class MpOuthApi(Api):
 
     IMMUTABLE_FIELDS = frozenset(['_appid', '_secret'])
 
+    AUTH_PARAM_KEYS = frozenset(['secret'])
+
     def __init__(self, appid, secret, **kwargs):
         if appid is None or secret is None:
             raise ValueError('appid or secret')
@@ -23,6 +25,9 @@ class MpOuthApi(Api):
 
         super(MpOuthApi, self).__init__(**kwargs)
 
+    def _cache_scope(self):
+        return self._appid
+
     def _prepare_param_dict(self, params_dict):
         complete_params = {
             "appid": self._appid,
@@ -32,10 +37,16 @@ class MpOuthApi(Api):
         return complete_params
 
     def _retry(self, result, method, url, params_dict, **kwargs):
-        if result.errcode != -1:
+        # errcode -1 is retried by the retry policy if set
+        if result.errcode != -1 or self._retry_policy is not None:
             return
 
-        return self._execute_request(method, url, params_dict, **kwargs)
+        return self._guarded_execute_request(
+            method,
+            url,
+            params_dict,
+            **kwargs
+        )
 
 
 def get_mp_access_token(appid, secret, **kwargs):
@@ -56,6 +67,8 @@ class WebAuth(object):
     SCOPE_SNSAPI_BASE = 'snsapi_base'
     SCOPE_SNSAPI_USERINFO = 'snsapi_userinfo'
 
+    _api = _web_auth_api
+
     def __init__(self):
         raise NotImplementedError()
 
@@ -87,7 +100,7 @@ class WebAuth(object):
 
     @classmethod
     def get_access_token(cls, appid, secret, code):
-        return _web_auth_api.get(
+        return cls._api.get(
             u'oauth2/access_token',
             appid=appid,
             secret=secret,
@@ -97,7 +110,7 @@ class WebAuth(object):
 
     @classmethod
     def refresh_access_token(cls, appid, refresh_token):
-        return _web_auth_api.get(
+        return cls._api.get(
             u'oauth2/refresh_token',
             appid=appid,
             refresh_token=refresh_token,
@@ -106,7 +119,7 @@ class WebAuth(object):
 
     @classmethod
     def get_user_info(cls, openid, access_token, lang='zh_CN'):
-        return _web_auth_api.get(
+        return cls._api.get(
             u'userinfo',
             openid=openid,
             access_token=access_token,
@@ -0,0 +1,171 @@
+# -*- encoding: utf-8
+
+"""
+Response cache for the idempotent GET api whose data changes slowly, like
+getcallbackip, menu/get and tags/get.
+
+Usage:
+
+.. code-block:: python
+
+    >>>from wechat import mpapi, cache
+    >>>response_cache = cache.ResponseCache(
+    ...     ttls={'getcallbackip': 3600, 'menu/get': 60},
+    ...     name='your appid',
+    ... )
+    >>>mp = mpapi.formp(access_token, response_cache=response_cache)
+    >>>mp.get('getcallbackip')  # request
+    >>>mp.get('getcallbackip')  # cached
+    >>>response_cache.stats()
+    {'hits': 1, 'misses': 1, 'evictions': 0, 'entries': 1, 'bytes': 64}
+
+Only the api paths with ttl are cached, the key is built from method, url
+and params without auth params (like access_token), so the cached results
+survive token refreshes. The key includes the account of the Api too (the
+appid, or the Api instance if the appid is unknown), so the Api of different
+appids never get the results of each other from one shared cache.
+
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+from six import iteritems
+
+from .utils import ApiPathRules
+from .settings import RESPONSE_CACHE_MAX_BYTES
+
+
+__all__ = ['ResponseCache']
+
+
+class ResponseCache(object):
+    """LRU cache of RequestResult, bounded by the total size of response text
+
+    Args:
+      ttls: dict of api path and ttl seconds, api path is matched with the
+        tail of request url
+      default_ttl: ttl seconds of the api paths not in ttls, None to not
+        cache them
+      max_bytes: max total size of cached response text
+      max_entries: max count of cached results, None for no limit
+      name: cache name, usually the appid, which is part of cache key
+
+    """
+
+    def __init__(self, ttls=None, default_ttl=None,
+                 max_bytes=RESPONSE_CACHE_MAX_BYTES, max_entries=None,
+                 name=u''):
+        self._ttls = ApiPathRules(ttls)
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def ttl_for(self, url):
+        """
+        Returns:
+          ttl seconds of the url, None if not cacheable
+
+        """
+        return self._ttls.match(url, self.default_ttl)
+
+    def build_key(self, method, url, params_dict=None, exclude=(),
+                  scope=None):
+        """
+        Args:
+          exclude: keys of params_dict not in the key, like access_token
+          scope: identity of the account sending the request, like the
+            appid, the results are shared by the same scope only
+
+        """
+        params = tuple(sorted(
+            (k, u'{}'.format(v))
+            for k, v in iteritems(params_dict or {})
+            if k not in exclude
+        ))
+        return self.name, scope, method.upper(), url, params
+
+    def get(self, key):
+        """
+        Returns:
+          the cached RequestResult, None if missed or expired
+
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= now:
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                self._misses += 1
+                return None
+
+            self._hits += 1
+            self._entries[key] = self._entries.pop(key)
+            return entry[0]
+
+    def set(self, key, result, ttl):
+        if result.is_failed or ttl is None or ttl <= 0:
+            return False
+
+        size = self._size_of(result)
+        if size > self.max_bytes:
+            return False
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (result, time.time() + ttl, size)
+            self._bytes += size
+
+            while self._is_full():
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self._evictions += 1
+
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _is_full(self):
+        if self._bytes > self.max_bytes:
+            return True
+
+        return all([
+            self.max_entries is not None,
+            len(self._entries) > (self.max_entries or 0)
+        ])
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    @staticmethod
+    def _size_of(result):
+        text = result.text
+        return len(text) if text is not None else 0
@@ -0,0 +1,187 @@
+# -*- encoding: utf-8
+
+"""
+Per host circuit breaker, when wechat degrades the calls fail fast with
+CircuitOpenError instead of waiting for TIMEOUT x RETRYS each, so the worker
+threads are not tied up.
+
+States of a host:
+
+* closed: calls pass, ``failure_threshold`` consecutive failures open it
+* open: calls fail fast, after ``cool_down`` seconds it becomes half-open
+* half-open: ``half_open_max_calls`` probe calls pass, a success closes it
+  and a failure opens it again
+
+A failure is a transport error (timeout, connection error, retries
+exhausted) or a 5xx response, the api errcode is not a failure.
+
+Usage:
+
+.. code-block:: python
+
+    >>>from wechat import mpapi, circuitbreaker
+    >>>def on_state_change(host, old_state, new_state):
+    ...    log.warning('%s circuit %s -> %s', host, old_state, new_state)
+    >>>breaker = circuitbreaker.CircuitBreaker(
+    ...     failure_threshold=5,
+    ...     cool_down=30,
+    ...     on_state_change=on_state_change
+    ... )
+    >>>mp = mpapi.formp(access_token, circuit_breaker=breaker)
+
+"""
+
+import time
+import logging
+import threading
+
+from .utils import url_host
+from .exceptions import CircuitOpenError
+from .settings import (CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_COOL_DOWN,
+                       CIRCUIT_HALF_OPEN_MAX_CALLS)
+
+
+__all__ = ['CircuitBreaker', 'CLOSED', 'OPEN', 'HALF_OPEN']
+
+
+log = logging.getLogger(__name__)
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class _Circuit(object):
+
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.probes = 0
+
+
+class CircuitBreaker(object):
+    """
+    Args:
+      failure_threshold: consecutive failures to open the circuit
+      cool_down: seconds the circuit keeps open before half-open
+      half_open_max_calls: max probe calls in flight when half-open
+      on_state_change: callable(host, old_state, new_state), called on
+        every state change
+
+    """
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+                 cool_down=CIRCUIT_COOL_DOWN,
+                 half_open_max_calls=CIRCUIT_HALF_OPEN_MAX_CALLS,
+                 on_state_change=None):
+        if failure_threshold < 1:
+            raise ValueError('failure_threshold must >= 1')
+
+        self.failure_threshold = failure_threshold
+        self.cool_down = cool_down
+        self.half_open_max_calls = half_open_max_calls
+        self.on_state_change = on_state_change
+
+        self._lock = threading.Lock()
+        self._circuits = {}
+
+    def before_request(self, url):
+        """
+        Raises:
+          CircuitOpenError: the circuit of url host is open, or half-open
+            with enough probes in flight
+
+        """
+        host = url_host(url)
+        changes = []
+        with self._lock:
+            circuit = self._circuits.setdefault(host, _Circuit())
+            if circuit.state == OPEN:
+                if time.time() - circuit.opened_at < self.cool_down:
+                    raise CircuitOpenError(
+                        u'circuit of {} is open'.format(host)
+                    )
+                self._transit(host, circuit, HALF_OPEN, changes)
+
+            if circuit.state == HALF_OPEN:
+                if circuit.probes >= self.half_open_max_calls:
+                    raise CircuitOpenError(
+                        u'circuit of {} is half open'.format(host)
+                    )
+                circuit.probes += 1
+
+        self._notify(changes)
+
+    def record(self, url, failed):
+        """Record the outcome of the request allowed by before_request"""
+        host = url_host(url)
+        changes = []
+        with self._lock:
+            circuit = self._circuits.setdefault(host, _Circuit())
+            if circuit.state == HALF_OPEN:
+                circuit.probes = max(circuit.probes - 1, 0)
+
+            if not failed:
+                circuit.failures = 0
+                if circuit.state != CLOSED:
+                    self._transit(host, circuit, CLOSED, changes)
+            else:
+                circuit.failures += 1
+                if circuit.state == HALF_OPEN or all([
+                    circuit.state == CLOSED,
+                    circuit.failures >= self.failure_threshold
+                ]):
+                    circuit.opened_at = time.time()
+                    self._transit(host, circuit, OPEN, changes)
+
+        self._notify(changes)
+
+    def is_failure(self, error=None, result=None):
+        if error is not None:
+            return True
+
+        status_code = getattr(result, 'status_code', None)
+        return status_code is not None and status_code >= 500
+
+    def state(self, url):
+        with self._lock:
+            circuit = self._circuits.get(url_host(url))
+            return circuit.state if circuit is not None else CLOSED
+
+    def states(self):
+        """
+        Returns:
+          dict of host and its state, failures
+        """
+        with self._lock:
+            return dict(
+                (host, {'state': circuit.state, 'failures': circuit.failures})
+                for host, circuit in self._circuits.items()
+            )
+
+    def reset(self):
+        with self._lock:
+            self._circuits.clear()
+
+    def _transit(self, host, circuit, new_state, changes):
+        changes.append((host, circuit.state, new_state))
+        circuit.state = new_state
+        circuit.probes = 0
+
+    def _notify(self, changes):
+        for host, old_state, new_state in changes:
+            log.warning(u'circuit of {} {} -> {}'.format(
+                host,
+                old_state,
+                new_state
+            ))
+            if self.on_state_change is None:
+                continue
+
+            try:
+                self.on_state_change(host, old_state, new_state)
+            except Exception:
+                log.warning(u'circuit state change hook failed',
+                            exc_info=True)
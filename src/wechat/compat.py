@@ -26,6 +26,7 @@ if is_py2:
     range = xrange
     unicode = unicode
     from urllib import quote as url_quote
+    from urlparse import urlparse
 
 elif is_py3:
     if JSONDecodeError is None:
@@ -33,7 +34,7 @@ elif is_py3:
 
     range = range
     unicode = str
-    from urllib.parse import quote as url_quote
+    from urllib.parse import quote as url_quote, urlparse
 
 
 from requests.compat import bytes, str, basestring
\ No newline at end of file
@@ -0,0 +1,155 @@
+# -*- encoding: utf-8
+
+"""
+End-to-end deadline of one logical call, which bounds the total latency of
+all the attempts: the urllib3 retries, the ``_retry`` hooks (like retry
+after the access token refreshed) and the host failover.
+
+.. code-block:: python
+
+    >>>mp = mpapi.formp(access_token, deadline=3)  # client default
+    >>>mp.get('user/info', openid=openid, deadline=1.5)
+    >>>mp.post('message/custom/send', json=message, deadline=2)
+
+The deadline rides in the ``timeout`` request option as DeadlineTimeout, so
+it is forwarded with the other options to every ``_execute_request``. Each
+attempt only gets the remaining budget, no more attempts are sent once the
+budget is spent and DeadlineExceeded is raised.
+
+"""
+
+import time
+
+from urllib3.util.retry import Retry
+from urllib3.util.timeout import Timeout
+
+from .exceptions import DeadlineExceeded
+from .settings import (RETRYS, RETRY_BACKOFF_FACTOR, RETRY_STATUS_FORCELIST,
+                       DEADLINE_MIN_ATTEMPT_TIMEOUT)
+
+
+__all__ = ['Deadline', 'DeadlineTimeout', 'DeadlineRetry', 'get_deadline']
+
+
+class Deadline(object):
+    """
+    Args:
+      budget: seconds for the whole call
+    """
+
+    def __init__(self, budget):
+        if budget <= 0:
+            raise ValueError('deadline budget must > 0')
+
+        self.budget = budget
+        self.expires_at = time.time() + budget
+
+    def remaining(self):
+        return max(self.expires_at - time.time(), 0)
+
+    @property
+    def expired(self):
+        return time.time() >= self.expires_at
+
+    def check(self, url=u''):
+        """
+        Raises:
+          DeadlineExceeded
+
+        """
+        if self.expired:
+            raise DeadlineExceeded(
+                u'deadline {}s exceeded: {}'.format(self.budget, url)
+            )
+
+    def attempt_timeout(self, timeout=None):
+        """
+        Returns:
+          timeout (seconds or tuple of connect and read) of the next
+          attempt, capped by the remaining budget
+
+        """
+        remaining = max(self.remaining(), DEADLINE_MIN_ATTEMPT_TIMEOUT)
+        if isinstance(timeout, tuple):
+            return tuple(self._cap(value, remaining) for value in timeout)
+
+        return self._cap(timeout, remaining)
+
+    @staticmethod
+    def _cap(value, remaining):
+        if isinstance(value, (int, float)):
+            return min(value, remaining)
+        return remaining
+
+
+class DeadlineTimeout(Timeout):
+    """urllib3 Timeout which clones to the remaining budget of deadline,
+    urllib3 clones the timeout for every attempt of its retries
+    """
+
+    def __init__(self, deadline, timeout=None):
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+        else:
+            connect = read = timeout
+
+        super(DeadlineTimeout, self).__init__(connect=connect, read=read)
+        self.deadline = deadline
+        self.timeout = timeout
+
+    def clone(self):
+        return Timeout(
+            connect=self._connect,
+            read=self._read,
+            total=max(
+                self.deadline.remaining(),
+                DEADLINE_MIN_ATTEMPT_TIMEOUT
+            )
+        )
+
+
+class DeadlineRetry(Retry):
+    """urllib3 Retry which is exhausted once the deadline is spent, and
+    never sleeps beyond the deadline
+    """
+
+    def __init__(self, deadline=None, **kwargs):
+        super(DeadlineRetry, self).__init__(**kwargs)
+        self.deadline = deadline
+
+    @classmethod
+    def for_deadline(cls, deadline):
+        return cls(
+            deadline=deadline,
+            total=RETRYS,
+            read=RETRYS,
+            connect=RETRYS,
+            backoff_factor=RETRY_BACKOFF_FACTOR,
+            status_forcelist=RETRY_STATUS_FORCELIST,
+        )
+
+    def new(self, **kwargs):
+        retry = super(DeadlineRetry, self).new(**kwargs)
+        retry.deadline = self.deadline
+        return retry
+
+    def is_exhausted(self):
+        if self.deadline is not None and self.deadline.expired:
+            return True
+
+        return super(DeadlineRetry, self).is_exhausted()
+
+    def get_backoff_time(self):
+        backoff = super(DeadlineRetry, self).get_backoff_time()
+        if self.deadline is None:
+            return backoff
+
+        return min(backoff, self.deadline.remaining())
+
+
+def get_deadline(timeout):
+    """
+    Returns:
+      the Deadline carried by timeout option, None if no deadline
+    """
+    return getattr(timeout, 'deadline', None)
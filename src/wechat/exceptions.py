@@ -1,4 +1,57 @@
 # -*- coding: utf-8 -*-
 
+import sys
 
-from requests.exceptions import RequestException # noqa
+from urllib3.exceptions import NewConnectionError, ReadTimeoutError
+from requests.exceptions import (RequestException, ConnectionError, # noqa
+                                 Timeout, ConnectTimeout, ReadTimeout,
+                                 RetryError)
+
+
+class RateLimitExceeded(RequestException):
+    """client side rate limit exceeded, the request is not sent"""
+
+
+class CircuitOpenError(RequestException):
+    """the circuit of host is open, the request is not sent"""
+
+
+class DeadlineExceeded(Timeout):
+    """the deadline of the call is spent, no more attempts are sent"""
+
+
+def _connect_error_types():
+    error_types = [NewConnectionError]
+    # aiohttp is only checked when AsyncApi has imported it
+    aiohttp = sys.modules.get('aiohttp')
+    if aiohttp is not None:
+        error_types.append(aiohttp.ClientConnectorError)
+    return tuple(error_types)
+
+
+def is_connect_error(error):
+    """whether the error is raised before the request is sent"""
+    if isinstance(error, ConnectTimeout):
+        return True
+
+    if not isinstance(error, ConnectionError) or len(error.args) == 0:
+        return False
+
+    cause = error.args[0]
+    cause = getattr(cause, 'reason', cause)
+    return isinstance(cause, _connect_error_types())
+
+
+def is_timeout_error(error):
+    """whether the error is a timeout, including the read timeout raised
+    through the urllib3 retries as ConnectionError
+    """
+    if isinstance(error, Timeout):
+        return True
+
+    if not isinstance(error, ConnectionError) or len(error.args) == 0:
+        return False
+
+    cause = error.args[0]
+    cause = getattr(cause, 'reason', cause)
+    return isinstance(cause, ReadTimeoutError)
@@ -0,0 +1,211 @@
+# -*- encoding: utf-8
+
+"""
+Host pool of the api served by several hosts, like api.weixin.qq.com,
+api2.weixin.qq.com and the regional sh/sz/hk hosts. The pool tracks the
+latency and error rate of every host with EWMA, routes the request to the
+healthiest host, and fails over to the next host on connect errors or 5xx.
+
+Usage:
+
+.. code-block:: python
+
+    >>>from wechat import mpapi, hostpool
+    >>>pool = hostpool.HostPool(hostpool.WECHAT_API_HOSTS)
+    >>>mp = mpapi.formp(access_token, host_pool=pool)
+    >>>pool.health()
+    {'https://api.weixin.qq.com': {'latency': 0.052, 'error_rate': 0.0,
+     'requests': 10, 'failures': 0, 'available': True}, ...}
+
+Only the GET (idempotent) request fails over on any transport error or 5xx,
+the others fail over only when the connection can not be established, as
+the request is not sent at all.
+
+"""
+
+import time
+import threading
+
+from .compat import urlparse
+from .utils import url_host
+from .exceptions import (ConnectionError, Timeout, RetryError,
+                         CircuitOpenError, DeadlineExceeded,
+                         is_connect_error)
+from .settings import (HOST_POOL_EWMA_DECAY, HOST_POOL_ERROR_PENALTY,
+                       HOST_POOL_DOWN_TIME)
+
+
+__all__ = ['HostPool', 'WECHAT_API_HOSTS']
+
+
+WECHAT_API_HOSTS = (
+    u'https://api.weixin.qq.com',
+    u'https://api2.weixin.qq.com',
+    u'https://sh.api.weixin.qq.com',
+    u'https://sz.api.weixin.qq.com',
+    u'https://hk.api.weixin.qq.com',
+)
+
+_IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+
+
+class _HostState(object):
+
+    def __init__(self, host, order):
+        self.host = host
+        self.order = order
+        self.latency = None
+        self.error_rate = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.down_until = 0
+
+
+class HostPool(object):
+    """
+    Args:
+      hosts: list of scheme and host, like https://api.weixin.qq.com, the
+        request url of other hosts is sent as it is
+      decay: weight of the latest sample in EWMA
+      error_penalty: score = latency * (1 + error_rate * error_penalty)
+      down_time: seconds to skip the host after a connect error
+
+    """
+
+    def __init__(self, hosts=WECHAT_API_HOSTS, decay=HOST_POOL_EWMA_DECAY,
+                 error_penalty=HOST_POOL_ERROR_PENALTY,
+                 down_time=HOST_POOL_DOWN_TIME):
+        if len(hosts) == 0:
+            raise ValueError('hosts can not be empty')
+
+        self.decay = decay
+        self.error_penalty = error_penalty
+        self.down_time = down_time
+
+        self._lock = threading.Lock()
+        self._hosts = {}
+        for order, host in enumerate(hosts):
+            host = url_host(host)
+            self._hosts[host] = _HostState(host, order)
+
+    def candidates(self, url):
+        """
+        Returns:
+          the url rewritten to the hosts, healthiest host first, [url] if
+          the url host is not in the pool
+
+        """
+        parsed_url = urlparse(url)
+        host = url_host(url)
+        if host not in self._hosts:
+            return [url]
+
+        suffix = url[len(parsed_url.scheme) + 3 + len(parsed_url.netloc):]
+        return [u'{}{}'.format(_host, suffix) for _host in self.select()]
+
+    def select(self):
+        """
+        Returns:
+          hosts ordered by health, the down hosts are the last
+
+        The host without latency sample scores 0, so that every host is
+        measured before the pool settles on the fastest one.
+
+        """
+        now = time.time()
+        with self._lock:
+            states = list(self._hosts.values())
+
+        def _rank(state):
+            score = (state.latency or 0) * (
+                1 + state.error_rate * self.error_penalty
+            )
+            return state.down_until > now, score, state.order
+
+        return [state.host for state in sorted(states, key=_rank)]
+
+    def report(self, url, latency=None, error=None, result=None):
+        """Record the outcome of the request sent to url
+
+        Args:
+          latency: seconds of the request
+          error: exception raised by the request
+          result: RequestResult of the request
+
+        """
+        if isinstance(error, CircuitOpenError):
+            return
+
+        host = url_host(url)
+        failed = error is not None or self._is_server_error(result)
+
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None:
+                return
+
+            state.requests += 1
+            state.error_rate = self._ewma(
+                state.error_rate,
+                1.0 if failed else 0.0
+            )
+            if latency is not None:
+                state.latency = self._ewma(state.latency, latency)
+
+            if failed:
+                state.failures += 1
+            if error is not None and is_connect_error(error):
+                state.down_until = time.time() + self.down_time
+
+    def should_failover(self, method, error=None, result=None):
+        if isinstance(error, DeadlineExceeded):
+            return False
+
+        if error is not None:
+            # the request is not sent when connect failed or circuit open
+            if is_connect_error(error) or isinstance(
+                error,
+                CircuitOpenError
+            ):
+                return True
+
+            return method.upper() in _IDEMPOTENT_METHODS and isinstance(
+                error,
+                (ConnectionError, Timeout, RetryError)
+            )
+
+        return all([
+            method.upper() in _IDEMPOTENT_METHODS,
+            self._is_server_error(result)
+        ])
+
+    def health(self):
+        """
+        Returns:
+          dict of host and its latency, error_rate, requests, failures and
+          available
+
+        """
+        now = time.time()
+        with self._lock:
+            return dict(
+                (state.host, {
+                    'latency': state.latency,
+                    'error_rate': state.error_rate,
+                    'requests': state.requests,
+                    'failures': state.failures,
+                    'available': state.down_until <= now
+                })
+                for state in self._hosts.values()
+            )
+
+    def _ewma(self, average, sample):
+        if average is None:
+            return sample
+
+        return self.decay * sample + (1 - self.decay) * average
+
+    @staticmethod
+    def _is_server_error(result):
+        status_code = getattr(result, 'status_code', None)
+        return status_code is not None and status_code >= 500
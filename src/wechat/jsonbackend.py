@@ -0,0 +1,151 @@
+# -*- encoding: utf-8
+
+"""
+JSON backend parsing the responses, serializing the json body of the
+requests and the dict values of the xml messages.
+
+The backends supported, from the fastest:
+
+* orjson
+* ujson
+* simplejson
+* json: the standard library
+
+The fastest one installed is used by default. The body is encoded straight
+to utf-8 bytes, the non ascii characters are not escaped.
+
+Usage:
+
+.. code-block:: python
+
+    >>>from wechat import jsonbackend
+    >>>jsonbackend.use('simplejson')
+    >>>jsonbackend.backend_name()
+    'simplejson'
+    >>>jsonbackend.dumps_bytes([u'你好'])
+    b'["\\xe4\\xbd\\xa0\\xe5\\xa5\\xbd"]'
+
+The whitespace between the items differs by backend, orjson writes the most
+compact document.
+
+"""
+
+import importlib
+
+
+__all__ = ['BACKENDS', 'use', 'backend_name', 'loads', 'dumps',
+           'dumps_bytes']
+
+
+BACKENDS = ('orjson', 'ujson', 'simplejson', 'json')
+
+
+class _Backend(object):
+    """json and simplejson"""
+
+    def __init__(self, module):
+        self.module = module
+        self.name = module.__name__
+
+    def loads(self, s):
+        return self.module.loads(s)
+
+    def dumps(self, obj):
+        return self.module.dumps(obj, ensure_ascii=False)
+
+    def dumps_bytes(self, obj):
+        return self.dumps(obj).encode('utf-8')
+
+
+class _UJSONBackend(_Backend):
+
+    def dumps(self, obj):
+        return self.module.dumps(
+            obj,
+            ensure_ascii=False,
+            escape_forward_slashes=False
+        )
+
+
+class _OrjsonBackend(_Backend):
+
+    def dumps(self, obj):
+        return self.module.dumps(obj).decode('utf-8')
+
+    def dumps_bytes(self, obj):
+        return self.module.dumps(obj)
+
+
+_BACKEND_CLASSES = {
+    'orjson': _OrjsonBackend,
+    'ujson': _UJSONBackend,
+}
+
+
+def _load(name):
+    if name not in BACKENDS:
+        raise ValueError(u'unknown json backend {}, use one of {}'.format(
+            name,
+            u', '.join(BACKENDS)
+        ))
+
+    module = importlib.import_module(name)
+    return _BACKEND_CLASSES.get(name, _Backend)(module)
+
+
+def _load_fastest():
+    for name in BACKENDS[:-1]:
+        try:
+            return _load(name)
+        except ImportError:
+            continue
+    return _load(BACKENDS[-1])
+
+
+_backend = _load_fastest()
+
+
+def use(name=None):
+    """
+    Args:
+      name: one of BACKENDS, None to use the fastest installed
+
+    Raises:
+      ValueError: the backend is unknown
+      ImportError: the backend is not installed
+
+    """
+    global _backend
+    _backend = _load(name) if name is not None else _load_fastest()
+
+
+def backend_name():
+    return _backend.name
+
+
+def loads(s):
+    """
+    Args:
+      s: JSON document in bytes or unicode
+
+    Raises:
+      ValueError: s is not valid JSON
+
+    """
+    return _backend.loads(s)
+
+
+def dumps(obj):
+    """
+    Returns:
+      JSON document in unicode
+    """
+    return _backend.dumps(obj)
+
+
+def dumps_bytes(obj):
+    """
+    Returns:
+      JSON document in utf-8 bytes
+    """
+    return _backend.dumps_bytes(obj)
@@ -0,0 +1,207 @@
+# -*- encoding: utf-8
+
+"""
+Adaptive timeouts derived from the observed latency of every api endpoint,
+instead of one ``settings.TIMEOUT`` for all: p99 x factor, bounded by floor
+and ceiling. Optionally hedge the idempotent GET, when the first attempt
+passes p95 a second request is sent and the first answer is used.
+
+Usage:
+
+.. code-block:: python
+
+    >>>from wechat import mpapi, latency
+    >>>adaptive_timeout = latency.AdaptiveTimeout(
+    ...     factor=2,
+    ...     floor=0.2,
+    ...     ceiling=30,
+    ...     initial={'pay/refund': 10},
+    ...     hedge=True
+    ... )
+    >>>mp = mpapi.formp(access_token, adaptive_timeout=adaptive_timeout)
+    >>>adaptive_timeout.stats()
+    {'https://api.weixin.qq.com/cgi-bin/getcallbackip': {'count': 120,
+     'p50': 0.031, 'p95': 0.052, 'p99': 0.081, 'timeout': 0.2}}
+
+The timeout passed to the call explicitly is always respected.
+
+"""
+
+import math
+import threading
+
+from .compat import urlparse
+from .utils import url_host, ApiPathRules
+from .settings import (ADAPTIVE_TIMEOUT_FACTOR, ADAPTIVE_TIMEOUT_FLOOR,
+                       ADAPTIVE_TIMEOUT_CEILING, ADAPTIVE_TIMEOUT_MIN_SAMPLES,
+                       ADAPTIVE_TIMEOUT_WINDOW)
+
+
+__all__ = ['LatencyHistogram', 'AdaptiveTimeout']
+
+
+class LatencyHistogram(object):
+    """Histogram of latency in log scale buckets, the counts are halved
+    when there are ``window`` samples, so that the old samples fade out
+
+    Args:
+      min_latency: upper bound of the first bucket
+      max_latency: latency larger than it goes to the last bucket
+      growth: ratio of the upper bounds of adjacent buckets
+
+    """
+
+    def __init__(self, min_latency=0.001, max_latency=120, growth=1.25,
+                 window=ADAPTIVE_TIMEOUT_WINDOW):
+        self.growth = growth
+        self.min_latency = min_latency
+        self.window = window
+
+        bucket_count = int(math.ceil(
+            math.log(max_latency / min_latency) / math.log(growth)
+        )) + 1
+        self._bounds = [
+            min_latency * growth ** index for index in range(bucket_count)
+        ]
+        self._counts = [0] * bucket_count
+        self._count = 0
+        self._lock = threading.Lock()
+
+    @property
+    def count(self):
+        return self._count
+
+    def observe(self, latency):
+        if latency <= self.min_latency:
+            index = 0
+        else:
+            scale = math.log(latency / self.min_latency)
+            index = min(
+                int(math.ceil(scale / math.log(self.growth))),
+                len(self._counts) - 1
+            )
+
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            if self._count >= self.window:
+                self._counts = [count // 2 for count in self._counts]
+                self._count = sum(self._counts)
+
+    def quantile(self, q):
+        """
+        Returns:
+          upper bound of the bucket where the q quantile falls, None if no
+          sample
+
+        """
+        with self._lock:
+            if self._count == 0:
+                return None
+
+            rank = q * self._count
+            seen = 0
+            for bound, count in zip(self._bounds, self._counts):
+                seen += count
+                if seen >= rank:
+                    return bound
+
+            return self._bounds[-1]
+
+
+class AdaptiveTimeout(object):
+    """
+    Args:
+      factor: timeout = p99 x factor
+      floor: min timeout
+      ceiling: max timeout
+      min_samples: samples of endpoint needed before adapting, the
+        endpoint uses its initial timeout (or Api timeout) before it
+      initial: dict of api path and the timeout before adapting
+      hedge: whether to hedge the GET request
+      hedge_quantile: the hedge request is sent when first attempt passes
+        this quantile of latency
+
+    """
+
+    def __init__(self, factor=ADAPTIVE_TIMEOUT_FACTOR,
+                 floor=ADAPTIVE_TIMEOUT_FLOOR,
+                 ceiling=ADAPTIVE_TIMEOUT_CEILING,
+                 min_samples=ADAPTIVE_TIMEOUT_MIN_SAMPLES, initial=None,
+                 hedge=False, hedge_quantile=0.95):
+        if floor > ceiling:
+            raise ValueError('floor must <= ceiling')
+
+        self.factor = factor
+        self.floor = floor
+        self.ceiling = ceiling
+        self.min_samples = min_samples
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self._initial = ApiPathRules(initial)
+
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def observe(self, url, latency):
+        self._histogram(url).observe(latency)
+
+    def timeout_for(self, url, default=None):
+        """
+        Returns:
+          p99 x factor of the endpoint bounded by floor and ceiling, the
+          initial timeout or default if not enough samples
+
+        """
+        histogram = self._histogram(url)
+        if histogram.count < self.min_samples:
+            return self._initial.match(url, default)
+
+        timeout = histogram.quantile(0.99) * self.factor
+        return min(max(timeout, self.floor), self.ceiling)
+
+    def hedge_delay(self, url):
+        """
+        Returns:
+          seconds to wait before sending the hedge request, None if no
+          hedging or not enough samples
+
+        """
+        if not self.hedge:
+            return None
+
+        histogram = self._histogram(url)
+        if histogram.count < self.min_samples:
+            return None
+
+        return histogram.quantile(self.hedge_quantile)
+
+    def stats(self):
+        with self._lock:
+            histograms = dict(self._histograms)
+
+        _stats = {}
+        for endpoint, histogram in histograms.items():
+            _stats[endpoint] = {
+                'count': histogram.count,
+                'p50': histogram.quantile(0.5),
+                'p95': histogram.quantile(0.95),
+                'p99': histogram.quantile(0.99),
+                'timeout': self.timeout_for(endpoint)
+            }
+        return _stats
+
+    def _histogram(self, url):
+        endpoint = self._build_endpoint(url)
+        histogram = self._histograms.get(endpoint)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(
+                    endpoint,
+                    LatencyHistogram()
+                )
+        return histogram
+
+    @staticmethod
+    def _build_endpoint(url):
+        return url_host(url) + urlparse(url).path.rstrip(u'/')
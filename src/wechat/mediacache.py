@@ -0,0 +1,269 @@
+# -*- encoding: utf-8
+
+"""
+Cache of the temporary media uploaded, keyed by appid and the hash of media
+content, so uploading the same image or voice again returns the cached
+media_id instead of uploading, until the media expires (3 days).
+
+Usage:
+
+.. code-block:: python
+
+    >>>from wechat import mpapi, mediacache
+    >>>media_cache = mediacache.SQLiteMediaCache('/var/run/wechat.db')
+    >>>mp = mpapi.formp(token_manager=manager, media_cache=media_cache)
+    >>>mp.upload_media('image', '/data/a.jpg').media_id  # uploaded
+    >>>mp.upload_media('image', '/data/a.jpg').media_id  # cached
+
+Backends:
+
+* MemoryMediaCache: LRU in process
+* SQLiteMediaCache: sqlite database file, shared on the host
+
+The content of iterable sources can not be hashed without consuming it, so
+they are uploaded without cache.
+
+"""
+
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from .compat import bytes, str
+from .settings import (MEDIA_EXPIRES_IN, MEDIA_CACHE_EXPIRY_MARGIN,
+                       MEDIA_CACHE_MAX_ENTRIES)
+
+
+__all__ = ['MediaCache', 'MemoryMediaCache', 'SQLiteMediaCache',
+           'content_digest', 'media_expires_at']
+
+
+_HASH_CHUNK_SIZE = 64 * 1024
+
+
+def _hash_file(digest, fileobj):
+    while True:
+        chunk = fileobj.read(_HASH_CHUNK_SIZE)
+        if not chunk:
+            break
+        digest.update(chunk)
+
+
+def content_digest(media_type, media):
+    """
+    Args:
+      media: path, file object, bytes, or tuple of (filename, source, ...)
+        like MpApi.upload_media()
+
+    Returns:
+      hex sha256 of the media type and content, None if the content can
+      not be hashed without consuming it (iterable source)
+
+    """
+    source = media[1] if isinstance(media, tuple) else media
+
+    digest = hashlib.sha256(media_type.encode('utf-8') + b':')
+    if isinstance(source, bytes):
+        digest.update(source)
+    elif isinstance(source, str):
+        with open(source, 'rb') as source_file:
+            _hash_file(digest, source_file)
+    elif hasattr(source, 'read') and hasattr(source, 'seek'):
+        position = source.tell()
+        try:
+            _hash_file(digest, source)
+        finally:
+            source.seek(position)
+    else:
+        return None
+
+    return digest.hexdigest()
+
+
+def media_expires_at(result):
+    """
+    Returns:
+      timestamp when the cached media_id of the upload result is no longer
+      used, the media expires 3 days after created_at
+
+    """
+    created_at = result.json.get('created_at') or time.time()
+    return float(created_at) + MEDIA_EXPIRES_IN - MEDIA_CACHE_EXPIRY_MARGIN
+
+
+class MediaCache(object):
+
+    def get(self, appid, digest):
+        """
+        Returns:
+          media_id, None if not cached or expired
+
+        """
+        raise NotImplementedError('implement get in sub class')
+
+    def set(self, appid, digest, media_id, expires_at):
+        raise NotImplementedError('implement set in sub class')
+
+    def delete(self, appid, digest):
+        """remove the media_id, like it is rejected as invalid"""
+        raise NotImplementedError('implement delete in sub class')
+
+    def purge(self):
+        """
+        Returns:
+          count of the expired entries removed
+
+        """
+        raise NotImplementedError('implement purge in sub class')
+
+
+class MemoryMediaCache(MediaCache):
+    """LRU of media_id, the expired entries are removed when read or when
+    the cache is full
+
+    Args:
+      max_entries: max count of cached media_id
+
+    """
+
+    def __init__(self, max_entries=MEDIA_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, appid, digest):
+        key = (appid, digest)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            if entry[1] <= time.time():
+                del self._entries[key]
+                return None
+
+            self._entries[key] = self._entries.pop(key)
+            return entry[0]
+
+    def set(self, appid, digest, media_id, expires_at):
+        key = (appid, digest)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (media_id, expires_at)
+
+            if len(self._entries) > self.max_entries:
+                self._purge()
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, appid, digest):
+        with self._lock:
+            self._entries.pop((appid, digest), None)
+
+    def purge(self):
+        with self._lock:
+            return self._purge()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _purge(self):
+        now = time.time()
+        expired_keys = [
+            key for key, (_, expires_at) in self._entries.items()
+            if expires_at <= now
+        ]
+        for key in expired_keys:
+            del self._entries[key]
+        return len(expired_keys)
+
+
+class SQLiteMediaCache(MediaCache):
+    """media_id kept in sqlite database file, the expired rows are removed
+    when writing
+    """
+
+    def __init__(self, path, timeout=5):
+        self.path = path
+        self.timeout = timeout
+
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS wechat_media ('
+                    'appid TEXT, digest TEXT, media_id TEXT, '
+                    'expires_at REAL, PRIMARY KEY (appid, digest))'
+                )
+                conn.execute(
+                    'CREATE INDEX IF NOT EXISTS wechat_media_expires_at '
+                    'ON wechat_media (expires_at)'
+                )
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=self.timeout)
+
+    def get(self, appid, digest):
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT media_id FROM wechat_media '
+                'WHERE appid = ? AND digest = ? AND expires_at > ?',
+                (appid, digest, time.time())
+            ).fetchone()
+        finally:
+            conn.close()
+
+        return row[0] if row is not None else None
+
+    def set(self, appid, digest, media_id, expires_at):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    'DELETE FROM wechat_media WHERE expires_at <= ?',
+                    (time.time(), )
+                )
+                conn.execute(
+                    'INSERT OR REPLACE INTO wechat_media '
+                    '(appid, digest, media_id, expires_at) '
+                    'VALUES (?, ?, ?, ?)',
+                    (appid, digest, media_id, expires_at)
+                )
+        finally:
+            conn.close()
+
+    def delete(self, appid, digest):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    'DELETE FROM wechat_media WHERE appid = ? AND digest = ?',
+                    (appid, digest)
+                )
+        finally:
+            conn.close()
+
+    def purge(self):
+        conn = self._connect()
+        try:
+            with conn:
+                return conn.execute(
+                    'DELETE FROM wechat_media WHERE expires_at <= ?',
+                    (time.time(), )
+                ).rowcount
+        finally:
+            conn.close()
+
+    def __len__(self):
+        conn = self._connect()
+        try:
+            return conn.execute(
+                'SELECT COUNT(*) FROM wechat_media'
+            ).fetchone()[0]
+        finally:
+            conn.close()
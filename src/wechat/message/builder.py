@@ -3,22 +3,109 @@
 
 import time
 
-from wechat.utils import serialize_dict_to_xml
+from wechat.compat import bytes, unicode
+from wechat.settings import REPLY_NEWS_MAX_ARTICLES
 
 from .models import XMLMessage
 
 
-def _build_reply_msg_bytes(receive_message, **kwrags):
-    unicode_msg = serialize_dict_to_xml(
-        ToUserName=receive_message.FromUserName,
-        FromUserName=receive_message.ToUserName,
-        CreateTime=int(time.time()),
-        **kwrags
+def _compile_reply_template(msg_type, payload=b''):
+    """
+    Returns:
+      bytes template of the reply, filled by ToUserName, FromUserName,
+      CreateTime and then the payload
+
+    """
+    return b''.join([
+        b'<xml>'
+        b'<ToUserName><![CDATA[%s]]></ToUserName>'
+        b'<FromUserName><![CDATA[%s]]></FromUserName>'
+        b'<CreateTime>%d</CreateTime>'
+        b'<MsgType><![CDATA[', msg_type, b']]></MsgType>',
+        payload,
+        b'</xml>'
+    ])
+
+
+_TEXT_TEMPLATE = _compile_reply_template(
+    b'text',
+    b'<Content><![CDATA[%s]]></Content>'
+)
+
+_IMAGE_TEMPLATE = _compile_reply_template(
+    b'image',
+    b'<Image><MediaId><![CDATA[%s]]></MediaId></Image>'
+)
+
+_VOICE_TEMPLATE = _compile_reply_template(
+    b'voice',
+    b'<Voice><MediaId><![CDATA[%s]]></MediaId></Voice>'
+)
+
+_VIDEO_TEMPLATE = _compile_reply_template(
+    b'video',
+    b'<Video>'
+    b'<MediaId><![CDATA[%s]]></MediaId>'
+    b'<Title><![CDATA[%s]]></Title>'
+    b'<Description><![CDATA[%s]]></Description>'
+    b'</Video>'
+)
+
+_MUSIC_TEMPLATE = _compile_reply_template(
+    b'music',
+    b'<Music>'
+    b'<Title><![CDATA[%s]]></Title>'
+    b'<Description><![CDATA[%s]]></Description>'
+    b'<MusicUrl><![CDATA[%s]]></MusicUrl>'
+    b'<HQMusicUrl><![CDATA[%s]]></HQMusicUrl>'
+    b'<ThumbMediaId><![CDATA[%s]]></ThumbMediaId>'
+    b'</Music>'
+)
+
+_NEWS_TEMPLATE = _compile_reply_template(
+    b'news',
+    b'<ArticleCount>%d</ArticleCount><Articles>%s</Articles>'
+)
+
+_ARTICLE_TEMPLATE = (
+    b'<item>'
+    b'<Title><![CDATA[%s]]></Title>'
+    b'<Description><![CDATA[%s]]></Description>'
+    b'<PicUrl><![CDATA[%s]]></PicUrl>'
+    b'<Url><![CDATA[%s]]></Url>'
+    b'</item>'
+)
+
+
+def _cdata(value):
+    if value is None:
+        return b''
+
+    if not isinstance(value, (bytes, unicode)):
+        value = unicode(value)
+
+    if not isinstance(value, bytes):
+        value = value.encode('utf-8')
+
+    if b']]>' in value:
+        value = value.replace(b']]>', b']]]]><![CDATA[>')
+    return value
+
+
+def _fill_reply(template, message, *payload):
+    return template % (
+        (
+            _cdata(message.FromUserName),
+            _cdata(message.ToUserName),
+            int(time.time())
+        ) + tuple(_cdata(value) for value in payload)
     )
-    return unicode_msg.encode('utf-8')
 
 
 class XMLMessageBuilder(object):
+    """Build the passive reply of the received message in utf-8 bytes, by
+    filling the precompiled templates
+    """
 
     def __init__(self):
         raise NotImplementedError()
@@ -28,34 +115,101 @@ class XMLMessageBuilder(object):
         return XMLMessage(raw_xml)
 
     @staticmethod
-    def build_reply_textmsg_for(message, content):
-        if isinstance(content, bytes):
-            content = content.decode('utf-8')
+    def build_encrypted_reply(crypto, build_reply, message, *args, **kwargs):
+        """Build the reply and encrypt it for the safe mode in one pass
 
-        return _build_reply_msg_bytes(
-            message,
-            MsgType=u'text',
-            Content=content
+        .. code-block:: python
+
+            >>>XMLMessageBuilder.build_encrypted_reply(
+            ...     crypto,
+            ...     XMLMessageBuilder.build_reply_textmsg_for,
+            ...     message,
+            ...     u'reply'
+            ... )
+
+        Args:
+          crypto: MsgCrypt of the account
+          build_reply: one of the build_reply_*_for, called with message,
+            args and kwargs
+
+        Returns:
+          encrypted reply in bytes
+
+        """
+        return crypto.build_encrypted_reply(
+            build_reply(message, *args, **kwargs)
         )
 
+    @staticmethod
+    def build_reply_textmsg_for(message, content):
+        return _fill_reply(_TEXT_TEMPLATE, message, content)
+
     @staticmethod
     def build_reply_imgmsg_for(message, media_id):
-        raise NotImplementedError()
+        return _fill_reply(_IMAGE_TEMPLATE, message, media_id)
 
     @staticmethod
     def build_reply_voicemsg_for(message, media_id):
-        raise NotImplementedError()
+        return _fill_reply(_VOICE_TEMPLATE, message, media_id)
 
     @staticmethod
     def build_reply_videomsg_for(message, media_id,
                                  title=None, description=None):
-        raise NotImplementedError()
+        return _fill_reply(
+            _VIDEO_TEMPLATE,
+            message,
+            media_id,
+            title,
+            description
+        )
 
     @staticmethod
     def build_reply_musicmsg_for(message, media_id, title=None, music_url=None,
                                  description=None, hqmusic_url=None):
-        raise NotImplementedError()
+        """
+        Args:
+          media_id: media_id of the thumb
+
+        """
+        return _fill_reply(
+            _MUSIC_TEMPLATE,
+            message,
+            title,
+            description,
+            music_url,
+            hqmusic_url,
+            media_id
+        )
 
     @staticmethod
     def build_reply_newsmsg_for(message, articles):
-        raise NotImplementedError()
+        """
+        Args:
+          articles: list of dict with Title, Description, PicUrl and Url,
+            at most 8 articles
+
+        Raises:
+          ValueError: no articles or more than 8 articles
+
+        """
+        if not 0 < len(articles) <= REPLY_NEWS_MAX_ARTICLES:
+            raise ValueError(u'news reply has 1 to {} articles, got {}'.format(
+                REPLY_NEWS_MAX_ARTICLES,
+                len(articles)
+            ))
+
+        articles_bytes = b''.join(
+            _ARTICLE_TEMPLATE % (
+                _cdata(article.get('Title')),
+                _cdata(article.get('Description')),
+                _cdata(article.get('PicUrl')),
+                _cdata(article.get('Url'))
+            ) for article in articles
+        )
+        return _NEWS_TEMPLATE % (
+            _cdata(message.FromUserName),
+            _cdata(message.ToUserName),
+            int(time.time()),
+            len(articles),
+            articles_bytes
+        )
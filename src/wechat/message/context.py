@@ -24,6 +24,10 @@ class Context(dict):
     def handle_result(self):
         return self.get('handle_result', None)
 
+    @property
+    def span(self):
+        return self.get('span', None)
+
     @property
     def should_continue(self):
         return self.get('should_continue', False)
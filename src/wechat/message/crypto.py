@@ -19,6 +19,7 @@ import socket
 from bs4 import BeautifulSoup
 
 from wechat.utils import serialize_dict_to_xml
+from wechat import metrics
 from wechat.compat import unicode, str, is_py3
 from .exceptions import (SignatureError, InvalidAESKeyError, EncryptError,
                          ReceiveMsgFormatError, InvalidSignature,
@@ -61,6 +62,12 @@ class PKCS7Encoder(object):
             return encoded[:-pad]
 
 
+def _to_bytes(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
 def _sign(token, timestamp, nonce, encrypt):
     """
     用SHA1算法生成安全签名
@@ -92,6 +99,30 @@ def _sign(token, timestamp, nonce, encrypt):
         raise SignatureError(error)
 
 
+_ENVELOPE_TEMPLATE = (
+    b'<xml>'
+    b'<Encrypt><![CDATA[%s]]></Encrypt>'
+    b'<MsgSignature><![CDATA[%s]]></MsgSignature>'
+    b'<TimeStamp>%s</TimeStamp>'
+    b'<Nonce><![CDATA[%s]]></Nonce>'
+    b'</xml>'
+)
+
+
+def _can_encrypt_in_place():
+    cryptor = AES.new(b'\0' * 32, AES.MODE_CBC, b'\0' * 16)
+    buf = bytearray(16)
+    try:
+        cryptor.encrypt(buf, output=buf)
+    except TypeError:
+        return False
+    return True
+
+
+# pycryptodome encrypts into the buffer, pycrypto returns new bytes
+_ENCRYPT_IN_PLACE = _can_encrypt_in_place()
+
+
 class MsgCrypt(object):
     """
     微信开放平台的公众号消息加密解密实现
@@ -121,6 +152,7 @@ class MsgCrypt(object):
         self.token = token
         self.appid = appid
 
+    @metrics.timer(metrics.crypto_duration, 'encrypt')
     def encrypt(self, msg, nonce=None, timestamp=None):
         """
         对发送的微信消息进行加密
@@ -139,6 +171,50 @@ class MsgCrypt(object):
 
         """
 
+        encryped_msg, signature, timestamp, nonce = self._encrypt_and_sign(
+            msg,
+            nonce,
+            timestamp
+        )
+        return serialize_dict_to_xml(
+            Encrypt=encryped_msg,
+            MsgSignature=signature,
+            TimeStamp=timestamp,
+            Nonce=nonce
+        )
+
+    @metrics.timer(metrics.crypto_duration, 'encrypt')
+    def build_encrypted_reply(self, reply, nonce=None, timestamp=None):
+        """
+        加密回复消息并生成回复的XML, 明文写入一次分配的缓冲区, 原地补位
+        和加密, 外层XML由模板生成
+
+        Args:
+          reply: 回复消息, 如XMLMessageBuilder生成的bytes
+          nonce: 随机串, 如果缺省会生成新的随机串
+          timestamp: 时间戳, 如果缺省使用当前时间
+
+        Returns:
+          加密后的回复消息(bytes)
+
+        Raises:
+          SignatureError: 签名失败
+          EncryptError: 加密失败
+
+        """
+        encryped_msg, signature, timestamp, nonce = self._encrypt_and_sign(
+            reply,
+            nonce,
+            timestamp
+        )
+        return _ENVELOPE_TEMPLATE % (
+            encryped_msg,
+            signature.encode(self._ENCODING),
+            _to_bytes(timestamp),
+            _to_bytes(nonce)
+        )
+
+    def _encrypt_and_sign(self, msg, nonce, timestamp):
         if isinstance(msg, unicode):
             msg = msg.encode(self._ENCODING)
 
@@ -153,13 +229,9 @@ class MsgCrypt(object):
             timestamp = str(timestamp)
 
         signature = _sign(self.token, timestamp, nonce, encryped_msg)
-        return serialize_dict_to_xml(
-            Encrypt=encryped_msg,
-            MsgSignature=signature,
-            TimeStamp=timestamp,
-            Nonce=nonce
-        )
+        return encryped_msg, signature, timestamp, nonce
 
+    @metrics.timer(metrics.crypto_duration, 'decrypt')
     def decrypt(self, receive_str, signature, timestamp, nonce):
         """
         对收到的微信信息进行解密
@@ -218,18 +290,29 @@ class MsgCrypt(object):
 
         """
 
-        _bytes = bytes(
-            bytearray(self._create_random_str(), self._ENCODING) +
-            struct.pack("I", socket.htonl(len(text))) +
-            text +
-            bytearray(self.appid, self._ENCODING)
+        appid = self.appid.encode(self._ENCODING)
+        text_end = self._RANDOM_STR_LEN + 4 + len(text)
+        length = text_end + len(appid)
+        amount_to_pad = PKCS7Encoder._BLODK_SIZE - (
+            length % PKCS7Encoder._BLODK_SIZE
+        )
+
+        # random(16) + len(text)(4, network order) + text + appid + pad
+        buf = bytearray(length + amount_to_pad)
+        buf[:self._RANDOM_STR_LEN] = self._create_random_str().encode(
+            self._ENCODING
         )
+        struct.pack_into('>I', buf, self._RANDOM_STR_LEN, len(text))
+        buf[self._RANDOM_STR_LEN + 4:text_end] = text
+        buf[text_end:length] = appid
+        buf[length:] = bytearray([amount_to_pad]) * amount_to_pad
 
-        _bytes = PKCS7Encoder.encode(_bytes)
         cryptor = AES.new(self.key, self.mode, self.key[:self._RANDOM_STR_LEN])
         try:
-            ciphertext = cryptor.encrypt(_bytes)
-            return base64.b64encode(ciphertext)
+            if _ENCRYPT_IN_PLACE:
+                cryptor.encrypt(buf, output=buf)
+                return base64.b64encode(buf)
+            return base64.b64encode(cryptor.encrypt(bytes(buf)))
         except Exception as error:
             raise EncryptError(error)
 
@@ -4,6 +4,7 @@
 from bs4 import BeautifulSoup
 
 from wechat.compat import basestring
+from wechat.xmlparser import parse_xml_tags
 
 
 class MessageTypes(object):
@@ -58,86 +59,108 @@ class XMLMessage(object):
     以及wm.content来获取
 
     """
+    __slots__ = ('raw', '_fields', '_soup', '_type', '_event', '_event_key',
+                 '_msg_id', '_create_time')
+
     def __init__(self, raw_xml):
         if not isinstance(raw_xml, basestring):
             raise TypeError('raw_xml not basestring type')
 
-        object.__setattr__(self, 'soup', BeautifulSoup(raw_xml, 'xml'))
         object.__setattr__(self, 'raw', raw_xml)
+        object.__setattr__(self, '_soup', None)
+        try:
+            fields = parse_xml_tags(raw_xml)
+        except ValueError:
+            # BeautifulSoup is tolerant of the malformed xml
+            fields = dict(
+                (tag.name, tag.text)
+                for tag in reversed(self.soup.find_all(True))
+            )
+        object.__setattr__(self, '_fields', fields)
+
+        object.__setattr__(self, '_type', fields.get('MsgType'))
+        object.__setattr__(self, '_event', fields.get('Event'))
+        object.__setattr__(self, '_event_key', fields.get('EventKey'))
+        object.__setattr__(self, '_msg_id', fields.get('MsgId'))
+        object.__setattr__(self, '_create_time', fields.get('CreateTime'))
+
+    @property
+    def soup(self):
+        """BeautifulSoup of the raw xml, built when first accessed"""
+        if self._soup is None:
+            object.__setattr__(self, '_soup', BeautifulSoup(self.raw, 'xml'))
+        return self._soup
 
     def __getattr__(self, key):
-        if key in ['soup', 'raw']:
-            return object.__getattribute__(self, key)
+        if key.startswith('__'):
+            raise AttributeError(key)
 
-        if hasattr(self.soup, key) and getattr(self.soup, key) is not None:
-            return getattr(self.soup, key).text
-        else:
-            return None
+        return self._fields.get(key)
 
     def __setattr__(self, key, value):
         raise AttributeError(key)
 
     @property
     def type(self):
-        return self.MsgType
+        return self._type
 
     @property
     def content(self):
         if self.is_text():
             return self.Content
-        elif self.is_event() and self.Event == 'CLICK':
-            return self.EventKey
+        elif self.is_event() and self._event == 'CLICK':
+            return self._event_key
         else:
-            return u'[{}]'.format(self.type)
+            return u'[{}]'.format(self._type)
 
     def is_event(self):
-        return self.type == MessageTypes.EVENT
+        return self._type == MessageTypes.EVENT
 
     def is_text(self):
-        return self.type == MessageTypes.TEXT
+        return self._type == MessageTypes.TEXT
 
     def is_image(self):
-        return self.type == MessageTypes.IMAGE
+        return self._type == MessageTypes.IMAGE
 
     def is_voice(self):
-        return self.type == MessageTypes.VOICE
+        return self._type == MessageTypes.VOICE
 
     def is_video(self):
-        return self.type == MessageTypes.VIDEO
+        return self._type == MessageTypes.VIDEO
 
     def is_shortvideo(self):
-        return self.type == MessageTypes.SHORT_VIDEO
+        return self._type == MessageTypes.SHORT_VIDEO
 
     def is_location(self):
-        return self.type == MessageTypes.LOCATION
+        return self._type == MessageTypes.LOCATION
 
     def is_link(self):
-        return self.type == MessageTypes.LINK
+        return self._type == MessageTypes.LINK
 
     def is_subscribe_event(self):
-        return self.is_event() and self.Event == MessageEventTypes.SUBSCRIBE
+        return self.is_event() and self._event == MessageEventTypes.SUBSCRIBE
 
     def is_unsubscribe_event(self):
-        return self.is_event() and self.Event == MessageEventTypes.UNSUBSCRIBE
+        return self.is_event() and self._event == MessageEventTypes.UNSUBSCRIBE
 
     def is_qrscene_subscribe_event(self):
         if self.is_subscribe_event():
-            return self.EventKey.startswith('qrscene_')
+            return self._event_key.startswith('qrscene_')
 
         return False
 
     def is_scan_event(self):
-        return self.is_event() and self.Event == MessageEventTypes.SCAN
+        return self.is_event() and self._event == MessageEventTypes.SCAN
 
     def is_click_event(self):
-        return self.is_event() and self.Event == MessageEventTypes.CLICK
+        return self.is_event() and self._event == MessageEventTypes.CLICK
 
     @property
     def id(self):
         if self.is_event():
             return -1
         else:
-            return int(self.MsgId)
+            return int(self._msg_id)
 
     @property
     def from_openid(self):
@@ -149,7 +172,7 @@ class XMLMessage(object):
 
     @property
     def create_timestamp(self):
-        return int(self.CreateTime)
+        return int(self._create_time)
 
     def __str__(self):
         return self.raw
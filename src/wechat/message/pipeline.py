@@ -4,6 +4,7 @@
 from importlib import import_module
 
 from wechat.compat import basestring
+from wechat import metrics, tracing
 from . import MessageProcessException
 from .context import Context
 from .builder import XMLMessageBuilder
@@ -22,16 +23,31 @@ class Pipeline(object):
 
     def handle(self, raw_message, **kwargs):
         """
+        Args:
+          trace_parent: parent tracing Span of the handling, default is the
+            current span
+
         Raises:
           MessageProcessException
 
         """
+        with tracing.span(
+            u'wechat.message.handle',
+            parent=kwargs.pop('trace_parent', None)
+        ) as handle_span:
+            return self._handle(raw_message, handle_span, **kwargs)
+
+    def _handle(self, raw_message, handle_span, **kwargs):
         # build message
         message = XMLMessageBuilder.parse(raw_message)
 
         # init context
         context = Context.new(**kwargs)
-        context.defaults(message=message, raw_message=raw_message)
+        context.defaults(
+            message=message,
+            raw_message=raw_message,
+            span=handle_span
+        )
 
         # pre process
         self._pre_process(message, context)
@@ -39,8 +55,15 @@ class Pipeline(object):
         # process
         result = None
         for handler in self.handlers:
+            handler_name = handler.__class__.__name__
             try:
-                result = handler.handle(message, context)
+                with tracing.span(u'wechat.message.handler', {
+                    u'wechat.handler': handler_name
+                }), metrics.timer(
+                    metrics.pipeline_handler_duration,
+                    handler_name
+                ):
+                    result = handler.handle(message, context)
             except Exception as handle_error:
                 raise MessageProcessException(
                     handle_error.__str__(),
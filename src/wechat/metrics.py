@@ -0,0 +1,449 @@
+# -*- encoding: utf-8
+
+"""
+Built-in metrics of the library: api requests (by endpoint, errcode and
+HTTP status), latency, retries, bytes sent and received, access token
+refreshes, message crypto and pipeline handlers.
+
+Usage:
+
+.. code-block:: python
+
+    >>>from wechat import metrics
+    >>>print(metrics.to_prometheus())
+    # HELP wechat_requests_total Api calls
+    # TYPE wechat_requests_total counter
+    wechat_requests_total{endpoint="/cgi-bin/user/info",method="GET",...} 3
+    ...
+    >>>metrics.snapshot()['wechat_requests_total']
+    {'type': 'counter', 'help': 'Api calls', 'samples': [...]}
+
+Serve the text on the metrics endpoint of your app, or push the snapshot
+to any other monitoring system. ``metrics.disable()`` turns off the
+recording.
+
+"""
+
+import time
+import bisect
+import functools
+import threading
+
+from .compat import urlparse
+from .result import StreamResult
+from .settings import METRICS_LATENCY_BUCKETS
+
+
+__all__ = ['Counter', 'Histogram', 'MetricsRegistry', 'default_registry',
+           'snapshot', 'to_prometheus', 'enable', 'disable']
+
+
+def _escape(value):
+    return u'{}'.format(value).replace(u'\\', u'\\\\').replace(
+        u'"', u'\\"'
+    ).replace(u'\n', u'\\n')
+
+
+def _label_values(labels):
+    # label values are text in the exposition, and mixed ints and strings
+    # (200 and 'exception', 0 and 'ORDERNOTEXIST') can not be sorted
+    return tuple(u'{}'.format(value) for value in labels)
+
+
+def _format_labels(labelnames, labels, extra=None):
+    pairs = list(zip(labelnames, labels))
+    if extra is not None:
+        pairs.append(extra)
+
+    if len(pairs) == 0:
+        return u''
+
+    return u'{{{}}}'.format(u','.join(
+        u'{}="{}"'.format(name, _escape(value)) for name, value in pairs
+    ))
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return u'+Inf'
+    return u'{}'.format(value)
+
+
+class _Metric(object):
+
+    TYPE = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def _check_labels(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError('{} expects labels {}'.format(
+                self.name,
+                self.labelnames
+            ))
+        return _label_values(labels)
+
+
+class Counter(_Metric):
+
+    TYPE = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        labels = self._check_labels(labels)
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels=()):
+        return self._values.get(_label_values(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+
+        return [
+            {'labels': dict(zip(self.labelnames, labels)), 'value': value}
+            for labels, value in values
+        ]
+
+    def exposition(self):
+        with self._lock:
+            values = list(self._values.items())
+
+        return [
+            u'{}{} {}'.format(
+                self.name,
+                _format_labels(self.labelnames, labels),
+                _format_value(value)
+            )
+            for labels, value in sorted(values)
+        ]
+
+
+class Histogram(_Metric):
+
+    TYPE = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(),
+                 buckets=METRICS_LATENCY_BUCKETS):
+        super(Histogram, self).__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, labels=()):
+        labels = self._check_labels(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            item = self._values.get(labels)
+            if item is None:
+                # counts of buckets and +Inf, sum
+                item = self._values[labels] = [
+                    [0] * (len(self.buckets) + 1),
+                    0
+                ]
+            item[0][index] += 1
+            item[1] += value
+
+    def samples(self):
+        with self._lock:
+            values = [
+                (labels, list(counts), total)
+                for labels, (counts, total) in self._values.items()
+            ]
+
+        samples = []
+        for labels, counts, total in values:
+            cumulative = 0
+            buckets = {}
+            for bound, count in zip(self.buckets + (float('inf'), ), counts):
+                cumulative += count
+                buckets[bound] = cumulative
+            samples.append({
+                'labels': dict(zip(self.labelnames, labels)),
+                'value': {
+                    'buckets': buckets,
+                    'sum': total,
+                    'count': cumulative
+                }
+            })
+        return samples
+
+    def exposition(self):
+        lines = []
+        for sample in sorted(
+            self.samples(),
+            key=lambda sample: sorted(sample['labels'].items())
+        ):
+            labels = tuple(
+                sample['labels'][name] for name in self.labelnames
+            )
+            value = sample['value']
+            for bound in sorted(value['buckets']):
+                lines.append(u'{}_bucket{} {}'.format(
+                    self.name,
+                    _format_labels(
+                        self.labelnames,
+                        labels,
+                        (u'le', _format_value(bound))
+                    ),
+                    value['buckets'][bound]
+                ))
+            lines.append(u'{}_sum{} {}'.format(
+                self.name,
+                _format_labels(self.labelnames, labels),
+                value['sum']
+            ))
+            lines.append(u'{}_count{} {}'.format(
+                self.name,
+                _format_labels(self.labelnames, labels),
+                value['count']
+            ))
+        return lines
+
+
+class MetricsRegistry(object):
+
+    def __init__(self):
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(),
+                  buckets=METRICS_LATENCY_BUCKETS):
+        return self._register(
+            Histogram,
+            name,
+            help_text,
+            labelnames,
+            buckets=buckets
+        )
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def snapshot(self):
+        """
+        Returns:
+          dict of metric name and its type, help and samples
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        return dict(
+            (metric.name, {
+                'type': metric.TYPE,
+                'help': metric.help,
+                'samples': metric.samples()
+            })
+            for metric in metrics
+        )
+
+    def to_prometheus(self):
+        """
+        Returns:
+          metrics in Prometheus text exposition format
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+
+        lines = []
+        for metric in metrics:
+            lines.append(u'# HELP {} {}'.format(metric.name, metric.help))
+            lines.append(u'# TYPE {} {}'.format(metric.name, metric.TYPE))
+            lines.extend(metric.exposition())
+        return u'\n'.join(lines) + u'\n'
+
+    def clear(self):
+        """reset the values of all metrics, the metrics keep registered"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        for metric in metrics:
+            metric.clear()
+
+    def _register(self, metric_class, name, help_text, labelnames,
+                  **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = metric_class(name, help_text, labelnames, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, metric_class):
+                raise ValueError('{} registered as {}'.format(
+                    name,
+                    metric.TYPE
+                ))
+            return metric
+
+
+default_registry = MetricsRegistry()
+
+requests_total = default_registry.counter(
+    'wechat_requests_total',
+    'Api calls',
+    ('endpoint', 'method', 'status', 'errcode')
+)
+request_duration = default_registry.histogram(
+    'wechat_request_duration_seconds',
+    'Latency of api calls including retries',
+    ('endpoint', )
+)
+retries_total = default_registry.counter(
+    'wechat_retries_total',
+    'Retries of api calls',
+    ('endpoint', 'reason')
+)
+bytes_sent = default_registry.counter(
+    'wechat_request_bytes_total',
+    'Bytes of request body sent',
+    ('endpoint', )
+)
+bytes_received = default_registry.counter(
+    'wechat_response_bytes_total',
+    'Bytes of response body received',
+    ('endpoint', )
+)
+token_refreshes_total = default_registry.counter(
+    'wechat_token_refreshes_total',
+    'Access token fetches',
+    ('appid', 'result')
+)
+token_refresh_duration = default_registry.histogram(
+    'wechat_token_refresh_duration_seconds',
+    'Latency of access token fetches',
+    ('appid', )
+)
+crypto_duration = default_registry.histogram(
+    'wechat_message_crypto_duration_seconds',
+    'Latency of message encrypt and decrypt',
+    ('operation', 'result'),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1)
+)
+pipeline_handler_duration = default_registry.histogram(
+    'wechat_pipeline_handler_duration_seconds',
+    'Latency of message pipeline handlers',
+    ('handler', 'result'),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1)
+)
+
+
+def _endpoint(url):
+    return urlparse(url).path or u'/'
+
+
+def _body_size(body):
+    if body is None:
+        return 0
+    if hasattr(body, '__len__'):
+        return len(body)
+    return 0
+
+
+def observe_request(method, url, duration, result=None, error=None):
+    if not default_registry.enabled:
+        return
+
+    endpoint = _endpoint(url)
+    if error is not None:
+        status, errcode = u'exception', error.__class__.__name__
+    else:
+        status = result.status_code
+        if status is None:
+            status = u''
+        errcode = result.errcode if result.is_failed else 0
+        if isinstance(result, StreamResult):
+            # the body is not read yet
+            bytes_received.inc((endpoint, ), result.content_length or 0)
+        elif result.content is not None:
+            bytes_received.inc((endpoint, ), _body_size(result.content))
+        if result.request is not None:
+            bytes_sent.inc(
+                (endpoint, ),
+                _body_size(getattr(result.request, 'body', None))
+            )
+
+    requests_total.inc((endpoint, method.upper(), status, errcode))
+    request_duration.observe(duration, (endpoint, ))
+
+
+def observe_retry(url, reason):
+    if default_registry.enabled:
+        retries_total.inc((_endpoint(url), reason))
+
+
+def observe_token_refresh(appid, duration, succeeded):
+    if not default_registry.enabled:
+        return
+
+    token_refreshes_total.inc(
+        (appid, u'success' if succeeded else u'failure')
+    )
+    token_refresh_duration.observe(duration, (appid, ))
+
+
+class timer(object):
+    """Observe the duration of the block or function into histogram, the
+    last label is set to success or failure by the outcome
+
+    .. code-block:: python
+
+        >>>with metrics.timer(metrics.crypto_duration, 'encrypt'):
+        ...    encrypt()
+
+        >>>@metrics.timer(metrics.crypto_duration, 'encrypt')
+        ...def encrypt():
+        ...    pass
+
+    """
+
+    def __init__(self, histogram, *labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.start = None
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def _timed(*args, **kwargs):
+            with timer(self.histogram, *self.labels):
+                return func(*args, **kwargs)
+        return _timed
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if default_registry.enabled:
+            self.histogram.observe(
+                time.time() - self.start,
+                self.labels + (
+                    u'success' if exc_type is None else u'failure',
+                )
+            )
+        return False
+
+
+def snapshot():
+    return default_registry.snapshot()
+
+
+def to_prometheus():
+    return default_registry.to_prometheus()
+
+
+def enable():
+    default_registry.enabled = True
+
+
+def disable():
+    default_registry.enabled = False
@@ -3,7 +3,10 @@
 
 from copy import copy
 
+from . import jsonbackend
 from .api import Api
+from .result import build_from
+from .mediacache import content_digest, media_expires_at
 from .exceptions import RequestException
 from .settings import AUTH_EXPIRED_CODES
 
@@ -11,12 +14,35 @@ from .settings import AUTH_EXPIRED_CODES
 __all__ = ['formp']
 
 
+def _media_id_key(media_type):
+    # the thumb upload returns thumb_media_id instead of media_id
+    if media_type == 'thumb':
+        return 'thumb_media_id'
+    return 'media_id'
+
+
 class MpApi(Api):
 
     AUTH_QS_KEY = 'access_token'
 
-    def __init__(self, mp_access_token, auth_update_callback=None, **kwargs):
-        if mp_access_token is None or len(mp_access_token) == 0:
+    def __init__(self, mp_access_token, auth_update_callback=None,
+                 token_manager=None, media_cache=None, appid=None,
+                 **kwargs):
+        """
+        Args:
+          mp_access_token: access token, can be None if token_manager set
+          auth_update_callback: callable return new access token when the
+            token expired
+          token_manager: AccessTokenManager, provides the token and refresh
+            it instead of auth_update_callback
+          media_cache: MediaCache of the temporary media uploaded
+          appid: appid of the media cache key, default is the appid of
+            token_manager
+
+        """
+        if token_manager is None and (
+            mp_access_token is None or len(mp_access_token) == 0
+        ):
             raise ValueError('access_token not valid')
 
         super(MpApi, self).__init__(**kwargs)
@@ -24,12 +50,34 @@ class MpApi(Api):
         self.__options = copy(kwargs)
         self._auth_token = mp_access_token
         self._auth_update_callback = auth_update_callback
+        self._token_manager = token_manager
+        self._media_cache = media_cache
+        self._appid = appid
+        if appid is None and token_manager is not None:
+            self._appid = token_manager.appid
+
+        if media_cache is not None and self._appid is None:
+            raise ValueError('appid is required by media_cache')
+
+    def _cache_scope(self):
+        if self._appid is None:
+            return super(MpApi, self)._cache_scope()
+        return self._appid
+
+    def _current_auth_token(self):
+        if self._token_manager is not None:
+            return self._token_manager.get_token()
+
+        return self._auth_token
 
     def _prepare_param_dict(self, params_dict):
+        return self._set_auth_token(params_dict, self._current_auth_token())
+
+    def _set_auth_token(self, params_dict, auth_token):
         if params_dict is None:
-            return {self.AUTH_QS_KEY: self._auth_token}
+            return {self.AUTH_QS_KEY: auth_token}
         else:
-            params_dict[self.AUTH_QS_KEY] = self._auth_token
+            params_dict[self.AUTH_QS_KEY] = auth_token
             return params_dict
 
     def _retry(self, result, method, url, params_dict, **kwargs):
@@ -37,14 +85,26 @@ class MpApi(Api):
         When access token expired, update and then retry
 
         """
-        if result.is_failed and result.errcode in AUTH_EXPIRED_CODES:
-            new_auth_token = self._update_auth(result.response)
-            if new_auth_token == self._auth_token:
+        is_auth_expired = all([
+            result.is_failed,
+            result.errcode in AUTH_EXPIRED_CODES
+        ])
+        # the body is rewound only when it is sent again
+        if is_auth_expired and self._rewind_body(kwargs):
+            stale_auth_token = (params_dict or {}).get(
+                self.AUTH_QS_KEY,
+                self._auth_token
+            )
+            new_auth_token = self._update_auth(
+                result.response,
+                stale_auth_token
+            )
+            if new_auth_token == stale_auth_token:
                 return result
             else:
                 self._auth_token = new_auth_token
                 params = self._prepare_param_dict(params_dict)
-                return self._execute_request(
+                return self._guarded_execute_request(
                     method,
                     url,
                     params_dict=params,
@@ -53,22 +113,126 @@ class MpApi(Api):
         else:
             return result
 
+    def upload_media(self, media_type, media, **kwargs):
+        """Upload the temporary media, see Api.upload(). The media_id of
+        the same content is returned from the media cache if set, until
+        the media expires
+
+        Args:
+          media_type: image, voice, video or thumb
+          media: path, file object, bytes, or tuple of (filename, source[,
+            content_type[, length]])
+
+        """
+        digest, cached_result = self._lookup_media_cache(media_type, media)
+        if cached_result is not None:
+            return cached_result
+
+        result = self.upload(
+            'media/upload',
+            {'media': media},
+            type=media_type,
+            **kwargs
+        )
+        self._cache_media(media_type, digest, result)
+        return result
+
+    def _lookup_media_cache(self, media_type, media):
+        """
+        Returns:
+          tuple of (content digest, the cached result), digest is None if
+          the media is not cached
+
+        """
+        if self._media_cache is None:
+            return None, None
+
+        digest = content_digest(media_type, media)
+        if digest is None:
+            return None, None
+
+        media_id = self._media_cache.get(self._appid, digest)
+        if media_id is None:
+            return digest, None
+
+        return digest, build_from({
+            'type': media_type,
+            _media_id_key(media_type): media_id
+        })
+
+    def _cache_media(self, media_type, digest, result):
+        if digest is None or result.is_failed:
+            return
+
+        media_id = result.json.get(_media_id_key(media_type))
+        if media_id is not None:
+            self._media_cache.set(
+                self._appid,
+                digest,
+                media_id,
+                media_expires_at(result)
+            )
+
+    def add_material(self, media_type, media, description=None, **kwargs):
+        """Upload the permanent material, see Api.upload()
+
+        Args:
+          description: dict of title and introduction, required by video
+
+        """
+        fields = None
+        if description is not None:
+            fields = {'description': jsonbackend.dumps(description)}
+
+        return self.upload(
+            'material/add_material',
+            {'media': media},
+            fields,
+            type=media_type,
+            **kwargs
+        )
+
+    def get_media(self, media_id, dest=None, **kwargs):
+        """Download the temporary media, see Api.download()"""
+        return self.download('media/get', dest, media_id=media_id, **kwargs)
+
+    def get_material(self, media_id, dest=None, **kwargs):
+        """Download the permanent material, the news and video answer JSON,
+        see Api.download()
+        """
+        return self.download(
+            'material/get_material',
+            dest,
+            method='POST',
+            json={'media_id': media_id},
+            **kwargs
+        )
+
     def group(self, **kwargs):
         cp_options = copy(self.__options)
         cp_options.update(kwargs)
         cp_options.setdefault('auth_update_callback', None)
+        cp_options.setdefault('token_manager', self._token_manager)
+        cp_options.setdefault('media_cache', self._media_cache)
+        cp_options.setdefault('appid', self._appid)
         return self.__class__(self._auth_token, **cp_options)
 
-    def _update_auth(self, response):
-        if self._auth_update_callback is None:
+    def _update_auth(self, response, stale_auth_token=None):
+        if self._token_manager is not None:
+            update_func = self._token_manager.refresh
+            update_args = (stale_auth_token, )
+        elif self._auth_update_callback is not None:
+            update_func = self._auth_update_callback
+            update_args = ()
+        else:
             return self._auth_token
 
         try:
-            new_auth_token = self._auth_update_callback()
+            new_auth_token = update_func(*update_args)
         except Exception as auth_update_error:
             raise RequestException(
                 u'Update auth failed use {}'.format(
-                    self._auth_update_callback.__name__
+                    getattr(update_func, '__name__', update_func)
                 ),
                 auth_update_error,
                 response=response
@@ -77,5 +241,5 @@ class MpApi(Api):
             return new_auth_token
 
 
-def formp(mp_access_token, **kwargs):
+def formp(mp_access_token=None, **kwargs):
     return MpApi(mp_access_token, **kwargs)
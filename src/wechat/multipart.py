@@ -0,0 +1,367 @@
+# -*- encoding: utf-8
+
+"""
+Streaming multipart/form-data body for the media upload, the files are read
+part by part while the body is sent, the whole body is never copied in
+memory and its length is known ahead, so the request is sent with
+Content-Length instead of chunked.
+
+The file can be:
+
+* path: mapped into memory by mmap
+* file object opened in binary mode: read from its current position
+* bytes
+* iterable of bytes: the length is required and the body can not be
+  rewound once read
+
+Usage:
+
+.. code-block:: python
+
+    >>>from wechat.multipart import MultipartEncoder
+    >>>encoder = MultipartEncoder(
+    ...     fields={'description': '{"title": "video"}'},
+    ...     files={'media': '/data/video.mp4'}
+    ... )
+    >>>requests.post(url, data=encoder, headers={
+    ...     'Content-Type': encoder.content_type
+    ... })
+
+"""
+
+import os
+import uuid
+import mmap
+import mimetypes
+
+from six import iteritems
+
+from .compat import bytes, str, is_py2
+
+
+__all__ = ['MultipartEncoder']
+
+
+_CRLF = b'\r\n'
+
+
+def _to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    if not isinstance(value, str):
+        value = u'{}'.format(value)
+    return value.encode('utf-8')
+
+
+def _quote(value):
+    return _to_bytes(value).replace(b'"', b'%22').replace(
+        b'\r',
+        b'%0D'
+    ).replace(b'\n', b'%0A')
+
+
+def _view(data):
+    # py2 mmap only has the old buffer interface and can not be wrapped by
+    # memoryview, slicing it already copies the slice only
+    if is_py2:
+        return data
+    return memoryview(data)
+
+
+class _BytesSource(object):
+
+    rewindable = True
+
+    def __init__(self, data):
+        self._data = _view(data)
+        self.length = len(data)
+        self._offset = 0
+
+    def read(self, size):
+        chunk = bytes(self._data[self._offset:self._offset + size])
+        self._offset += len(chunk)
+        return chunk
+
+    def rewind(self):
+        self._offset = 0
+
+    def close(self):
+        if hasattr(self._data, 'release'):
+            self._data.release()
+
+
+class _MmapSource(_BytesSource):
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(
+                self._file.fileno(),
+                0,
+                access=mmap.ACCESS_READ
+            )
+        except ValueError:
+            # empty file can not be mapped
+            self._mmap = None
+        super(_MmapSource, self).__init__(
+            self._mmap if self._mmap is not None else b''
+        )
+
+    def close(self):
+        super(_MmapSource, self).close()
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+
+class _FileSource(object):
+
+    rewindable = True
+
+    def __init__(self, fileobj):
+        self._file = fileobj
+        self._start = fileobj.tell()
+        fileobj.seek(0, os.SEEK_END)
+        self.length = fileobj.tell() - self._start
+        fileobj.seek(self._start)
+        self._left = self.length
+
+    def read(self, size):
+        chunk = self._file.read(min(size, self._left))
+        self._left -= len(chunk)
+        return chunk
+
+    def rewind(self):
+        self._file.seek(self._start)
+        self._left = self.length
+
+    def close(self):
+        pass
+
+
+class _IterableSource(object):
+
+    rewindable = False
+
+    def __init__(self, iterable, length):
+        self._iterator = iter(iterable)
+        self.length = length
+        self._left = length
+        self._buffer = b''
+
+    def read(self, size):
+        """
+        Raises:
+          ValueError: the iterable is shorter or longer than the length, the
+            body sent would not match its Content-Length
+
+        """
+        size = min(size, self._left)
+        while len(self._buffer) < size:
+            chunk = next(self._iterator, None)
+            if chunk is None:
+                raise ValueError(
+                    'iterable source is shorter than its length {}'.format(
+                        self.length
+                    )
+                )
+            self._buffer += chunk
+
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        self._left -= len(chunk)
+        if self._left == 0 and self._has_more():
+            raise ValueError(
+                'iterable source is longer than its length {}'.format(
+                    self.length
+                )
+            )
+        return chunk
+
+    def _has_more(self):
+        if len(self._buffer) > 0:
+            return True
+
+        for chunk in self._iterator:
+            if len(chunk) > 0:
+                self._buffer = chunk
+                return True
+        return False
+
+    def rewind(self):
+        raise ValueError('iterable source can not be rewound')
+
+    def close(self):
+        pass
+
+
+def _build_source(source, length=None):
+    if isinstance(source, bytes):
+        return _BytesSource(source)
+
+    if isinstance(source, str):
+        return _MmapSource(source)
+
+    if hasattr(source, 'read'):
+        return _FileSource(source)
+
+    if length is None:
+        raise ValueError('length of the iterable source is required')
+
+    return _IterableSource(source, length)
+
+
+def _guess_filename(source):
+    if isinstance(source, str):
+        return os.path.basename(source)
+
+    name = getattr(source, 'name', None)
+    if isinstance(name, str):
+        return os.path.basename(name)
+
+    return u'file'
+
+
+class MultipartEncoder(object):
+    """
+    Args:
+      fields: dict or list of (name, value) of the form fields
+      files: dict or list of (name, file), file is the path, file object,
+        bytes, or tuple of (filename, source[, content_type[, length]]),
+        length is required by the iterable source
+      boundary: multipart boundary, default is random
+
+    """
+
+    def __init__(self, fields=None, files=None, boundary=None):
+        self.boundary = boundary or uuid.uuid4().hex
+        self.content_type = 'multipart/form-data; boundary={}'.format(
+            self.boundary
+        )
+
+        self._parts = []
+        try:
+            for name, value in self._items(fields):
+                self._add_part(
+                    self._build_headers(name),
+                    _BytesSource(_to_bytes(value))
+                )
+
+            for name, value in self._items(files):
+                self._add_file(name, value)
+        except Exception:
+            self.close()
+            raise
+
+        self._parts.append(_BytesSource(
+            b'--' + _to_bytes(self.boundary) + b'--' + _CRLF
+        ))
+        self._length = sum(part.length for part in self._parts)
+        self._index = 0
+        self._read = 0
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def rewindable(self):
+        return all(part.rewindable for part in self._parts)
+
+    def read(self, size=-1):
+        """
+        Returns:
+          at most size bytes of the body, all the left if size < 0, b'' at
+          the end of the body
+
+        """
+        if size is None or size < 0:
+            size = self._length - self._read
+
+        chunks = []
+        while size > 0 and self._index < len(self._parts):
+            chunk = self._parts[self._index].read(size)
+            if len(chunk) == 0:
+                self._index += 1
+                continue
+
+            chunks.append(chunk)
+            size -= len(chunk)
+
+        chunk = b''.join(chunks)
+        self._read += len(chunk)
+        return chunk
+
+    def rewind(self):
+        """Rewind to the start of the body, so that it can be sent again
+
+        Returns:
+          False if the body was read and can not be rewound
+
+        """
+        if self._read == 0:
+            return True
+
+        if not self.rewindable:
+            return False
+
+        for part in self._parts:
+            part.rewind()
+        self._index = 0
+        self._read = 0
+        return True
+
+    def close(self):
+        """close the memory maps and the files opened by path, the file
+        objects passed in are left open
+        """
+        for part in self._parts:
+            part.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def _items(values):
+        if values is None:
+            return []
+        if isinstance(values, dict):
+            return list(iteritems(values))
+        return list(values)
+
+    def _add_file(self, name, value):
+        if isinstance(value, tuple):
+            filename, source = value[0], value[1]
+            content_type = value[2] if len(value) > 2 else None
+            length = value[3] if len(value) > 3 else None
+        else:
+            filename, source = _guess_filename(value), value
+            content_type = length = None
+
+        if content_type is None:
+            content_type = mimetypes.guess_type(filename)[0] or (
+                'application/octet-stream'
+            )
+
+        self._add_part(
+            self._build_headers(name, filename, content_type),
+            _build_source(source, length)
+        )
+
+    def _add_part(self, headers, source):
+        self._parts.append(_BytesSource(headers))
+        self._parts.append(source)
+        self._parts.append(_BytesSource(_CRLF))
+
+    def _build_headers(self, name, filename=None, content_type=None):
+        disposition = b'Content-Disposition: form-data; name="' + _quote(
+            name
+        ) + b'"'
+        if filename is not None:
+            disposition += b'; filename="' + _quote(filename) + b'"'
+
+        lines = [b'--' + _to_bytes(self.boundary), disposition]
+        if content_type is not None:
+            lines.append(b'Content-Type: ' + _to_bytes(content_type))
+        return _CRLF.join(lines) + _CRLF + _CRLF
@@ -4,10 +4,13 @@ import re
 import time
 from copy import copy
 
+from six import iteritems
+
 from .api import Api
 from . import settings
 from . import sign
 from . import utils
+from . import jsonbackend
 
 
 __all__ = ['for_merchant', 'build_jspay_params']
@@ -92,6 +95,9 @@ class Wxpay(Api):
         if client_cert is not None and client_key is not None:
             self.session.cert = (client_cert, client_key)
 
+    def _cache_scope(self):
+        return self._appid, self._mchid
+
     def unifiedorder(self, **kwargs):
         """
         `unifiedorder <https://pay.weixin.qq.com/wiki/doc/api/jsapi.php?chapter=9_1>`_
@@ -109,11 +115,16 @@ class Wxpay(Api):
             raise ValueError('transaction_id and out_trade_no be None both')
 
         if transaction_id is not None:
-            body = self._build_xml_body(transaction_id=transaction_id)
+            query = {'transaction_id': transaction_id}
         else:
-            body = self._build_xml_body(out_trade_no=out_trade_no)
+            query = {'out_trade_no': out_trade_no}
 
-        return self.post('orderquery', data=body)
+        body = self._build_xml_body(**query)
+        return self.post(
+            'orderquery',
+            data=body,
+            coalesce_key=self._build_coalesce_key(query)
+        )
 
     def closeorder(self, out_trade_no):
         """
@@ -156,7 +167,11 @@ class Wxpay(Api):
             )
 
         body = self._build_xml_body(**kwargs)
-        return self.post('refundquery', data=body)
+        return self.post(
+            'refundquery',
+            data=body,
+            coalesce_key=self._build_coalesce_key(kwargs)
+        )
 
     def downloadbill(self, **kwargs):
         raise NotImplementedError()
@@ -179,9 +194,17 @@ class Wxpay(Api):
 
     def _build_xml_body(self, **kwargs):
         params = copy(kwargs)
+        for key, value in iteritems(params):
+            if type(value) in (dict, list):
+                # like detail and scene_info, the fields in JSON, signed as
+                # they are sent
+                params[key] = jsonbackend.dumps(value)
         params['sign'] = self._sign(params)
-        body_str = utils.serialize_dict_to_xml(**params)
-        return body_str.encode(settings.ENCODING)
+        return utils.serialize_to_xml_bytes(params)
+
+    def _build_coalesce_key(self, query):
+        # the signed body has random nonce_str, identify query by its fields
+        return (self._appid, self._mchid) + tuple(sorted(query.items()))
 
     def _build_secapi_path(self, api_path):
         uri = u'{}/{}'.format(self.SECAPI_BASE_URL, api_path)
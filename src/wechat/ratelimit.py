@@ -0,0 +1,313 @@
+# -*- encoding: utf-8
+
+"""
+Client side rate limit, wechat enforces per api quotas (errcode 45009 etc.),
+burst calls beyond the quota only get errors and retries make it worse.
+
+Usage:
+
+.. code-block:: python
+
+    >>>from wechat import mpapi, ratelimit
+    >>>limiter = ratelimit.RateLimiter(
+    ...     rate=100,
+    ...     rules={'message/custom/send': 20},
+    ...     name='your appid',
+    ...     backend=ratelimit.FileBucketBackend('/var/run/wechat'),
+    ... )
+    >>>mp = mpapi.formp(access_token, rate_limiter=limiter)
+
+``rate`` is the budget (calls per second) shared by all the api of the
+limiter, ``rules`` set the budget of single api path. A limiter is usually
+created for one appid, the file backend makes all the processes on the host
+share the same buckets.
+
+"""
+
+import os
+import time
+import struct
+import hashlib
+import threading
+
+from six import iteritems
+
+from .utils import ApiPathRules
+from .exceptions import RateLimitExceeded, DeadlineExceeded
+from .settings import RATE_LIMIT_MAX_WAIT
+
+
+__all__ = ['TokenBucket', 'FileTokenBucket', 'FileBucketBackend',
+           'RateLimiter']
+
+
+class TokenBucket(object):
+    """Token bucket kept in process memory
+
+    Args:
+      rate: tokens refilled per second
+      capacity: max tokens in bucket(max burst), default as rate
+
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError('rate must > 0')
+
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._tokens = self.capacity
+        self._updated_at = time.time()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, tokens=1):
+        """
+        Returns:
+          0 if tokens acquired, else seconds to wait for enough tokens
+
+        """
+        with self._lock:
+            self._tokens, self._updated_at, wait = self._take(
+                self._tokens,
+                self._updated_at,
+                tokens
+            )
+            return wait
+
+    def refund(self, tokens=1):
+        with self._lock:
+            self._tokens = min(self._tokens + tokens, self.capacity)
+
+    def _take(self, current_tokens, updated_at, tokens):
+        now = time.time()
+        current_tokens = min(
+            self.capacity,
+            current_tokens + max(now - updated_at, 0) * self.rate
+        )
+
+        if current_tokens >= tokens:
+            return current_tokens - tokens, now, 0
+
+        return current_tokens, now, (tokens - current_tokens) / self.rate
+
+
+class FileTokenBucket(TokenBucket):
+    """Token bucket kept in file and guarded by flock, shared by all the
+    processes on the host
+    """
+
+    _STATE_FORMAT = '!dd'
+
+    def __init__(self, path, rate, capacity=None):
+        super(FileTokenBucket, self).__init__(rate, capacity)
+        self.path = path
+
+    def try_acquire(self, tokens=1):
+        def take(current_tokens, updated_at):
+            return self._take(current_tokens, updated_at, tokens)
+
+        return self._update(take)
+
+    def refund(self, tokens=1):
+        def give_back(current_tokens, updated_at):
+            return (
+                min(current_tokens + tokens, self.capacity),
+                updated_at,
+                0
+            )
+
+        self._update(give_back)
+
+    def _update(self, update_func):
+        import fcntl
+
+        state_size = struct.calcsize(self._STATE_FORMAT)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            state = os.read(fd, state_size)
+            if len(state) == state_size:
+                current_tokens, updated_at = struct.unpack(
+                    self._STATE_FORMAT,
+                    state
+                )
+            else:
+                current_tokens, updated_at = self.capacity, time.time()
+
+            current_tokens, updated_at, wait = update_func(
+                current_tokens,
+                updated_at
+            )
+
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.write(fd, struct.pack(
+                self._STATE_FORMAT,
+                current_tokens,
+                updated_at
+            ))
+            return wait
+        finally:
+            os.close(fd)
+
+
+def _memory_backend(key, rate, capacity):
+    return TokenBucket(rate, capacity)
+
+
+class FileBucketBackend(object):
+    """Build FileTokenBucket in directory, bucket file named by the limiter
+    name and api path
+    """
+
+    def __init__(self, directory):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.directory = directory
+
+    def __call__(self, key, rate, capacity):
+        filename = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return FileTokenBucket(
+            os.path.join(self.directory, '{}.bucket'.format(filename)),
+            rate,
+            capacity
+        )
+
+
+class RateLimiter(object):
+    """
+    Args:
+      rate: calls per second shared by all the api, None for unlimited
+      capacity: burst of rate
+      rules: dict of api path and its budget, budget is rate or tuple of
+        (rate, capacity), api path is matched with the tail of request url
+      mode: BLOCK to wait for budget, FAIL_FAST to raise RateLimitExceeded
+      max_wait: max seconds to wait in BLOCK mode, None for no limit
+      name: limiter name, usually the appid, which is part of bucket key
+      backend: callable(key, rate, capacity) to build bucket, default
+        is TokenBucket in process memory
+
+    """
+
+    BLOCK = 'block'
+    FAIL_FAST = 'fail_fast'
+
+    _GLOBAL_KEY = u'*'
+
+    def __init__(self, rate=None, capacity=None, rules=None, mode=BLOCK,
+                 max_wait=RATE_LIMIT_MAX_WAIT, name=u'', backend=None):
+        if mode not in (self.BLOCK, self.FAIL_FAST):
+            raise ValueError('mode must be BLOCK or FAIL_FAST')
+
+        self.mode = mode
+        self.max_wait = max_wait
+        self.name = name
+        self._backend = backend or _memory_backend
+
+        self._global_bucket = None
+        if rate is not None:
+            self._global_bucket = self._build_bucket(
+                self._GLOBAL_KEY,
+                rate,
+                capacity
+            )
+
+        path_buckets = {}
+        for api_path, budget in iteritems(rules or {}):
+            if isinstance(budget, tuple):
+                path_rate, path_capacity = budget
+            else:
+                path_rate, path_capacity = budget, None
+
+            api_path = ApiPathRules.normalize(api_path)
+            path_buckets[api_path] = self._build_bucket(
+                api_path,
+                path_rate,
+                path_capacity
+            )
+        self._rules = ApiPathRules(path_buckets)
+
+    def acquire(self, url, deadline=None):
+        """
+        Args:
+          url: request url
+          deadline: Deadline of the call, the wait never goes past it
+
+        Raises:
+          RateLimitExceeded
+          DeadlineExceeded
+
+        """
+        waited = 0
+        while True:
+            wait = self.try_acquire(url, waited, deadline)
+            if wait == 0:
+                return waited
+
+            time.sleep(wait)
+            waited += wait
+
+    def try_acquire(self, url, waited=0, deadline=None):
+        """
+        Args:
+          url: request url
+          waited: seconds already waited for this call
+          deadline: Deadline of the call, None for no deadline
+
+        Returns:
+          0 if acquired, else seconds to wait before next try
+
+        Raises:
+          RateLimitExceeded: in FAIL_FAST mode, or wait exceed max_wait
+          DeadlineExceeded: wait goes past the deadline
+
+        """
+        path_bucket = self._match_bucket(url)
+        buckets = [b for b in (path_bucket, self._global_bucket) if b]
+
+        acquired = []
+        wait = 0
+        for bucket in buckets:
+            wait = bucket.try_acquire()
+            if wait > 0:
+                break
+            acquired.append(bucket)
+
+        if wait == 0:
+            return 0
+
+        for bucket in acquired:
+            bucket.refund()
+
+        if self.mode == self.FAIL_FAST:
+            raise RateLimitExceeded(u'rate limit exceeded: {}'.format(url))
+
+        if self.max_wait is not None and waited + wait > self.max_wait:
+            raise RateLimitExceeded(
+                u'rate limit exceeded, wait {:.3f}s > {}s: {}'.format(
+                    waited + wait,
+                    self.max_wait,
+                    url
+                )
+            )
+
+        if deadline is not None and wait > deadline.remaining():
+            raise DeadlineExceeded(
+                u'deadline {}s exceeded, rate limit wait {:.3f}s: {}'.format(
+                    deadline.budget,
+                    wait,
+                    url
+                )
+            )
+
+        return wait
+
+    def _match_bucket(self, url):
+        return self._rules.match(url)
+
+    def _build_bucket(self, key, rate, capacity):
+        return self._backend(
+            u'{}:{}'.format(self.name, key),
+            rate,
+            capacity
+        )
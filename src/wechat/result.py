@@ -4,24 +4,46 @@
 import logging
 from bs4 import BeautifulSoup
 
-from .compat import json, JSONDecodeError, bytes, str
-from .settings import ENCODING
+from . import jsonbackend
+from .xmlparser import parse_flat_xml
+from .compat import bytes, str
+from .settings import ENCODING, DOWNLOAD_CHUNK_SIZE, DOWNLOAD_SNIFF_BYTES
 
 
-__all__ = ['build_from_response', 'build_from']
+__all__ = ['build_from_response', 'build_from', 'build_from_exception',
+           'build_from_stream']
 
 
 class RequestResult(object):
 
+    __slots__ = ('_json_result', '_text', '_content', '_status_code',
+                 '_response', '_request')
+
     _XML_SUCCESS_CODE = u'SUCCESS'
 
-    def __init__(self, json, text, response=None):
-        object.__setattr__(self, "_json_result", json or {})
+    def __init__(self, json, text, response=None, content=None):
+        """
+        Args:
+          json: parsed body, None to parse it from content when first
+            accessed
+          content: body in bytes, text is decoded from it when first
+            accessed if text is None
+
+        """
+        if content is None:
+            json = json or {}
+        object.__setattr__(self, "_json_result", json)
         object.__setattr__(self, "_response", response)
 
         if isinstance(text, bytes):
             text = text.decode(ENCODING)
         object.__setattr__(self, "_text", text)
+        object.__setattr__(self, "_content", content)
+        object.__setattr__(
+            self,
+            "_status_code",
+            getattr(response, 'status_code', None)
+        )
 
         if response is not None:
             object.__setattr__(self, "_request", response.request)
@@ -30,24 +52,47 @@ class RequestResult(object):
 
     @property
     def response(self):
+        """Requests Response object, None if detached"""
         return self._response
 
     @property
     def request(self):
         return self._request
 
+    @property
+    def status_code(self):
+        """HTTP status code, None if not built from response"""
+        return self._status_code
+
     @property
     def json(self):
+        if self._json_result is None:
+            object.__setattr__(self, "_json_result", _loads_content(
+                self._content
+            ))
         return self._json_result
 
     @property
     def text(self):
         """Content of the response, in unicode.
         """
-        if self.response is None:
-            return self._text
-        else:
-            return self.response.text
+        if self._text is None:
+            if self._content is not None:
+                object.__setattr__(
+                    self,
+                    "_text",
+                    self._content.decode(ENCODING, 'replace')
+                )
+            elif self.response is not None:
+                return self.response.text
+        return self._text
+
+    @property
+    def content(self):
+        """Content of the response in bytes, None if unknown"""
+        if self._content is not None:
+            return self._content
+        return getattr(self.response, 'content', None)
 
     @property
     def is_failed(self):
@@ -71,9 +116,27 @@ class RequestResult(object):
     def __setattr__(self, k, v):
         raise AttributeError()
 
+    def detach(self):
+        """Release the Response object, the body, status code and the parsed
+        json are kept
+
+        Returns:
+          the result itself
+        """
+        if self._response is None:
+            return self
+
+        if self._content is None:
+            object.__setattr__(self, "_content", self._response.content)
+        object.__setattr__(self, "_response", None)
+        object.__setattr__(self, "_request", None)
+        return self
+
 
 class RequestErrorResult(RequestResult):
 
+    __slots__ = ()
+
     errcode_field = u'errcode'
     errmsg_field = u'errmsg'
 
@@ -104,7 +167,133 @@ class RequestErrorResult(RequestResult):
         }
 
 
-def _build_from_xml(xml_text, response):
+class RequestExceptionResult(RequestErrorResult):
+    """Result of the request which raised exception, like timeout,
+    connection error
+    """
+
+    __slots__ = ('_exception', )
+
+    EXCEPTION_ERRCODE = u'REQUEST_EXCEPTION'
+
+    def __init__(self, exception):
+        super(RequestExceptionResult, self).__init__(
+            self.build_error_json(self.EXCEPTION_ERRCODE, str(exception)),
+            None,
+            getattr(exception, 'response', None)
+        )
+        object.__setattr__(self, '_exception', exception)
+
+    @property
+    def exception(self):
+        return self._exception
+
+
+class StreamResult(RequestResult):
+    """Result of the streaming download, the body is not read until
+    iter_content() or save(), the connection is released when the body is
+    read to the end or the result is closed
+
+    .. code-block:: python
+
+        >>>with mp.download('media/get', media_id=media_id) as result:
+        ...    for chunk in result.iter_content():
+        ...        upload(chunk)
+
+    """
+
+    __slots__ = ('_head', '_size')
+
+    def __init__(self, response, head=b''):
+        super(StreamResult, self).__init__({}, None, response)
+        object.__setattr__(self, '_head', head)
+        object.__setattr__(self, '_size', 0)
+
+    @property
+    def text(self):
+        return None
+
+    @property
+    def content(self):
+        return None
+
+    @property
+    def content_type(self):
+        return self.response.headers.get('Content-Type')
+
+    @property
+    def content_length(self):
+        length = self.response.headers.get('Content-Length')
+        return int(length) if length is not None else None
+
+    @property
+    def filename(self):
+        """filename in Content-Disposition, None if not set"""
+        disposition = self.response.headers.get('Content-Disposition', '')
+        for part in disposition.split(';'):
+            key, _, value = part.strip().partition('=')
+            if key.lower() == 'filename':
+                return value.strip('"')
+        return None
+
+    @property
+    def size(self):
+        """bytes of the body read so far"""
+        return self._size
+
+    def iter_content(self, chunk_size=DOWNLOAD_CHUNK_SIZE):
+        """
+        Returns:
+          iterator of the chunks of the body in bytes, can be iterated once
+
+        """
+        try:
+            if self._head:
+                object.__setattr__(self, '_size', len(self._head))
+                yield self._head
+
+            for chunk in self.response.iter_content(chunk_size):
+                object.__setattr__(self, '_size', self._size + len(chunk))
+                yield chunk
+        finally:
+            self.close()
+
+    def save(self, dest, chunk_size=DOWNLOAD_CHUNK_SIZE):
+        """Write the body to dest chunk by chunk
+
+        Args:
+          dest: file path, or file object opened in binary mode
+
+        Returns:
+          bytes written
+
+        """
+        if hasattr(dest, 'write'):
+            return self._write(dest, chunk_size)
+
+        with open(dest, 'wb') as dest_file:
+            return self._write(dest_file, chunk_size)
+
+    def close(self):
+        self.response.close()
+
+    def detach(self):
+        # the body is read from the response
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _write(self, dest_file, chunk_size):
+        for chunk in self.iter_content(chunk_size):
+            dest_file.write(chunk)
+        return self._size
+
+
+def _parse_xml_by_soup(xml_text):
     _json = {}
     soup = BeautifulSoup(xml_text, 'xml')
     for tag in soup.xml.children:
@@ -116,6 +305,15 @@ def _build_from_xml(xml_text, response):
             k = k.decode(ENCODING)
 
         _json[k] = tag.text
+    return _json
+
+
+def _build_from_xml(xml_text, response):
+    try:
+        _json = parse_flat_xml(xml_text)
+    except ValueError as xml_error: # noqa
+        # BeautifulSoup is tolerant of the malformed xml
+        _json = _parse_xml_by_soup(xml_text)
 
     if u'return_code' in _json:
         if _json[u'return_code'] != RequestResult._XML_SUCCESS_CODE:
@@ -140,7 +338,7 @@ def _build_from_json_str(json_text, response):
     if isinstance(json_text, bytes):
         json_text = json_text.decode(ENCODING)
 
-    _json = json.loads(json_text)
+    _json = jsonbackend.loads(json_text)
     if RequestErrorResult.is_error_json(_json):
         return RequestErrorResult(_json, json_text, response)
     else:
@@ -171,7 +369,7 @@ def build_from(from_x, response=None):
     if from_x.startswith(u'{') and from_x.endswith(u'}'):
         try:
             return _build_from_json_str(from_x, response)
-        except JSONDecodeError as json_error: # noqa
+        except ValueError as json_error: # noqa
             pass
 
     if from_x.startswith(u'<xml') and from_x.endswith(u'</xml>'):
@@ -183,25 +381,103 @@ def build_from(from_x, response=None):
     return RequestResult({}, from_x, response)
 
 
-def build_from_response(response):
+def build_from_exception(exception):
+    return RequestExceptionResult(exception)
+
+
+def _loads_content(content):
+    if content is None:
+        return {}
+
+    try:
+        return jsonbackend.loads(content)
+    except ValueError as json_error: # noqa
+        logging.getLogger('wechat').warning('JSON parse error', exc_info=True)
+        return {}
+
+
+_ERRCODE_MARK = u'"{}"'.format(RequestErrorResult.errcode_field).encode(
+    ENCODING
+)
+
+
+def _build_lazy_from_response(response):
+    content = response.content
+    if all([
+        200 <= response.status_code < 300,
+        content.lstrip().startswith(b'{'),
+        _ERRCODE_MARK not in content
+    ]):
+        # no errcode, so it is succeeded without parsing the body
+        return RequestResult(None, None, response, content).detach()
+
+    return build_from_response(response).detach()
+
+
+def build_from_response(response, lazy=False):
+    """
+    Args:
+      lazy: keep the body in bytes only and release the response, the text
+        and the json of the succeeded JSON body are parsed when first
+        accessed
+
+    Returns:
+      RequestResult object
+
+    """
     response.encoding = ENCODING
+    if lazy:
+        return _build_lazy_from_response(response)
 
+    text = response.text
     if response.status_code >= 300 or response.status_code < 200:
         errcode = response.status_code
-        errmsg = response.text
+        errmsg = text
         if errmsg.startswith('<html>') and errmsg.endswith('</thml>'):
             errmsg = ''
 
         error_json = RequestErrorResult.build_error_json(errcode, errmsg)
-        return RequestErrorResult(error_json, response.text, response)
+        return RequestErrorResult(error_json, text, response)
 
     try:
-        ret_json = response.json(encoding=ENCODING)
+        ret_json = jsonbackend.loads(text)
     except ValueError as json_error: # noqa
         logging.getLogger('wechat').warning('JSON parse error', exc_info=True)
-        return build_from(response.text, response)
+        result = build_from(text, response)
+        # the text is kept as the response, not stripped
+        object.__setattr__(result, "_text", text)
+        return result
     else:
         if RequestErrorResult.is_error_json(ret_json):
-            return RequestErrorResult(ret_json, response.text, response)
+            return RequestErrorResult(ret_json, text, response)
         else:
-            return RequestResult(ret_json, response.text, response)
+            return RequestResult(ret_json, text, response)
+
+
+def _is_json_body(response, head):
+    content_type = response.headers.get('Content-Type', '').lower()
+    if 'json' in content_type or content_type.startswith('text/'):
+        return True
+
+    # errors may be answered without a json content type
+    return head.lstrip().startswith(b'{"')
+
+
+def build_from_stream(response):
+    """build result of the response of stream request, the body is left
+    unread except the JSON body (the error with errcode, or the JSON answer
+    like the news of get_material), which is small and parsed as usual
+
+    Returns:
+      StreamResult, or RequestResult of the JSON body
+
+    """
+    if response.status_code >= 300 or response.status_code < 200:
+        return build_from_response(response)
+
+    head = response.raw.read(DOWNLOAD_SNIFF_BYTES, decode_content=True)
+    if _is_json_body(response, head):
+        response._content = head + response.content
+        return build_from_response(response)
+
+    return StreamResult(response, head)
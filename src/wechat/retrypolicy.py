@@ -0,0 +1,218 @@
+# -*- encoding: utf-8
+
+"""
+One retry policy for transport errors, HTTP status codes and wechat
+errcodes, replaces the urllib3 Retry of the shared adapters and the errcode
+-1 retry of MpOuthApi when it is set to the Api.
+
+Usage:
+
+.. code-block:: python
+
+    >>>from wechat import mpapi, retrypolicy
+    >>>policy = retrypolicy.RetryPolicy(
+    ...     max_retries=3,
+    ...     idempotent={'user/info/batchget': True, 'orderquery': True}
+    ... )
+    >>>mp = mpapi.formp(access_token, retry_policy=policy)
+
+Decisions:
+
+* connect errors: the request is not sent, always retry
+* other transport errors, status in ``retry_statuses`` and errcode in
+  ``retry_errcodes`` (-1 system busy): retry the idempotent request only,
+  GET is idempotent, the others are idempotent only when flagged, so the
+  POST like pay/refund is never retried blindly
+* errcode in ``fail_fast_errcodes`` (45009 api quota reached): no retry
+* auth expired errcodes (40001...): left to the ``_retry`` hook of Api,
+  which refreshes the access token and retries once
+
+Backoff is exponential with full jitter, ``uniform(0, min(backoff_max,
+backoff_factor * 2 ** retry))``. The retry budget caps the retries to a
+ratio of the requests, so retries never multiply the load of a degraded
+server.
+
+"""
+
+import time
+import random
+import threading
+
+from .utils import ApiPathRules
+from .exceptions import (ConnectionError, Timeout, RetryError,
+                         DeadlineExceeded, is_connect_error)
+from .settings import (RETRYS, RETRY_BACKOFF_FACTOR, RETRY_BACKOFF_MAX,
+                       RETRY_STATUS_FORCELIST, RETRY_ERRCODES,
+                       RETRY_FAIL_FAST_ERRCODES, RETRY_BUDGET_RATIO,
+                       RETRY_BUDGET_MIN_RETRIES, RETRY_BUDGET_WINDOW)
+
+
+__all__ = ['RetryPolicy', 'RetryBudget']
+
+
+_IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+
+
+class RetryBudget(object):
+    """Allow retries up to ``ratio`` of the requests plus ``min_retries`` in
+    the sliding window of ``window`` seconds
+
+    """
+
+    def __init__(self, ratio=RETRY_BUDGET_RATIO,
+                 min_retries=RETRY_BUDGET_MIN_RETRIES,
+                 window=RETRY_BUDGET_WINDOW):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = int(window)
+
+        self._lock = threading.Lock()
+        # per second slots of [second, requests, retries]
+        self._slots = [[0, 0, 0] for _ in range(self.window)]
+
+    def record_request(self):
+        with self._lock:
+            self._slot()[1] += 1
+
+    def try_spend(self):
+        """
+        Returns:
+          whether the retry is allowed
+        """
+        with self._lock:
+            requests, retries = self._totals()
+            if retries >= self.min_retries + self.ratio * requests:
+                return False
+
+            self._slot()[2] += 1
+            return True
+
+    def stats(self):
+        with self._lock:
+            requests, retries = self._totals()
+            return {'requests': requests, 'retries': retries}
+
+    def _slot(self):
+        second = int(time.time())
+        slot = self._slots[second % self.window]
+        if slot[0] != second:
+            slot[:] = [second, 0, 0]
+        return slot
+
+    def _totals(self):
+        oldest = int(time.time()) - self.window
+        requests = retries = 0
+        for second, slot_requests, slot_retries in self._slots:
+            if second > oldest:
+                requests += slot_requests
+                retries += slot_retries
+        return requests, retries
+
+
+class RetryPolicy(object):
+    """
+    Args:
+      max_retries: max retries of a call
+      backoff_factor: base seconds of the exponential backoff
+      backoff_max: max seconds of a backoff
+      retry_statuses: HTTP status codes to retry
+      retry_errcodes: wechat errcodes to retry, like -1 system busy
+      fail_fast_errcodes: wechat errcodes never retried, like 45009
+      idempotent: dict of api path and whether it is idempotent, the
+        method decides if api path not in it (GET is idempotent)
+      budget: RetryBudget, None for no budget
+
+    """
+
+    def __init__(self, max_retries=RETRYS,
+                 backoff_factor=RETRY_BACKOFF_FACTOR,
+                 backoff_max=RETRY_BACKOFF_MAX,
+                 retry_statuses=RETRY_STATUS_FORCELIST,
+                 retry_errcodes=RETRY_ERRCODES,
+                 fail_fast_errcodes=RETRY_FAIL_FAST_ERRCODES,
+                 idempotent=None, budget=None):
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.retry_statuses = frozenset(retry_statuses)
+        self.retry_errcodes = frozenset(retry_errcodes)
+        self.fail_fast_errcodes = frozenset(fail_fast_errcodes)
+        self.budget = budget if budget is not None else RetryBudget()
+        self._idempotent = ApiPathRules(idempotent)
+
+    def is_idempotent(self, method, url):
+        flag = self._idempotent.match(url)
+        if flag is not None:
+            return flag
+
+        return method.upper() in _IDEMPOTENT_METHODS
+
+    def should_retry(self, method, url, retries, error=None, result=None):
+        """
+        Args:
+          retries: count of retries already sent
+          error: exception raised by the last attempt
+          result: RequestResult of the last attempt
+
+        Returns:
+          whether to send another attempt
+
+        """
+        if retries >= self.max_retries:
+            return False
+
+        if error is not None:
+            retryable = self._is_retryable_error(method, url, error)
+        else:
+            retryable = self._is_retryable_result(method, url, result)
+
+        if not retryable:
+            return False
+
+        if self.budget is not None and not self.budget.try_spend():
+            return False
+
+        return True
+
+    def record_request(self):
+        if self.budget is not None:
+            self.budget.record_request()
+
+    def backoff(self, retries):
+        """
+        Returns:
+          seconds to sleep before the retry, full jitter
+        """
+        return random.uniform(0, min(
+            self.backoff_max,
+            self.backoff_factor * (2 ** retries)
+        ))
+
+    def _is_retryable_error(self, method, url, error):
+        if isinstance(error, DeadlineExceeded):
+            return False
+
+        if is_connect_error(error):
+            return True
+
+        return self.is_idempotent(method, url) and isinstance(
+            error,
+            (ConnectionError, Timeout, RetryError)
+        )
+
+    def _is_retryable_result(self, method, url, result):
+        if result is None or not result.is_failed:
+            return False
+
+        status_code = result.status_code
+        if status_code is not None and status_code in self.retry_statuses:
+            return self.is_idempotent(method, url)
+
+        errcode = result.json.get(result.errcode_field)
+        if errcode in self.fail_fast_errcodes:
+            return False
+
+        if errcode in self.retry_errcodes:
+            return self.is_idempotent(method, url)
+
+        return False
@@ -15,10 +15,80 @@ RETRYS = 3
 RETRY_BACKOFF_FACTOR = 0.1
 RETRY_STATUS_FORCELIST = frozenset([500, 502, 504])
 
+# retry policy
+RETRY_BACKOFF_MAX = 2
+RETRY_ERRCODES = frozenset([-1])  # system busy
+RETRY_FAIL_FAST_ERRCODES = frozenset([45009])  # api daily quota reached
+RETRY_BUDGET_RATIO = 0.2
+RETRY_BUDGET_MIN_RETRIES = 10
+RETRY_BUDGET_WINDOW = 10
+
+# connection pool, shared by all Api instances
+POOL_CONNECTIONS = 10
+POOL_MAXSIZE = 10
+POOL_BLOCK = False
+POOL_IDLE_TIMEOUT = 60
+
+# host pool
+HOST_POOL_EWMA_DECAY = 0.3
+HOST_POOL_ERROR_PENALTY = 10
+HOST_POOL_DOWN_TIME = 30
+
+# circuit breaker
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_COOL_DOWN = 30
+CIRCUIT_HALF_OPEN_MAX_CALLS = 1
+
+# deadline, the least timeout of an attempt near the deadline
+DEADLINE_MIN_ATTEMPT_TIMEOUT = 0.001
+
+# adaptive timeout, timeout = p99 x factor bounded by floor and ceiling
+ADAPTIVE_TIMEOUT_FACTOR = 2
+ADAPTIVE_TIMEOUT_FLOOR = 0.1
+ADAPTIVE_TIMEOUT_CEILING = 30
+ADAPTIVE_TIMEOUT_MIN_SAMPLES = 20
+ADAPTIVE_TIMEOUT_WINDOW = 1000
+# workers of the hedged attempts, not hedged when all the workers are busy
+HEDGE_MAX_WORKERS = 32
+
+# batch
+BATCH_MAX_CONCURRENCY = 10
+
+# rate limit
+RATE_LIMIT_MAX_WAIT = 60
+
+# response cache
+RESPONSE_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+# streaming download
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_SNIFF_BYTES = 64
+
+# streaming upload
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# media cache
+MEDIA_EXPIRES_IN = 3 * 24 * 3600
+MEDIA_CACHE_EXPIRY_MARGIN = 3600
+MEDIA_CACHE_MAX_ENTRIES = 10000
+
+# metrics
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1,
+                           2.5, 5, 10)
+
+# asyncio client
+ASYNC_CONNECTION_LIMIT = 100
+
+# message
+REPLY_NEWS_MAX_ARTICLES = 8
+
 
 # auth
 OAUTH_HOST = 'open.weixin.qq.com'
 AUTH_EXPIRED_CODES = frozenset([40001, 40014, 41001, 42001])
+TOKEN_REFRESH_AHEAD = 300
+TOKEN_REFRESH_LEASE_TTL = 10
+TOKEN_REFRESH_POLL_INTERVAL = 0.05
 
 # pay
 TRADE_TYPE_JSAPI = 'JSAPI'  # 公众号支付
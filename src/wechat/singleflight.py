@@ -0,0 +1,108 @@
+# -*- encoding: utf-8
+
+"""
+Coalesce identical in-flight calls, the first caller of a key executes the
+call, the callers arriving before it finishes wait and share its result (or
+its exception). A caller which waits longer than its own timeout executes
+the call by itself, so a hanging call does not hang all its followers.
+
+Used by Api.request when ``coalesce`` is set, so dozens of threads asking
+for the same openid's profile at the same moment make one round-trip.
+
+.. code-block:: python
+
+    >>>mp = mpapi.formp(access_token, coalesce=True)  # all GET api
+    >>>mp = mpapi.formp(access_token, coalesce=['user/info'])
+    >>>mppay = pay.for_merchant(appid, mchid, signkey,
+    ...                         coalesce=['orderquery'])
+
+"""
+
+import threading
+
+
+__all__ = ['SingleFlight', 'default_flight']
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.shared = 0
+
+
+class SingleFlight(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._executed = 0
+        self._shared = 0
+        self._timed_out = 0
+
+    def do(self, key, func, timeout=None):
+        """Execute func unless a call of the same key is in flight, in which
+        case wait for that call
+
+        Args:
+          timeout: seconds to wait for the call in flight, func is executed
+            by the caller itself after that, None to wait until it finishes
+
+        Returns:
+          return value of func, shared by all the callers of key
+
+        Raises:
+          the exception raised by func
+
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = _Call()
+                self._executed += 1
+            else:
+                call.shared += 1
+                self._shared += 1
+
+        if not is_leader:
+            if not call.done.wait(timeout):
+                with self._lock:
+                    self._timed_out += 1
+                return func()
+
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except Exception as call_error:
+            call.error = call_error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        """
+        Returns:
+          dict of in_flight (keys in flight), executed (calls executed),
+          shared (calls which shared the result of others) and timed_out
+          (calls which stopped waiting and executed by themselves)
+
+        """
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'executed': self._executed,
+                'shared': self._shared,
+                'timed_out': self._timed_out
+            }
+
+
+default_flight = SingleFlight()
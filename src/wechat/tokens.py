@@ -0,0 +1,277 @@
+# -*- encoding: utf-8
+
+"""
+Access token manager, cache the mp access token until it expires, refresh
+it ahead of expiry in background, and coalesce concurrent refreshes into
+one request, so that N threads meeting an expired token do not fetch N new
+tokens (each fetch invalidates the previous token).
+
+Usage:
+
+.. code-block:: python
+
+    >>>from wechat import mpapi, tokens
+    >>>manager = tokens.AccessTokenManager('your appid', 'your appsecret')
+    >>>mp = mpapi.formp(token_manager=manager)
+    >>>mp.get('user/info', openid='o6_bmjrPTlm6_2sgVt7hMZOPfL2M')
+
+Share the token among processes with a token store, only the process
+holding the refresh lease fetches new token:
+
+.. code-block:: python
+
+    >>>from wechat import tokenstore
+    >>>manager = tokens.AccessTokenManager(
+    ...     'your appid',
+    ...     'your appsecret',
+    ...     store=tokenstore.RedisTokenStore(redis.StrictRedis())
+    ... )
+
+"""
+
+import time
+import uuid
+import logging
+import threading
+
+from .auth import get_mp_access_token
+from .exceptions import RequestException
+from . import metrics
+from .settings import (TOKEN_REFRESH_AHEAD, TOKEN_REFRESH_LEASE_TTL,
+                       TOKEN_REFRESH_POLL_INTERVAL)
+
+
+__all__ = ['AccessTokenManager']
+
+
+log = logging.getLogger(__name__)
+
+
+class AccessTokenManager(object):
+    """
+    Args:
+      appid: mp appid
+      secret: mp appsecret
+      refresh_ahead: seconds before expiry to refresh the token in background
+      fetcher: callable return RequestResult with access_token and
+        expires_in, default is get_mp_access_token(appid, secret)
+      store: TokenStore shared by processes, None to keep token in process
+      lease_ttl: seconds of the refresh lease in store, the processes
+        without lease wait for the shared token at most lease_ttl
+      api_kwargs: options for MpOuthApi, like timeout
+
+    """
+
+    def __init__(self, appid, secret, refresh_ahead=TOKEN_REFRESH_AHEAD,
+                 fetcher=None, store=None, lease_ttl=TOKEN_REFRESH_LEASE_TTL,
+                 **api_kwargs):
+        if appid is None or secret is None:
+            raise ValueError('appid or secret')
+
+        self.appid = appid
+        self.refresh_ahead = refresh_ahead
+
+        if fetcher is None:
+            def fetcher():
+                return get_mp_access_token(appid, secret, **api_kwargs)
+        self._fetcher = fetcher
+        self._store = store
+        self.lease_ttl = lease_ttl
+
+        self._token = None
+        self._expires_at = 0
+        self._refresh_lock = threading.Lock()
+        self._background_lock = threading.Lock()
+        self._background_refreshing = False
+
+    @property
+    def expires_at(self):
+        return self._expires_at
+
+    def get_token(self):
+        """
+        Returns:
+          the cached token, fetch a new one if no token or it is expired
+
+        Raises:
+          RequestException
+
+        """
+        token, expires_at = self._token, self._expires_at
+        now = time.time()
+
+        if self._store is not None and (
+            token is None or now >= expires_at - self.refresh_ahead
+        ):
+            token, expires_at = self._load_from_store()
+
+        if token is None or now >= expires_at:
+            return self.refresh(stale_token=token)
+
+        if now >= expires_at - self.refresh_ahead:
+            self._refresh_in_background(token)
+
+        return token
+
+    def cached_token(self):
+        """
+        Returns:
+          the cached token if it is not due to refresh, None otherwise, it
+          never fetches or blocks
+
+        """
+        token, expires_at = self._token, self._expires_at
+        if token is None or time.time() >= expires_at - self.refresh_ahead:
+            return None
+        return token
+
+    def refresh(self, stale_token=None, force=False):
+        """Fetch new token unless the stale token has been replaced already,
+        concurrent calls share one fetch
+
+        Args:
+          stale_token: the token which is found expired, None if no token
+            known by caller
+          force: fetch new token even the cached one is valid
+
+        Returns:
+          the new token
+
+        Raises:
+          RequestException
+
+        """
+        with self._refresh_lock:
+            if self._store is not None:
+                self._load_from_store()
+
+            if not force and self._is_replaced(stale_token):
+                return self._token
+
+            if self._store is None:
+                return self._fetch()
+            else:
+                return self._refresh_shared(stale_token, force)
+
+    def invalidate(self):
+        with self._refresh_lock:
+            self._token = None
+            self._expires_at = 0
+
+    def _is_replaced(self, stale_token):
+        return all([
+            self._token is not None,
+            self._token != stale_token,
+            time.time() < self._expires_at
+        ])
+
+    def _load_from_store(self):
+        return self._adopt(self._store.get(self.appid))
+
+    def _adopt(self, shared):
+        if shared is not None:
+            shared_token, shared_expires_at = shared
+            if shared_expires_at > self._expires_at:
+                self._token = shared_token
+                self._expires_at = shared_expires_at
+
+        return self._token, self._expires_at
+
+    def _refresh_shared(self, stale_token, force):
+        owner = uuid.uuid4().hex
+        wait_until = time.time() + self.lease_ttl
+
+        while True:
+            if self._store.acquire_lease(self.appid, owner, self.lease_ttl):
+                try:
+                    shared = self._store.get(self.appid)
+                    shared_token = shared[0] if shared is not None else None
+                    # refreshed by others before the lease acquired
+                    self._adopt(shared)
+                    if not force and self._is_replaced(stale_token):
+                        return self._token
+
+                    token = self._fetch()
+                    if not self._store.compare_and_set(
+                        self.appid,
+                        shared_token,
+                        token,
+                        self._expires_at
+                    ):
+                        log.warning(
+                            u'shared access token of {} changed while '
+                            u'refreshing'.format(self.appid)
+                        )
+                    return token
+                finally:
+                    self._store.release_lease(self.appid, owner)
+
+            time.sleep(TOKEN_REFRESH_POLL_INTERVAL)
+            self._load_from_store()
+            if self._is_replaced(stale_token):
+                return self._token
+
+            if time.time() > wait_until:
+                raise RequestException(
+                    u'Wait for shared access token of {} timeout'.format(
+                        self.appid
+                    )
+                )
+
+    def _fetch(self):
+        start = time.time()
+        try:
+            result = self._fetcher()
+        except RequestException:
+            metrics.observe_token_refresh(
+                self.appid,
+                time.time() - start,
+                False
+            )
+            raise
+        metrics.observe_token_refresh(
+            self.appid,
+            time.time() - start,
+            not result.is_failed
+        )
+
+        if result.is_failed:
+            raise RequestException(
+                u'Fetch access token failed: {} {}'.format(
+                    result.errcode,
+                    result.errmsg
+                ),
+                response=result.response
+            )
+
+        self._expires_at = time.time() + int(result.expires_in)
+        self._token = result.access_token
+        log.info(u'access token of {} refreshed, expires in {}s'.format(
+            self.appid,
+            result.expires_in
+        ))
+        return self._token
+
+    def _refresh_in_background(self, stale_token):
+        with self._background_lock:
+            if self._background_refreshing:
+                return
+            self._background_refreshing = True
+
+        def _refresh():
+            try:
+                self.refresh(stale_token=stale_token)
+            except Exception:
+                log.warning(
+                    u'refresh access token of {} in background failed'.format(
+                        self.appid
+                    ),
+                    exc_info=True
+                )
+            finally:
+                with self._background_lock:
+                    self._background_refreshing = False
+
+        refresh_thread = threading.Thread(target=_refresh)
+        refresh_thread.daemon = True
+        refresh_thread.start()
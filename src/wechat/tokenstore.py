@@ -0,0 +1,342 @@
+# -*- encoding: utf-8
+
+"""
+Token stores shared by processes, used by AccessTokenManager so that only
+one process of the fleet fetches a new access token, the others read the
+shared token.
+
+A refresh takes a lease of the token key, re-checks the shared token and
+then writes the new token with compare-and-swap, so a process which lost
+the lease never overwrites a newer token.
+
+Backends:
+
+* MemoryTokenStore: in process, for test or single process usage
+* FileTokenStore: json file guarded by flock, shared on the host
+* SQLiteTokenStore: sqlite database file, shared on the host
+* RedisTokenStore: redis protocol, shared by the fleet, works with any
+  client providing redis-py style ``get``, ``set(nx, px)`` and ``eval``
+
+"""
+
+import os
+import time
+import sqlite3
+import threading
+
+from .compat import json, bytes
+
+
+__all__ = ['TokenStore', 'MemoryTokenStore', 'FileTokenStore',
+           'SQLiteTokenStore', 'RedisTokenStore']
+
+
+class TokenStore(object):
+
+    def get(self, key):
+        """
+        Returns:
+          tuple of (token, expires_at), None if not exists
+
+        """
+        raise NotImplementedError('implement get in sub class')
+
+    def compare_and_set(self, key, expected_token, token, expires_at):
+        """Set the token only when the stored token is expected_token
+        (None means no token stored)
+
+        Returns:
+          whether the token is set
+
+        """
+        raise NotImplementedError('implement compare_and_set in sub class')
+
+    def acquire_lease(self, key, owner, ttl):
+        """
+        Returns:
+          whether owner gets the refresh lease of key for ttl seconds
+
+        """
+        raise NotImplementedError('implement acquire_lease in sub class')
+
+    def release_lease(self, key, owner):
+        raise NotImplementedError('implement release_lease in sub class')
+
+
+class _DictTokenStore(TokenStore):
+    """Store tokens and leases in dict, sub class provides the transaction
+    to load and save the dict
+    """
+
+    def _transaction(self, update_func):
+        raise NotImplementedError('implement _transaction in sub class')
+
+    def get(self, key):
+        def _get(data):
+            item = data.get(key)
+            if item is None:
+                return None, False
+            return (item['token'], item['expires_at']), False
+
+        return self._transaction(_get)
+
+    def compare_and_set(self, key, expected_token, token, expires_at):
+        def _cas(data):
+            item = data.get(key)
+            current_token = item['token'] if item is not None else None
+            if current_token != expected_token:
+                return False, False
+
+            data[key] = {'token': token, 'expires_at': expires_at}
+            return True, True
+
+        return self._transaction(_cas)
+
+    def acquire_lease(self, key, owner, ttl):
+        lease_key = u'lease:{}'.format(key)
+
+        def _acquire(data):
+            lease = data.get(lease_key)
+            now = time.time()
+            if lease is not None and lease['expires_at'] > now:
+                return lease['owner'] == owner, False
+
+            data[lease_key] = {'owner': owner, 'expires_at': now + ttl}
+            return True, True
+
+        return self._transaction(_acquire)
+
+    def release_lease(self, key, owner):
+        lease_key = u'lease:{}'.format(key)
+
+        def _release(data):
+            lease = data.get(lease_key)
+            if lease is None or lease['owner'] != owner:
+                return None, False
+
+            del data[lease_key]
+            return None, True
+
+        self._transaction(_release)
+
+
+class MemoryTokenStore(_DictTokenStore):
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _transaction(self, update_func):
+        with self._lock:
+            result, _ = update_func(self._data)
+            return result
+
+
+class FileTokenStore(_DictTokenStore):
+    """Tokens kept in json file, every operation holds the flock of file"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def _transaction(self, update_func):
+        import fcntl
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            content = b''
+            while True:
+                chunk = os.read(fd, 4096)
+                if not chunk:
+                    break
+                content += chunk
+
+            data = json.loads(content.decode('utf-8')) if content else {}
+            result, changed = update_func(data)
+            if changed:
+                content = json.dumps(data).encode('utf-8')
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.ftruncate(fd, 0)
+                os.write(fd, content)
+            return result
+        finally:
+            os.close(fd)
+
+
+class SQLiteTokenStore(TokenStore):
+
+    def __init__(self, path, timeout=5):
+        self.path = path
+        self.timeout = timeout
+
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS wechat_tokens ('
+                    'key TEXT PRIMARY KEY, token TEXT, expires_at REAL)'
+                )
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS wechat_token_leases ('
+                    'key TEXT PRIMARY KEY, owner TEXT, expires_at REAL)'
+                )
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            isolation_level=None
+        )
+        return conn
+
+    def _execute(self, update_func):
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = update_func(conn)
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            else:
+                conn.execute('COMMIT')
+                return result
+        finally:
+            conn.close()
+
+    def get(self, key):
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT token, expires_at FROM wechat_tokens WHERE key = ?',
+                (key, )
+            ).fetchone()
+        finally:
+            conn.close()
+
+        return tuple(row) if row is not None else None
+
+    def compare_and_set(self, key, expected_token, token, expires_at):
+        def _cas(conn):
+            if expected_token is None:
+                cursor = conn.execute(
+                    'INSERT OR IGNORE INTO wechat_tokens '
+                    '(key, token, expires_at) VALUES (?, ?, ?)',
+                    (key, token, expires_at)
+                )
+            else:
+                cursor = conn.execute(
+                    'UPDATE wechat_tokens SET token = ?, expires_at = ? '
+                    'WHERE key = ? AND token = ?',
+                    (token, expires_at, key, expected_token)
+                )
+            return cursor.rowcount == 1
+
+        return self._execute(_cas)
+
+    def acquire_lease(self, key, owner, ttl):
+        def _acquire(conn):
+            now = time.time()
+            row = conn.execute(
+                'SELECT owner, expires_at FROM wechat_token_leases '
+                'WHERE key = ?',
+                (key, )
+            ).fetchone()
+            if row is not None and row[1] > now:
+                return row[0] == owner
+
+            conn.execute(
+                'INSERT OR REPLACE INTO wechat_token_leases '
+                '(key, owner, expires_at) VALUES (?, ?, ?)',
+                (key, owner, now + ttl)
+            )
+            return True
+
+        return self._execute(_acquire)
+
+    def release_lease(self, key, owner):
+        def _release(conn):
+            conn.execute(
+                'DELETE FROM wechat_token_leases WHERE key = ? AND owner = ?',
+                (key, owner)
+            )
+
+        self._execute(_release)
+
+
+class RedisTokenStore(TokenStore):
+    """
+    Args:
+      client: redis client, like redis.StrictRedis()
+      prefix: prefix of redis keys
+
+    The lease is an atomic ``SET NX PX``. compare_and_set and
+    release_lease run as Lua scripts, so the token is compared and written,
+    and the lease is compared and deleted, atomically even after the lease
+    expired and was taken by another process.
+
+    """
+
+    # expected token '' means no token stored
+    _CAS_SCRIPT = (
+        "local current = redis.call('GET', KEYS[1]) "
+        "local current_token = '' "
+        "if current then current_token = cjson.decode(current)['token'] end "
+        "if current_token ~= ARGV[1] then return 0 end "
+        "redis.call('SET', KEYS[1], ARGV[2], 'PX', ARGV[3]) "
+        "return 1"
+    )
+
+    _RELEASE_SCRIPT = (
+        "if redis.call('GET', KEYS[1]) == ARGV[1] then "
+        "return redis.call('DEL', KEYS[1]) "
+        "end "
+        "return 0"
+    )
+
+    def __init__(self, client, prefix=u'wechat:token:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self._token_key(key))
+        if value is None:
+            return None
+
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+
+        item = json.loads(value)
+        return item['token'], item['expires_at']
+
+    def compare_and_set(self, key, expected_token, token, expires_at):
+        ttl_ms = max(int((expires_at - time.time()) * 1000), 1)
+        return bool(self.client.eval(
+            self._CAS_SCRIPT,
+            1,
+            self._token_key(key),
+            expected_token or u'',
+            json.dumps({'token': token, 'expires_at': expires_at}),
+            ttl_ms
+        ))
+
+    def acquire_lease(self, key, owner, ttl):
+        lease_key = self._lease_key(key)
+        if self.client.set(lease_key, owner, nx=True, px=int(ttl * 1000)):
+            return True
+
+        current_owner = self.client.get(lease_key)
+        if isinstance(current_owner, bytes):
+            current_owner = current_owner.decode('utf-8')
+        return current_owner == owner
+
+    def release_lease(self, key, owner):
+        self.client.eval(self._RELEASE_SCRIPT, 1, self._lease_key(key), owner)
+
+    def _token_key(self, key):
+        return u'{}{}'.format(self.prefix, key)
+
+    def _lease_key(self, key):
+        return u'{}lease:{}'.format(self.prefix, key)
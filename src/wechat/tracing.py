@@ -0,0 +1,230 @@
+# -*- encoding: utf-8
+
+"""
+Tracing hooks of the api calls and the message pipeline, the spans are:
+
+* ``wechat.request``: Api.request, the whole call including retries
+* ``wechat.execute``: every attempt sent, with per-phase timings of the
+  urllib3 layer as attributes ``wechat.phase.connect`` (dns and tcp
+  connect), ``.tls``, ``.send``, ``.ttfb``, ``.download`` and ``.parse``
+* ``wechat.parse``: build_from_response
+* ``wechat.retry``: the ``_retry`` hook, like the access token refresh
+* ``wechat.message.handle`` and ``wechat.message.handler``: Pipeline.handle
+  and every handler, the span is set to ``context.span``
+
+The spans of the api calls made in a handler are children of the handler
+span. No span is created until a tracer is set.
+
+Usage:
+
+.. code-block:: python
+
+    >>>from wechat import tracing
+    >>>tracing.set_tracer(tracing.OpenTelemetryTracer())
+
+A tracer without OpenTelemetry implements ``Tracer.start_span`` and returns
+its ``Span``.
+
+"""
+
+import threading
+import functools
+from contextlib import contextmanager
+
+try:
+    import contextvars
+except ImportError:  # pragma: no cover
+    contextvars = None
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # pragma: no cover
+    otel_trace = None
+
+
+__all__ = ['Span', 'Tracer', 'OpenTelemetryTracer', 'set_tracer',
+           'get_tracer', 'is_enabled', 'current_span', 'span', 'wrap']
+
+
+class Span(object):
+    """Span does nothing, the base of the spans of tracers"""
+
+    def set_attribute(self, key, value):
+        pass
+
+    def add_event(self, name, attributes=None):
+        pass
+
+    def record_exception(self, exception):
+        pass
+
+    def end(self):
+        pass
+
+
+class Tracer(object):
+    """Tracer does nothing, the base of tracers"""
+
+    def start_span(self, name, parent=None, attributes=None):
+        """
+        Args:
+          name: span name
+          parent: Span of this tracer, None for the current one of the
+            tracing system
+          attributes: dict of span attributes
+
+        Returns:
+          Span
+
+        """
+        return _noop_span
+
+
+class _OpenTelemetrySpan(Span):
+
+    def __init__(self, otel_span):
+        self.otel_span = otel_span
+
+    def set_attribute(self, key, value):
+        self.otel_span.set_attribute(key, value)
+
+    def add_event(self, name, attributes=None):
+        self.otel_span.add_event(name, attributes=attributes)
+
+    def record_exception(self, exception):
+        self.otel_span.record_exception(exception)
+        self.otel_span.set_status(otel_trace.Status(
+            otel_trace.StatusCode.ERROR,
+            u'{}'.format(exception)
+        ))
+
+    def end(self):
+        self.otel_span.end()
+
+
+class OpenTelemetryTracer(Tracer):
+    """Adapter of OpenTelemetry, the spans without a parent are children of
+    the current OpenTelemetry span, like the span of the web request
+
+    Args:
+      tracer: opentelemetry Tracer, default is ``get_tracer('wechat')``
+
+    Raises:
+      ImportError: opentelemetry-api is not installed
+
+    """
+
+    def __init__(self, tracer=None):
+        if otel_trace is None:
+            raise ImportError(
+                'opentelemetry-api is required, '
+                'pip install wechat-requests[tracing]'
+            )
+
+        self._tracer = tracer or otel_trace.get_tracer('wechat')
+
+    def start_span(self, name, parent=None, attributes=None):
+        context = None
+        if isinstance(parent, _OpenTelemetrySpan):
+            context = otel_trace.set_span_in_context(parent.otel_span)
+
+        return _OpenTelemetrySpan(self._tracer.start_span(
+            name,
+            context=context,
+            attributes=attributes
+        ))
+
+
+_noop_span = Span()
+_noop_tracer = Tracer()
+_tracer = _noop_tracer
+
+
+if contextvars is not None:
+    _current_span = contextvars.ContextVar('wechat_span', default=None)
+
+    def current_span():
+        return _current_span.get()
+
+    def _set_current_span(_span):
+        return _current_span.set(_span)
+
+    def _reset_current_span(token):
+        _current_span.reset(token)
+
+else:  # pragma: no cover
+    _local = threading.local()
+
+    def current_span():
+        return getattr(_local, 'span', None)
+
+    def _set_current_span(_span):
+        previous = current_span()
+        _local.span = _span
+        return previous
+
+    def _reset_current_span(previous):
+        _local.span = previous
+
+
+def set_tracer(tracer):
+    """
+    Args:
+      tracer: Tracer, None to turn off the tracing
+    """
+    global _tracer
+    _tracer = tracer if tracer is not None else _noop_tracer
+
+
+def get_tracer():
+    return _tracer
+
+
+def is_enabled():
+    return _tracer is not _noop_tracer
+
+
+@contextmanager
+def span(name, attributes=None, parent=None):
+    """Start a span as the current span in the block, the exception raised
+    is recorded to the span
+
+    Args:
+      parent: Span, default is the current span
+
+    """
+    tracer = _tracer
+    if tracer is _noop_tracer:
+        yield _noop_span
+        return
+
+    _span = tracer.start_span(
+        name,
+        parent=parent if parent is not None else current_span(),
+        attributes=attributes
+    )
+    token = _set_current_span(_span)
+    try:
+        yield _span
+    except Exception as error:
+        _span.record_exception(error)
+        raise
+    finally:
+        _reset_current_span(token)
+        _span.end()
+
+
+def wrap(func):
+    """Bind the current span to func, which is called in another thread"""
+    parent = current_span()
+    if parent is None:
+        return func
+
+    @functools.wraps(func)
+    def _wrapped(*args, **kwargs):
+        token = _set_current_span(parent)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _reset_current_span(token)
+    return _wrapped
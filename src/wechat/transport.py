@@ -0,0 +1,463 @@
+# -*- encoding: utf-8
+
+"""
+Process wide transport registry, all Api instances share the connection
+pools kept here instead of building a pool per Api instance, so sockets
+(and TLS sessions) are reused across MpApi.group(), get_mp_access_token()
+and any other short lived Api.
+
+Adapters are keyed by host and client cert, idle connections are reaped
+after ``idle_timeout`` seconds without any request to the host.
+
+Usage:
+
+.. code-block:: python
+
+    >>>from wechat import transport
+    >>>transport.configure(pool_maxsize=50, pool_block=True)
+    >>>transport.stats()
+    {'total': {'in_use': 0, 'idle': 2, 'created': 2, 'reused': 18, ...},
+     'hosts': {'https://api.weixin.qq.com': {...}}}
+
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+
+from six.moves.queue import Empty, Full
+from urllib3.util.retry import Retry
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from requests.adapters import BaseAdapter, HTTPAdapter
+
+from .compat import urlparse
+from .settings import (RETRYS, RETRY_BACKOFF_FACTOR, RETRY_STATUS_FORCELIST,
+                       POOL_CONNECTIONS, POOL_MAXSIZE, POOL_BLOCK,
+                       POOL_IDLE_TIMEOUT)
+
+
+__all__ = ['TransportRegistry', 'default_registry', 'configure', 'stats',
+           'reap_idle', 'override_retry', 'record_phases']
+
+
+_STATS_FIELDS = ('in_use', 'idle', 'created', 'reused', 'requests')
+
+_retry_override = threading.local()
+_phase_recorder = threading.local()
+
+
+def _build_retry():
+    return Retry(
+        total=RETRYS,
+        read=RETRYS,
+        connect=RETRYS,
+        backoff_factor=RETRY_BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUS_FORCELIST,
+    )
+
+
+def _empty_stats():
+    return dict((field, 0) for field in _STATS_FIELDS)
+
+
+def _record_phase(phase, seconds):
+    phases = getattr(_phase_recorder, 'phases', None)
+    if phases is not None:
+        phases[phase] = phases.get(phase, 0) + seconds
+
+
+class _TimedConnectionMixin(object):
+    """report the time of connect, tls handshake, sending the request and
+    waiting for the response headers to record_phases()
+    """
+
+    _tcp_elapsed = 0
+    _connect_elapsed = 0
+
+    def _new_conn(self):
+        start = time.time()
+        try:
+            return super(_TimedConnectionMixin, self)._new_conn()
+        finally:
+            self._tcp_elapsed = time.time() - start
+
+    def connect(self):
+        start = time.time()
+        self._tcp_elapsed = 0
+        try:
+            super(_TimedConnectionMixin, self).connect()
+        finally:
+            elapsed = time.time() - start
+            self._connect_elapsed += elapsed
+            # dns resolving is included in connect
+            _record_phase('connect', self._tcp_elapsed)
+            if isinstance(self, HTTPSConnection):
+                _record_phase('tls', elapsed - self._tcp_elapsed)
+
+    def request(self, *args, **kwargs):
+        start = time.time()
+        self._connect_elapsed = 0
+        try:
+            super(_TimedConnectionMixin, self).request(*args, **kwargs)
+        finally:
+            # http connects lazily when sending the request
+            _record_phase(
+                'send',
+                time.time() - start - self._connect_elapsed
+            )
+
+    def getresponse(self, *args, **kwargs):
+        start = time.time()
+        try:
+            return super(_TimedConnectionMixin, self).getresponse(
+                *args,
+                **kwargs
+            )
+        finally:
+            _record_phase('ttfb', time.time() - start)
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter which remembers its last activity and is able to report
+    and reap the connections kept by its urllib3 pools
+    """
+
+    def __init__(self, **kwargs):
+        self.last_used = time.time()
+        super(PooledHTTPAdapter, self).__init__(**kwargs)
+
+    @property
+    def max_retries(self):
+        """the Retry of override_retry() in current thread, or the
+        default one of the adapter
+        """
+        retry = getattr(_retry_override, 'retry', None)
+        return retry if retry is not None else self._max_retries
+
+    @max_retries.setter
+    def max_retries(self, retry):
+        self._max_retries = retry
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(PooledHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool,
+        }
+
+    def send(self, request, **kwargs):
+        self.last_used = time.time()
+        try:
+            response = super(PooledHTTPAdapter, self).send(request, **kwargs)
+            if all([
+                getattr(_phase_recorder, 'phases', None) is not None,
+                not kwargs.get('stream')
+            ]):
+                start = time.time()
+                response.content
+                _record_phase('download', time.time() - start)
+            return response
+        finally:
+            self.last_used = time.time()
+
+    def _connection_pools(self):
+        pools = self.poolmanager.pools
+        _pools = []
+        for key in pools.keys():
+            try:
+                _pools.append(pools[key])
+            except KeyError:
+                continue
+        return _pools
+
+    def stats(self):
+        _stats = _empty_stats()
+        for pool in self._connection_pools():
+            queue = pool.pool
+            if queue is None:
+                continue
+
+            idle_conns = [conn for conn in list(queue.queue) if conn]
+            _stats['idle'] += len(idle_conns)
+            _stats['in_use'] += max(queue.maxsize - queue.qsize(), 0)
+            _stats['created'] += pool.num_connections
+            _stats['requests'] += pool.num_requests
+            _stats['reused'] += max(
+                pool.num_requests - pool.num_connections,
+                0
+            )
+
+        return _stats
+
+    def reap_idle(self):
+        """close connections which are waiting in the pools, the pools are
+        kept so the counters survive
+
+        Returns:
+          count of closed connections
+
+        """
+        reaped = 0
+        for pool in self._connection_pools():
+            queue = pool.pool
+            if queue is None:
+                continue
+
+            drained = []
+            while True:
+                try:
+                    drained.append(queue.get(block=False))
+                except Empty:
+                    break
+
+            for conn in drained:
+                if conn:
+                    conn.close()
+                    reaped += 1
+
+                try:
+                    queue.put(None, block=False)
+                except Full:
+                    break
+
+        return reaped
+
+
+class _RegistryAdapter(BaseAdapter):
+    """Mounted to each session, dispatch every request to the shared adapter
+    of the request host and client cert
+    """
+
+    def __init__(self, registry):
+        super(_RegistryAdapter, self).__init__()
+        self.registry = registry
+
+    def send(self, request, cert=None, **kwargs):
+        adapter = self.registry.get_adapter(request.url, cert)
+        return adapter.send(request, cert=cert, **kwargs)
+
+    def close(self):
+        # the shared adapters are owned by the registry
+        pass
+
+
+class TransportRegistry(object):
+
+    def __init__(self, pool_connections=POOL_CONNECTIONS,
+                 pool_maxsize=POOL_MAXSIZE, pool_block=POOL_BLOCK,
+                 idle_timeout=POOL_IDLE_TIMEOUT):
+        self._lock = threading.Lock()
+        self._adapters = {}
+        self._async_connectors = {}
+        self._last_reap = time.time()
+        self._options = {}
+        self.configure(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+            idle_timeout=idle_timeout
+        )
+
+    def configure(self, **options):
+        """Update pool options, the existing pools are closed and rebuilt
+        with the new options on next request
+
+        Args:
+          pool_connections: count of host pools cached by each adapter
+          pool_maxsize: max connections kept for each host
+          pool_block: whether to block when no free connection
+          idle_timeout: seconds before idle connections of a host are closed
+
+        """
+        unknown = set(options) - set(
+            ['pool_connections', 'pool_maxsize', 'pool_block', 'idle_timeout']
+        )
+        if unknown:
+            raise ValueError('unknown pool options: {}'.format(
+                ', '.join(sorted(unknown))
+            ))
+
+        with self._lock:
+            self._options.update(options)
+            self.idle_timeout = self._options['idle_timeout']
+            adapters, self._adapters = self._adapters, {}
+
+        for adapter in adapters.values():
+            adapter.close()
+
+    def mount(self, session):
+        adapter = _RegistryAdapter(self)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def get_adapter(self, url, cert=None):
+        key = self._build_key(url, cert)
+
+        adapter = self._adapters.get(key)
+        if adapter is None:
+            with self._lock:
+                adapter = self._adapters.get(key)
+                if adapter is None:
+                    adapter = PooledHTTPAdapter(
+                        pool_connections=self._options['pool_connections'],
+                        pool_maxsize=self._options['pool_maxsize'],
+                        pool_block=self._options['pool_block'],
+                        max_retries=_build_retry()
+                    )
+                    self._adapters[key] = adapter
+
+        if time.time() - self._last_reap > self.idle_timeout:
+            self.reap_idle()
+
+        return adapter
+
+    def get_async_connector(self, loop, ssl_context=None, cert=None,
+                            limit=None):
+        """aiohttp connector shared by the AsyncApi instances running in the
+        same event loop
+        """
+        import aiohttp
+
+        key = (id(loop), cert)
+        with self._lock:
+            for _key, (_loop, _connector) in list(
+                self._async_connectors.items()
+            ):
+                if _loop.is_closed() or _connector.closed:
+                    del self._async_connectors[_key]
+
+            if key not in self._async_connectors:
+                connector_options = {
+                    'limit': limit or self._options['pool_maxsize'],
+                    'keepalive_timeout': self._options['idle_timeout']
+                }
+                if ssl_context is not None:
+                    connector_options['ssl'] = ssl_context
+
+                connector = aiohttp.TCPConnector(**connector_options)
+                self._async_connectors[key] = (loop, connector)
+
+            return self._async_connectors[key][1]
+
+    def reap_idle(self, idle_timeout=None):
+        """
+        Returns:
+          count of closed connections
+
+        """
+        if idle_timeout is None:
+            idle_timeout = self.idle_timeout
+
+        now = time.time()
+        self._last_reap = now
+
+        reaped = 0
+        for adapter in list(self._adapters.values()):
+            if now - adapter.last_used >= idle_timeout:
+                reaped += adapter.reap_idle()
+        return reaped
+
+    def stats(self):
+        """
+        Returns:
+          dict like {'total': {...}, 'hosts': {host: {...}}}, every item
+          contains in_use, idle, created, reused and requests count
+
+        """
+        total = _empty_stats()
+        hosts = {}
+        for (host, cert), adapter in list(self._adapters.items()):
+            adapter_stats = adapter.stats()
+            host_stats = hosts.setdefault(host, _empty_stats())
+            for field in _STATS_FIELDS:
+                host_stats[field] += adapter_stats[field]
+                total[field] += adapter_stats[field]
+
+        return {'total': total, 'hosts': hosts}
+
+    def clear(self):
+        with self._lock:
+            adapters, self._adapters = self._adapters, {}
+
+        for adapter in adapters.values():
+            adapter.close()
+
+    @staticmethod
+    def _build_key(url, cert):
+        parsed_url = urlparse(url)
+        host = u'{}://{}'.format(
+            parsed_url.scheme.lower(),
+            parsed_url.netloc.lower()
+        )
+        if isinstance(cert, list):
+            cert = tuple(cert)
+        return host, cert
+
+
+default_registry = TransportRegistry()
+
+
+@contextmanager
+def override_retry(retry):
+    """Use retry instead of the shared adapters' Retry for the requests
+    sent in current thread within the context
+    """
+    previous = getattr(_retry_override, 'retry', None)
+    _retry_override.retry = retry
+    try:
+        yield retry
+    finally:
+        _retry_override.retry = previous
+
+
+@contextmanager
+def record_phases():
+    """Record the seconds of the phases of the requests sent in current
+    thread within the context, the phases are connect (including dns), tls,
+    send, ttfb (waiting for the response headers) and download
+
+    .. code-block:: python
+
+        >>>with transport.record_phases() as phases:
+        ...    session.get(url)
+        >>>phases
+        {'connect': 0.021, 'tls': 0.043, 'send': 0.0001, 'ttfb': 0.051,
+         'download': 0.002}
+
+    """
+    previous = getattr(_phase_recorder, 'phases', None)
+    phases = _phase_recorder.phases = {}
+    try:
+        yield phases
+    finally:
+        _phase_recorder.phases = previous
+
+
+def configure(**options):
+    default_registry.configure(**options)
+
+
+def stats():
+    return default_registry.stats()
+
+
+def reap_idle(idle_timeout=None):
+    return default_registry.reap_idle(idle_timeout)
@@ -1,13 +1,18 @@
 # -*- encoding: utf-8
 
 
+from numbers import Number
+from xml.sax.saxutils import escape as xml_escape
+
 from six import iteritems
 
-from .compat import json, str, bytes
+from . import jsonbackend
+from .compat import str, bytes, urlparse
 from .__version__ import __version__, __name__
 
 
-__all__ = ['build_user_agent', 'serialize_dict_to_xml']
+__all__ = ['build_user_agent', 'serialize_dict_to_xml',
+           'serialize_to_xml_bytes', 'url_host', 'ApiPathRules']
 
 
 _USER_AGENT = None
@@ -22,62 +27,160 @@ def build_user_agent():
     return _USER_AGENT
 
 
-class Node(object):
-
-    def __init__(self):
-        pass
+def _legacy_xml_text(value):
+    if type(value) in (dict, list):
+        return u'<![CDATA[{}]]>'.format(jsonbackend.dumps(value))
 
-    def prettify(self):
-        raise NotImplementedError('implement prettify in sub class')
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return str(value)
 
 
-class Root(Node):
-
-    PRETTIFY_INDENT = ' ' * 2
+def serialize_dict_to_xml(**kwargs):
+    """
+    Returns:
+      pretty xml in unicode, the values are written as they are, without
+      escaping, and the dict or list values are dumped to JSON in CDATA
 
-    def __init__(self):
-        self._kvnodes = []
+    """
+    lines = [u'<xml>']
+    for k, v in iteritems(kwargs):
+        if v is None:
+            continue
+        lines.append(u'  <{key}>{value}</{key}>'.format(
+            key=k,
+            value=_legacy_xml_text(v)
+        ))
+    lines.append(u'</xml>')
+    return u'\n'.join(lines)
 
-    def append(self, child):
-        self._kvnodes.append(child)
-        return self
 
-    def prettify(self):
-        out = [u'<xml>']
-        for child in self._kvnodes:
-            out.append(u'{}{}'.format(self.PRETTIFY_INDENT, child.prettify()))
-        out.append(u'</xml>')
-        return u'\n'.join(out)
+_XML_INDENT = u'  '
+_XML_ITEM_TAG = u'item'
 
 
-class KVNode(Node):
+def _write_xml_fields(parts, items, indent, compact):
+    """append the text of the fields to parts, every field starts with the
+    indent
+    """
+    for key, value in items:
+        if value is None:
+            continue
 
-    def __init__(self, key, value):
-        self.key = key
-        if type(value) in (dict, list):
-            _value_str = json.dumps(value, ensure_ascii=False)
-            self._pretty_value = u'<![CDATA[{}]]>'.format(_value_str)
-        else:
-            if not isinstance(value, bytes):
-                self._pretty_value = str(value)
+        if isinstance(value, (str, bytes)):
+            if isinstance(value, bytes):
+                value = value.decode('utf-8')
+            parts.append(u'%s<%s><![CDATA[%s]]></%s>' % (
+                indent,
+                key,
+                value.replace(u']]>', u']]]]><![CDATA[>'),
+                key
+            ))
+        elif isinstance(value, Number):
+            parts.append(u'%s<%s>%s</%s>' % (indent, key, value, key))
+        elif isinstance(value, (dict, list, tuple)):
+            if isinstance(value, dict):
+                children = iteritems(value)
             else:
-                self._pretty_value = value
+                children = ((_XML_ITEM_TAG, item) for item in value)
+
+            parts.append(u'%s<%s>' % (indent, key))
+            _write_xml_fields(
+                parts,
+                children,
+                indent if compact else indent + _XML_INDENT,
+                compact
+            )
+            parts.append(u'%s</%s>' % (indent, key))
+        else:
+            parts.append(u'%s<%s>%s</%s>' % (
+                indent,
+                key,
+                xml_escape(str(value)),
+                key
+            ))
+
+
+def serialize_to_xml_bytes(fields, compact=False):
+    """Serialize to the xml of the messages and the pay api in utf-8
+
+    .. code-block:: python
+
+        >>>serialize_to_xml_bytes({
+        ...     'MsgType': 'news',
+        ...     'ArticleCount': 1,
+        ...     'Articles': [{'Title': 'title', 'Url': 'http://a.com'}]
+        ... }, compact=True)
+        b'<xml><MsgType><![CDATA[news]]></MsgType><ArticleCount>1</Artic...'
+
+    Args:
+      fields: dict of the tag to the value, the None values are skipped
+      compact: without the newlines and indents
+
+    Returns:
+      xml in bytes, the text values are written in CDATA, the dict values
+      are written as the child tags, and every element of the list values
+      as an ``<item>`` tag
+
+    """
+    parts = [u'<xml>']
+    _write_xml_fields(
+        parts,
+        iteritems(fields),
+        u'' if compact else u'\n' + _XML_INDENT,
+        compact
+    )
+    parts.append(u'</xml>' if compact else u'\n</xml>')
+    # encoded once, faster than encoding every part
+    return u''.join(parts).encode('utf-8')
+
+
+def url_host(url):
+    """
+    Returns:
+      scheme and host of url in lower case, like https://api.weixin.qq.com
+    """
+    parsed_url = urlparse(url)
+    return u'{}://{}'.format(
+        parsed_url.scheme.lower(),
+        parsed_url.netloc.lower()
+    )
+
+
+class ApiPathRules(object):
+    """Map api path to value, the request url matches api path with the tail
+    of url path, longer api path matches first
+
+    >>>rules = ApiPathRules({'user/info': 10, 'info': 1})
+    >>>rules.match(u'https://api.weixin.qq.com/cgi-bin/user/info?openid=1')
+    10
+
+    """
+
+    def __init__(self, rules=None):
+        self._rules = sorted(
+            [
+                (self.normalize(api_path), value)
+                for api_path, value in iteritems(rules or {})
+            ],
+            key=lambda rule: len(rule[0]),
+            reverse=True
+        )
 
-            if type(self._pretty_value) is bytes:
-                self._pretty_value = self._pretty_value.decode('utf-8')
+    @staticmethod
+    def normalize(api_path):
+        return u'/' + api_path.strip(u'/')
 
-    def prettify(self):
-        return u'<{key}>{value}</{key}>'.format(
-            key=self.key,
-            value=self._pretty_value
-        )
+    def match(self, url, default=None):
+        path = urlparse(url).path.rstrip(u'/')
+        for api_path, value in self._rules:
+            if path.endswith(api_path):
+                return value
 
+        return default
 
-def serialize_dict_to_xml(**kwargs):
-    root = Root()
-    for k, v in iteritems(kwargs):
-        if v is None:
-            continue
-        root.append(KVNode(k, v))
+    def items(self):
+        return list(self._rules)
 
-    return root.prettify()
+    def __len__(self):
+        return len(self._rules)
@@ -0,0 +1,132 @@
+# -*- encoding: utf-8
+
+"""
+Parser of the flat xml of the wechat api, like the responses of the pay
+api, which is about 20 child tags of the ``<xml>`` root:
+
+.. code-block:: xml
+
+    <xml>
+      <return_code><![CDATA[SUCCESS]]></return_code>
+      <prepay_id><![CDATA[wx201411101639507cbf6ffd8b0779950874]]></prepay_id>
+    </xml>
+
+It is parsed in one pass by expat, without building the tree, the text of
+a child tag includes the text of its descendants as BeautifulSoup does.
+
+parse_xml_tags() keeps the nested tags too, like ``ScanCodeInfo`` of the
+menu event messages.
+
+"""
+
+from xml.parsers import expat
+
+from .compat import bytes
+
+
+__all__ = ['parse_flat_xml', 'parse_xml_tags']
+
+
+_ROOT_TAG = u'xml'
+
+
+class _FlatXmlHandler(object):
+
+    def __init__(self):
+        self.fields = {}
+        self._depth = 0
+        self._key = None
+        self._chunks = []
+
+    def start(self, name, attrs):
+        self._depth += 1
+        if self._depth == 1 and name != _ROOT_TAG:
+            raise ValueError(u'root tag {} is not xml'.format(name))
+
+        if self._depth == 2:
+            self._key = name
+            self._chunks = []
+
+    def end(self, name):
+        if self._depth == 2:
+            self.fields[self._key] = u''.join(self._chunks)
+        self._depth -= 1
+
+    def data(self, text):
+        if self._depth >= 2:
+            self._chunks.append(text)
+
+    def doctype(self, *args):
+        raise ValueError(u'DTD is not allowed')
+
+
+class _XmlTagsHandler(object):
+
+    def __init__(self):
+        self.fields = {}
+        self._stack = []
+        self._chunks = []
+
+    def start(self, name, attrs):
+        self._stack.append((name, len(self._chunks)))
+
+    def end(self, name):
+        name, start = self._stack.pop()
+        if name not in self.fields:
+            self.fields[name] = u''.join(self._chunks[start:])
+
+    def data(self, text):
+        self._chunks.append(text)
+
+    def doctype(self, *args):
+        raise ValueError(u'DTD is not allowed')
+
+
+def _parse(xml_text, handler):
+    if not isinstance(xml_text, bytes):
+        xml_text = xml_text.encode('utf-8')
+
+    parser = expat.ParserCreate('utf-8')
+    parser.buffer_text = True
+    parser.StartElementHandler = handler.start
+    parser.EndElementHandler = handler.end
+    parser.CharacterDataHandler = handler.data
+    parser.StartDoctypeDeclHandler = handler.doctype
+
+    try:
+        parser.Parse(xml_text, True)
+    except expat.ExpatError as xml_error:
+        raise ValueError(u'malformed xml: {}'.format(xml_error))
+
+    return handler.fields
+
+
+def parse_flat_xml(xml_text):
+    """
+    Args:
+      xml_text: xml in unicode or utf-8 bytes
+
+    Returns:
+      dict of the child tags of the xml root to their text in unicode
+
+    Raises:
+      ValueError: malformed xml, or the root is not ``<xml>``
+
+    """
+    return _parse(xml_text, _FlatXmlHandler())
+
+
+def parse_xml_tags(xml_text):
+    """
+    Args:
+      xml_text: xml in unicode or utf-8 bytes
+
+    Returns:
+      dict of all the tags, including the root, to the text of their first
+      occurrence in unicode
+
+    Raises:
+      ValueError: malformed xml
+
+    """
+    return _parse(xml_text, _XmlTagsHandler())
@@ -2,11 +2,21 @@
 
 import pytest
 
-from wechat.compat import json
+from wechat.compat import json, is_py2
 from wechat import settings
 from .compat import urljoin, range
 
 
+# the async client and its tests are written in the py3 async syntax
+collect_ignore = []
+if is_py2:
+    collect_ignore.extend([
+        'test_aio.py',
+        'test_aio_download.py',
+        'test_aio_multipart.py'
+    ])
+
+
 @pytest.fixture(scope="session", autouse=True)
 def mp_access_token(request):
     return 'dummy_mp_account_access_token'
@@ -58,6 +68,10 @@ class FakeResponse(object):
     def text(self):
         return self._text
 
+    @property
+    def content(self):
+        return self._text.encode('utf-8')
+
     def json(self, **kwargs):
         try:
             return json.loads(self.text)
@@ -95,3 +109,10 @@ def auth_expired_ret(request):
         "errcode": {request.param},
         "errmsg": "auth expired"
     }}'''.format(request=request)
+
+
+@pytest.fixture
+def media_path(tmpdir):
+    path = tmpdir.join('a.jpg')
+    path.write_binary(b'jpeg')
+    return str(path)
@@ -1,6 +1,8 @@
 # -*- encoding: utf-8
 
 
+import pytest
+
 from wechat.message import XMLMessageBuilder
 
 
@@ -41,3 +43,98 @@ class TestXMLMsgBuild:
         assert reply_xmlmsg.to_openid == received_message.from_openid
         assert reply_xmlmsg.from_openid == received_message.to_openid
         assert reply_xmlmsg.content == u'just a 汉字 reply'
+
+    def test_img_replymsg_build(self, received_message_str):
+        received_message = XMLMessageBuilder.parse(received_message_str)
+        reply = XMLMessageBuilder.parse(
+            XMLMessageBuilder.build_reply_imgmsg_for(received_message, 'id')
+        )
+
+        assert reply.is_image()
+        assert reply.to_openid == received_message.from_openid
+        assert reply.MediaId == u'id'
+
+    def test_voice_replymsg_build(self, received_message_str):
+        received_message = XMLMessageBuilder.parse(received_message_str)
+        reply = XMLMessageBuilder.parse(
+            XMLMessageBuilder.build_reply_voicemsg_for(received_message, 'id')
+        )
+
+        assert reply.is_voice()
+        assert reply.MediaId == u'id'
+
+    def test_video_replymsg_build(self, received_message_str):
+        received_message = XMLMessageBuilder.parse(received_message_str)
+        reply = XMLMessageBuilder.parse(
+            XMLMessageBuilder.build_reply_videomsg_for(
+                received_message,
+                'id',
+                title=u'标题'
+            )
+        )
+
+        assert reply.is_video()
+        assert reply.MediaId == u'id'
+        assert reply.Title == u'标题'
+        assert reply.Description == u''
+
+    def test_music_replymsg_build(self, received_message_str):
+        received_message = XMLMessageBuilder.parse(received_message_str)
+        reply = XMLMessageBuilder.parse(
+            XMLMessageBuilder.build_reply_musicmsg_for(
+                received_message,
+                'thumb_id',
+                title='music',
+                music_url='http://a.com/m.mp3?a=1&b=2',
+                hqmusic_url='http://a.com/hq.mp3'
+            )
+        )
+
+        assert reply.type == u'music'
+        assert reply.ThumbMediaId == u'thumb_id'
+        assert reply.MusicUrl == u'http://a.com/m.mp3?a=1&b=2'
+        assert reply.HQMusicUrl == u'http://a.com/hq.mp3'
+
+    def test_news_replymsg_build(self, received_message_str):
+        received_message = XMLMessageBuilder.parse(received_message_str)
+        reply_bytes = XMLMessageBuilder.build_reply_newsmsg_for(
+            received_message,
+            [{'Title': u'标题{}'.format(index), 'Url': 'http://a.com/'}
+             for index in range(8)]
+        )
+
+        reply = XMLMessageBuilder.parse(reply_bytes)
+        assert reply.type == u'news'
+        assert reply.ArticleCount == u'8'
+        assert reply.Title == u'标题0'
+        assert reply_bytes.count(b'<item>') == 8
+        assert b'<PicUrl><![CDATA[]]></PicUrl>' in reply_bytes
+
+    @pytest.mark.parametrize("count", [0, 9])
+    def test_news_articles_count(self, received_message_str, count):
+        received_message = XMLMessageBuilder.parse(received_message_str)
+
+        with pytest.raises(ValueError):
+            XMLMessageBuilder.build_reply_newsmsg_for(
+                received_message,
+                [{'Title': 'title'}] * count
+            )
+
+    def test_cdata_end(self, received_message_str):
+        received_message = XMLMessageBuilder.parse(received_message_str)
+        reply = XMLMessageBuilder.parse(
+            XMLMessageBuilder.build_reply_textmsg_for(
+                received_message,
+                u'a]]>b'
+            )
+        )
+
+        assert reply.content == u'a]]>b'
+
+    def test_non_text_content(self, received_message_str):
+        received_message = XMLMessageBuilder.parse(received_message_str)
+        reply = XMLMessageBuilder.parse(
+            XMLMessageBuilder.build_reply_textmsg_for(received_message, 123)
+        )
+
+        assert reply.content == u'123'
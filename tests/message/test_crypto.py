@@ -5,7 +5,10 @@ import re
 import mock
 import pytest
 
-from wechat.message import build_message_crypto_for
+from wechat.message import build_message_crypto_for, XMLMessageBuilder
+from wechat.message import crypto as crypto_module
+from wechat.utils import serialize_dict_to_xml
+from wechat.xmlparser import parse_flat_xml
 from wechat.message.exceptions import InvalidSignature, InvalidAppid
 
 from bs4 import BeautifulSoup
@@ -94,6 +97,23 @@ class TestMsgCrypto:
         assert int(encrypt_soup.TimeStamp.text) == timestamp
         assert encrypt_soup.Nonce.text == nonce
 
+    def test_encrypt_keeps_xml_format(self, token, aes_key, timestamp, appid,
+                                      nonce, receive_xml):
+        crypto = build_message_crypto_for(token, aes_key, appid)
+        encrypt_xml = crypto.encrypt(
+            receive_xml,
+            nonce=nonce,
+            timestamp=timestamp
+        )
+
+        fields = parse_flat_xml(encrypt_xml)
+        assert encrypt_xml == serialize_dict_to_xml(
+            Encrypt=fields['Encrypt'],
+            MsgSignature=fields['MsgSignature'],
+            TimeStamp=fields['TimeStamp'],
+            Nonce=fields['Nonce']
+        )
+
     def test_encrypt_for_default_params(self, token, aes_key,
                                         appid, receive_xml):
         crypto = build_message_crypto_for(token, aes_key, appid)
@@ -144,3 +164,79 @@ class TestMsgCrypto:
                 timestamp,
                 nonce
             )
+
+
+class TestEncryptedReply:
+
+    ENCRYPTED = (
+        u'uK+DOe54WRa31zp4IZ9wn2nmmyGW/Zp2lWg8s66DsPJDn4lq9Vl8ExMoUAYffJZh'
+        u'VNnMOay4ggAp3RGHteCKVU7krd8BUnoCcaOLyqbl36FxJWffWiOl6Xv4Xdb5fmQK'
+        u'nvG9swv4eXpTlH+L96SUa1C0dRofRC6tHJDHMNPuCun1R2UvQJRAcwoTIqwoHPMq'
+        u'JTehW3ttrohjeqaS7W9Nln3kufTmbwtyaYdwxUPP6agbc0KDGe3NzVGCQooAEmgO'
+        u'xQJW7kp2Rw6P7mLx2Mvr46bpiB6BFtDcZgnrto7/BqHzyCk50FPLl1BQDH2SgTkO'
+        u'zirV5XExAt1p+uuDSBo0Hw=='
+    )
+
+    @pytest.mark.parametrize('in_place', [True, False])
+    def test_build(self, token, aes_key, timestamp, appid, nonce,
+                   receive_xml, in_place):
+        crypto = build_message_crypto_for(token, aes_key, appid)
+        crypto._create_random_str = mock.Mock(
+            return_value='FbpmyUzSlPYw1K7D'
+        )
+
+        with mock.patch.object(
+            crypto_module,
+            '_ENCRYPT_IN_PLACE',
+            in_place and crypto_module._ENCRYPT_IN_PLACE
+        ):
+            reply = crypto.build_encrypted_reply(
+                receive_xml,
+                nonce=nonce,
+                timestamp=timestamp
+            )
+
+        assert isinstance(reply, bytes)
+        assert parse_flat_xml(reply) == {
+            u'Encrypt': self.ENCRYPTED,
+            u'MsgSignature': u'1f4874576de4a1ad6e860ec3b4aa09158897b784',
+            u'TimeStamp': u'{}'.format(timestamp),
+            u'Nonce': nonce,
+        }
+
+    @pytest.mark.parametrize('length', [0, 1, 31, 32, 33, 1000])
+    def test_decrypt(self, token, aes_key, appid, length):
+        crypto = build_message_crypto_for(token, aes_key, appid)
+        message = b'x' * length
+
+        reply = parse_flat_xml(crypto.build_encrypted_reply(
+            message,
+            nonce='nonce',
+            timestamp='1409735669'
+        ))
+
+        assert crypto.decrypt(
+            u'<xml><Encrypt>{}</Encrypt></xml>'.format(reply[u'Encrypt']),
+            reply[u'MsgSignature'],
+            reply[u'TimeStamp'],
+            reply[u'Nonce']
+        ) == message.decode('utf-8')
+
+    def test_builder(self, token, aes_key, appid, receive_xml):
+        crypto = build_message_crypto_for(token, aes_key, appid)
+        message = XMLMessageBuilder.parse(receive_xml)
+
+        reply = parse_flat_xml(XMLMessageBuilder.build_encrypted_reply(
+            crypto,
+            XMLMessageBuilder.build_reply_textmsg_for,
+            message,
+            u'回复'
+        ))
+        reply_xml = crypto.decrypt(
+            u'<xml><Encrypt>{}</Encrypt></xml>'.format(reply[u'Encrypt']),
+            reply[u'MsgSignature'],
+            reply[u'TimeStamp'],
+            reply[u'Nonce']
+        )
+
+        assert XMLMessageBuilder.parse(reply_xml).content == u'回复'
@@ -0,0 +1,86 @@
+# -*- encoding: utf-8
+
+import pytest
+
+from wechat.message.models import XMLMessage
+
+
+SCANCODE_EVENT_XML = u"""<xml>
+<ToUserName><![CDATA[gh_e136c6e50636]]></ToUserName>
+<FromUserName><![CDATA[oMgHVjngRipVsoxg6TuX3vz6glDg]]></FromUserName>
+<CreateTime>1408090502</CreateTime>
+<MsgType><![CDATA[event]]></MsgType>
+<Event><![CDATA[scancode_push]]></Event>
+<EventKey><![CDATA[6]]></EventKey>
+<ScanCodeInfo><ScanType><![CDATA[qrcode]]></ScanType>
+<ScanResult><![CDATA[1]]></ScanResult>
+</ScanCodeInfo>
+</xml>"""
+
+SUBSCRIBE_EVENT_XML = u"""<xml>
+<ToUserName><![CDATA[toUser]]></ToUserName>
+<FromUserName><![CDATA[FromUser]]></FromUserName>
+<CreateTime>123456789</CreateTime>
+<MsgType><![CDATA[event]]></MsgType>
+<Event><![CDATA[subscribe]]></Event>
+<EventKey><![CDATA[qrscene_123123]]></EventKey>
+<Ticket><![CDATA[TICKET]]></Ticket>
+</xml>"""
+
+
+class TestXMLMessage:
+
+    def test_text(self, received_message_str):
+        message = XMLMessage(received_message_str.encode('utf-8'))
+
+        assert message.is_text()
+        assert message.id == 1234567890123456
+        assert message.create_timestamp == 1348831860
+        assert message.content == u'this is a test'
+        assert message.Event is None
+
+    def test_event(self):
+        message = XMLMessage(SUBSCRIBE_EVENT_XML)
+
+        assert message.is_event()
+        assert message.is_subscribe_event()
+        assert message.is_qrscene_subscribe_event()
+        assert not message.is_scan_event()
+        assert message.id == -1
+        assert message.Ticket == u'TICKET'
+        assert message.content == u'[event]'
+
+    def test_nested_tags(self):
+        message = XMLMessage(SCANCODE_EVENT_XML)
+
+        assert message.ScanResult == u'1'
+        assert message.ScanCodeInfo == message.soup.ScanCodeInfo.text
+
+    @pytest.mark.parametrize("raw_xml", [
+        SCANCODE_EVENT_XML,
+        SUBSCRIBE_EVENT_XML,
+    ])
+    def test_same_as_soup(self, raw_xml):
+        message = XMLMessage(raw_xml)
+
+        for tag in message.soup.find_all(True):
+            assert getattr(message, tag.name) == tag.text
+
+    def test_malformed(self):
+        message = XMLMessage(
+            u'<xml><MsgType>text</MsgType><Content>a & b</Content></xml>'
+        )
+
+        assert message.is_text()
+        assert message.content == message.soup.Content.text
+
+    def test_immutable(self, received_message_str):
+        message = XMLMessage(received_message_str)
+
+        assert not hasattr(message, '__dict__')
+        with pytest.raises(AttributeError):
+            message.Content = u'other'
+
+    def test_type_error(self):
+        with pytest.raises(TypeError):
+            XMLMessage(None)
@@ -0,0 +1,421 @@
+# -*- encoding: utf-8
+
+import time
+import threading
+
+import pytest
+import mock
+
+from wechat import RequestException
+from wechat.exceptions import DeadlineExceeded
+from wechat.hostpool import HostPool
+from wechat.latency import AdaptiveTimeout
+from wechat import settings
+from wechat.result import build_from, build_from_response
+from wechat.tokens import AccessTokenManager
+
+from .compat import parse_qsl, urlparse
+
+
+aiohttp = pytest.importorskip('aiohttp')
+asyncio = pytest.importorskip('asyncio')
+
+from wechat import aio # noqa
+
+
+@pytest.fixture
+def run():
+    loop = asyncio.new_event_loop()
+
+    def runner(coro):
+        return loop.run_until_complete(coro)
+
+    yield runner
+    loop.close()
+
+
+@pytest.fixture
+def mpapi(run, mp_access_token):
+    api = aio.formp(mp_access_token)
+    yield api
+    run(api.close())
+
+
+class TestAsyncMpApi:
+
+    @pytest.mark.parametrize("method", ['get', 'post'])
+    def test_auth(self, run, mpapi, mp_access_token, httpbin, method):
+        request_func = getattr(mpapi, method)
+        result = run(request_func(httpbin(method.lower())))
+        actual_params_dict = dict(parse_qsl(
+            urlparse(str(result.request.url)).query
+        ))
+
+        assert not result.is_failed
+        assert actual_params_dict['access_token'] == mp_access_token
+
+    def test_get_params(self, run, mpapi, httpbin):
+        result = run(mpapi.get(httpbin('get'), openid='openid', count=2))
+
+        assert result.args['openid'] == 'openid'
+        assert result.args['count'] == '2'
+
+    def test_headers(self, run, mp_access_token, httpbin):
+        api = aio.formp(mp_access_token, headers={"Group-Header": "val"})
+        result = run(api.get(httpbin('headers')))
+        run(api.close())
+
+        assert result.headers['Group-Header'] == 'val'
+        assert result.headers['User-Agent'] == \
+            settings.DEFAULT_HEADERS['User-Agent']
+
+    @pytest.mark.parametrize('status_code', [300, 400])
+    def test_status_error(self, run, mpapi, httpbin, status_code):
+        result = run(mpapi.get(httpbin('status/{}'.format(status_code))))
+
+        assert result.is_failed
+        assert result.errcode == status_code
+
+    def test_default_retry(self, run, mpapi, httpbin, max_retries_time):
+        start = time.time()
+
+        with pytest.raises(RequestException):
+            run(mpapi.get(httpbin('status/502')))
+
+        assert time.time() - start >= max_retries_time
+
+    def test_no_transport_retry_before_failover(self, run, mp_access_token,
+                                                httpbin, max_retries_time):
+        primary = httpbin().rstrip('/')
+        backup = primary.replace(urlparse(primary).hostname, 'localhost')
+        api = aio.formp(mp_access_token, host_pool=HostPool([primary, backup]))
+        start = time.time()
+
+        result = run(api.get(httpbin('status', '502')))
+        run(api.close())
+
+        assert time.time() - start < max_retries_time
+        assert result.status_code == 502
+        assert urlparse(str(result.request.url)).hostname == 'localhost'
+
+    def test_get_timeout(self, run, mpapi, httpbin):
+        with pytest.raises(RequestException, match=r'timed out'):
+            run(mpapi.get(httpbin('delay/0.1'), timeout=0.05))
+
+    def test_deadline(self, run, mpapi, httpbin, max_retries_time):
+        start = time.time()
+
+        with pytest.raises(DeadlineExceeded):
+            run(mpapi.get(httpbin('status/502'), deadline=0.05))
+
+        assert time.time() - start < max_retries_time
+
+    def test_session_of_previous_loop_closed(self, mp_access_token,
+                                             httpbin):
+        api = aio.formp(mp_access_token)
+        loops = [asyncio.new_event_loop() for _ in range(2)]
+        sessions = []
+        for loop in loops:
+            loop.run_until_complete(api.get(httpbin('get')))
+            sessions.append(api._session)
+        loops[-1].run_until_complete(api.close())
+        for loop in loops:
+            loop.close()
+
+        assert sessions[0] is not sessions[1]
+        assert all(session.closed for session in sessions)
+
+    def test_concurrent_requests(self, run, mpapi, fake_response):
+        async def slow_execute(*args, **kwargs):
+            await asyncio.sleep(0.2)
+            return build_from_response(fake_response(text='{}'))
+
+        async def gather():
+            return await asyncio.gather(*[
+                mpapi.get('user/info') for _ in range(5)
+            ])
+
+        mpapi._execute_request = slow_execute
+        start = time.time()
+        results = run(gather())
+
+        assert all(not result.is_failed for result in results)
+        assert time.time() - start < 0.2 * 5
+
+    def test_map(self, run, mpapi, fake_response):
+        in_flight = []
+        max_in_flight = []
+
+        async def slow_execute(method, url, params_dict=None, **kwargs):
+            in_flight.append(url)
+            max_in_flight.append(len(in_flight))
+            await asyncio.sleep(0.05)
+            in_flight.remove(url)
+            if url.endswith('/error'):
+                raise RequestException('connection reset')
+            return build_from_response(fake_response(
+                text=u'{{"openid": "{}"}}'.format(params_dict['openid'])
+            ))
+
+        mpapi._execute_request = slow_execute
+        calls = [('GET', 'user/info', {'openid': str(i)}) for i in range(6)]
+        calls.insert(2, ('GET', 'error', {'openid': 'x'}))
+
+        results = run(mpapi.map(calls, max_concurrency=2))
+
+        assert len(results) == 7
+        assert results[2].is_failed
+        assert results[2].errcode == u'REQUEST_EXCEPTION'
+        assert [r.openid for r in results if not r.is_failed] == [
+            str(i) for i in range(6)
+        ]
+        assert max(max_in_flight) == 2
+
+    def test_map_empty(self, run, mpapi):
+        assert run(mpapi.map([])) == []
+
+
+class TestAsyncAuthExpired:
+
+    def _patch_execute(self, api, fake_response, *texts):
+        api._execute_request = mock.AsyncMock(side_effect=[
+            build_from_response(fake_response(text=text)) for text in texts
+        ])
+
+    def test_sync_auth_update_callback(self, run, fake_response,
+                                       mp_access_token, auth_expired_ret):
+        auth_update = mock.Mock(return_value='new_token')
+        api = aio.formp(mp_access_token, auth_update_callback=auth_update)
+        self._patch_execute(api, fake_response, auth_expired_ret, '{}')
+
+        result = run(api.get('/'))
+
+        auth_update.assert_called_once_with()
+        assert not result.is_failed
+        assert api._execute_request.call_args[1]['params_dict'] == {
+            'access_token': 'new_token'
+        }
+
+    def test_async_auth_update_callback(self, run, fake_response,
+                                        mp_access_token, auth_expired_ret):
+        auth_update = mock.AsyncMock(return_value='new_token')
+        api = aio.formp(mp_access_token, auth_update_callback=auth_update)
+        self._patch_execute(api, fake_response, auth_expired_ret, '{}')
+
+        result = run(api.get('/'))
+
+        auth_update.assert_awaited_once_with()
+        assert not result.is_failed
+
+    def test_auth_update_failed(self, run, fake_response,
+                                mp_access_token, auth_expired_ret):
+        auth_update = mock.AsyncMock(side_effect=Exception('update error'))
+        auth_update.__name__ = 'auth_update'
+        api = aio.formp(mp_access_token, auth_update_callback=auth_update)
+        self._patch_execute(api, fake_response, auth_expired_ret, '{}')
+
+        with pytest.raises(RequestException):
+            run(api.get('/'))
+
+    def test_mp_auth_retry(self, run, fake_response, mp_appid, mp_secret):
+        with mock.patch.object(
+            aio.AsyncMpOuthApi,
+            '_execute_request',
+            mock.AsyncMock(return_value=build_from_response(
+                fake_response(text=u'{"errcode": -1}')
+            ))
+        ) as patched_execute:
+            result = run(aio.get_mp_access_token(mp_appid, mp_secret))
+
+        assert result.errcode == -1
+        assert patched_execute.await_count == 2
+
+
+class TestAsyncTokenManager:
+
+    def test_fetch_off_loop(self, run, fake_response, mp_appid, mp_secret):
+        fetch_threads = []
+
+        def fetcher():
+            fetch_threads.append(threading.current_thread())
+            time.sleep(0.2)
+            return build_from({'access_token': 'token', 'expires_in': 7200})
+
+        manager = AccessTokenManager(mp_appid, mp_secret, fetcher=fetcher)
+        api = aio.formp(token_manager=manager)
+        api._execute_request = mock.AsyncMock(
+            return_value=build_from_response(fake_response(text='{}'))
+        )
+        ticks = []
+
+        async def tick():
+            for _ in range(10):
+                ticks.append(time.time())
+                await asyncio.sleep(0.01)
+
+        async def gather():
+            await asyncio.gather(api.get('user/info'), tick())
+            await api.get('user/info')
+
+        run(gather())
+
+        assert fetch_threads == [fetch_threads[0]]
+        assert fetch_threads[0] is not threading.current_thread()
+        assert max(b - a for a, b in zip(ticks, ticks[1:])) < 0.1
+        calls = api._execute_request.call_args_list
+        assert [call[1]['params_dict'] for call in calls] == [
+            {'access_token': 'token'}
+        ] * 2
+
+
+class TestAsyncPayAndWebAuth:
+
+    def test_wxpay_post_xml_body(self, run, fake_response, mp_appid):
+        wxpay = aio.for_merchant(mp_appid, 'dummy_mchid', 'dummy_signkey')
+        wxpay._execute_request = mock.AsyncMock(
+            return_value=build_from_response(fake_response(text='<xml></xml>'))
+        )
+
+        result = run(wxpay.orderquery(out_trade_no='dummy_out_trade_no'))
+
+        assert not result.is_failed
+        call_args = wxpay._execute_request.call_args
+        assert call_args[0][1] == \
+            u'https://api.mch.weixin.qq.com/pay/orderquery'
+        assert b'<out_trade_no><![CDATA[dummy_out_trade_no]]>' in (
+            call_args[1]['data']
+        )
+
+    def test_web_auth(self, run, fake_response, mocker, mp_appid, mp_secret):
+        patched_execute = mock.AsyncMock(
+            return_value=build_from_response(fake_response(text='{}'))
+        )
+        mocker.patch.object(
+            aio.web_auth._api,
+            '_execute_request',
+            patched_execute
+        )
+
+        run(aio.web_auth.get_access_token(mp_appid, mp_secret, 'fake_code'))
+        patched_execute.assert_awaited_once_with(
+            'GET',
+            'https://api.weixin.qq.com/sns/oauth2/access_token',
+            params_dict={
+                "grant_type": "authorization_code",
+                "appid": mp_appid,
+                "secret": mp_secret,
+                "code": "fake_code"
+            },
+            allow_redirects=False,
+            timeout=mocker.ANY
+        )
+
+
+class TestAsyncCoalesce:
+
+    def test_coalesce_get(self, run, mp_access_token, fake_response):
+        api = aio.formp(mp_access_token, coalesce=True)
+
+        async def slow_execute(*args, **kwargs):
+            await asyncio.sleep(0.1)
+            return build_from_response(fake_response(text='{}'))
+
+        api._execute_request = mock.AsyncMock(side_effect=slow_execute)
+
+        async def gather():
+            return await asyncio.gather(*[
+                api.get('user/info', openid='o1') for _ in range(5)
+            ])
+
+        results = run(gather())
+
+        assert api._execute_request.await_count == 1
+        assert all(result is results[0] for result in results)
+
+    def test_follower_timeout(self, run, mp_access_token, fake_response):
+        api = aio.formp(mp_access_token, coalesce=True)
+        delays = iter([5, 0])
+
+        async def slow_execute(*args, **kwargs):
+            await asyncio.sleep(next(delays))
+            return build_from_response(fake_response(text='{}'))
+
+        api._execute_request = mock.AsyncMock(side_effect=slow_execute)
+
+        async def follow():
+            leader = asyncio.ensure_future(api.get('user/info'))
+            await asyncio.sleep(0.05)
+            try:
+                return await api.get('user/info', timeout=0.1)
+            finally:
+                leader.cancel()
+
+        start = time.time()
+        result = run(follow())
+
+        assert not result.is_failed
+        assert time.time() - start < 1
+        assert api._execute_request.await_count == 2
+
+
+class TestAsyncHedging:
+
+    def test_hedge_slow_request(self, run, mp_access_token, fake_response):
+        adaptive_timeout = AdaptiveTimeout(hedge=True)
+        for _ in range(20):
+            adaptive_timeout.observe(
+                u'https://api.weixin.qq.com/cgi-bin/getcallbackip',
+                0.02
+            )
+        api = aio.formp(mp_access_token, adaptive_timeout=adaptive_timeout)
+        delays = iter([0.5, 0.01])
+
+        async def slow_execute(*args, **kwargs):
+            delay = next(delays)
+            await asyncio.sleep(delay)
+            return build_from_response(
+                fake_response(text='{{"delay": {}}}'.format(delay))
+            )
+
+        api._execute_request = slow_execute
+        start = time.time()
+
+        result = run(api.get('getcallbackip'))
+
+        assert result.delay == 0.01
+        assert time.time() - start < 0.3
+
+    def test_hedge_counted_by_breaker(self, run, mp_access_token,
+                                      fake_response):
+        from wechat.circuitbreaker import CircuitBreaker
+        from wechat.exceptions import ReadTimeout
+
+        adaptive_timeout = AdaptiveTimeout(hedge=True)
+        for _ in range(20):
+            adaptive_timeout.observe(
+                u'https://api.weixin.qq.com/cgi-bin/getcallbackip',
+                0.02
+            )
+        breaker = CircuitBreaker()
+        breaker.record = mock.Mock(wraps=breaker.record)
+        api = aio.formp(
+            mp_access_token,
+            adaptive_timeout=adaptive_timeout,
+            circuit_breaker=breaker
+        )
+        responses = iter([(0.1, None), (0, ReadTimeout())])
+
+        async def slow_execute(*args, **kwargs):
+            delay, error = next(responses)
+            await asyncio.sleep(delay)
+            if error is not None:
+                raise error
+            return build_from_response(fake_response(text='{}'))
+
+        api._execute_request = slow_execute
+
+        assert not run(api.get('getcallbackip')).is_failed
+        assert [args[0][1] for args in breaker.record.call_args_list] == [
+            True,
+            False
+        ]
@@ -0,0 +1,77 @@
+# -*- encoding: utf-8
+
+import io
+
+import pytest
+
+
+aiohttp = pytest.importorskip('aiohttp')
+asyncio = pytest.importorskip('asyncio')
+
+from wechat import aio # noqa
+
+
+@pytest.fixture
+def run():
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
+
+
+class TestAsyncDownload:
+
+    def _download(self, run, url, dest=None, read=False):
+        async def _run():
+            async with aio.formp('token') as api:
+                result = await api.download(url, dest)
+                chunks = None
+                if read:
+                    chunks = [
+                        chunk async for chunk in result.iter_content(100)
+                    ]
+                return result, chunks
+
+        return run(_run())
+
+    def test_iter_content(self, run, httpbin):
+        result, chunks = self._download(
+            run,
+            httpbin('stream-bytes/1000'),
+            read=True
+        )
+
+        assert isinstance(result, aio.AsyncStreamResult)
+        assert sum(len(chunk) for chunk in chunks) == 1000
+        assert max(len(chunk) for chunk in chunks) <= 100
+        assert result.size == 1000
+
+    def test_save_to_path(self, run, httpbin, tmpdir):
+        dest = str(tmpdir.join('media'))
+
+        result, _ = self._download(run, httpbin('bytes/1000'), dest)
+
+        assert result.size == 1000
+        assert result.content_length == 1000
+        with open(dest, 'rb') as dest_file:
+            assert len(dest_file.read()) == 1000
+
+    def test_error(self, run, httpbin):
+        # {"errcode": 40007}
+        result, _ = self._download(
+            run,
+            httpbin('base64/eyJlcnJjb2RlIjogNDAwMDd9'),
+            io.BytesIO()
+        )
+
+        assert result.errcode == 40007
+
+    def test_get_material(self, run, httpbin):
+        async def _run():
+            async with aio.formp('token') as api:
+                api._base_url = httpbin('anything')
+                return await api.get_material('media_id')
+
+        result = run(_run())
+
+        assert result.json['json'] == {'media_id': 'media_id'}
+        assert u'/anything/material/get_material?' in result.url
@@ -0,0 +1,138 @@
+# -*- encoding: utf-8
+
+import threading
+
+import pytest
+import mock
+
+from wechat.mediacache import MemoryMediaCache
+from wechat.multipart import MultipartEncoder
+from wechat.result import build_from_response
+
+
+aiohttp = pytest.importorskip('aiohttp')
+asyncio = pytest.importorskip('asyncio')
+
+from wechat import aio # noqa
+
+
+@pytest.fixture
+def run():
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
+
+
+class TestAsyncUpload:
+
+    def test_upload(self, run, httpbin, media_path):
+        async def _run():
+            async with aio.formp('token') as api:
+                return await api.upload(
+                    httpbin('post'),
+                    {'media': media_path},
+                    {'description': '{"title": "t"}'},
+                    type='image'
+                )
+
+        result = run(_run())
+
+        assert result.files == {'media': 'jpeg'}
+        assert result.form == {'description': '{"title": "t"}'}
+        assert result.args['type'] == 'image'
+        assert int(result.headers['Content-Length']) > 0
+        assert 'Transfer-Encoding' not in result.headers
+
+    def _build_api(self, fake_response, auth_expired_ret, bodies):
+        api = aio.formp('token', auth_update_callback=lambda: 'new_token')
+        results = iter([auth_expired_ret, u'{"media_id": "id"}'])
+
+        async def _execute(method, url, params_dict=None, **kwargs):
+            bodies.append(kwargs['data'].read())
+            return build_from_response(fake_response(text=next(results)))
+
+        api._execute_request = _execute
+        return api
+
+    def test_no_rewind_without_retry(self, run, fake_response):
+        api = aio.formp('token', auth_update_callback=lambda: 'new_token')
+        encoder = mock.Mock(spec=MultipartEncoder)
+        result = build_from_response(fake_response(text=u'{"errcode": 40004}'))
+
+        assert run(
+            api._retry(result, 'POST', 'url', {}, data=encoder)
+        ) is result
+        assert not encoder.rewind.called
+
+    def test_rewind_on_token_expired(self, run, fake_response,
+                                     auth_expired_ret, media_path):
+        bodies = []
+        api = self._build_api(fake_response, auth_expired_ret, bodies)
+
+        result = run(api.add_material('image', media_path))
+
+        assert result.media_id == 'id'
+        assert len(bodies) == 2
+        assert bodies[0] == bodies[1]
+
+    def test_iterable_not_retried(self, run, fake_response,
+                                  auth_expired_ret):
+        bodies = []
+        api = self._build_api(fake_response, auth_expired_ret, bodies)
+
+        result = run(api.upload_media(
+            'voice',
+            ('a.amr', iter([b'amr']), 'audio/amr', 3)
+        ))
+
+        assert result.is_failed
+        assert len(bodies) == 1
+
+    def test_media_cache(self, run, fake_response, media_path):
+        api = aio.formp(
+            'token',
+            media_cache=MemoryMediaCache(),
+            appid='appid'
+        )
+        calls = []
+
+        async def _execute(method, url, params_dict=None, **kwargs):
+            calls.append(kwargs['data'].read())
+            return build_from_response(fake_response(
+                text=u'{"type": "image", "media_id": "id"}'
+            ))
+
+        api._execute_request = _execute
+
+        assert run(api.upload_media('image', media_path)).media_id == 'id'
+        assert run(api.upload_media('image', b'jpeg')).media_id == 'id'
+        assert len(calls) == 1
+
+    def test_blocking_io_off_loop(self, run, fake_response, media_path):
+        media_cache = MemoryMediaCache()
+        api = aio.formp('token', media_cache=media_cache, appid='appid')
+        threads = []
+
+        def _record(func):
+            def inner(*args, **kwargs):
+                threads.append(threading.current_thread())
+                return func(*args, **kwargs)
+            return inner
+
+        media_cache.get = _record(media_cache.get)
+        media_cache.set = _record(media_cache.set)
+
+        async def _execute(method, url, params_dict=None, **kwargs):
+            writer = mock.Mock(write=mock.AsyncMock())
+            encoder = kwargs['data']
+            encoder.read = _record(encoder.read)
+            await aio._MultipartPayload(encoder).write(writer)
+            return build_from_response(fake_response(
+                text=u'{"type": "image", "media_id": "id"}'
+            ))
+
+        api._execute_request = _execute
+
+        assert run(api.upload_media('image', media_path)).media_id == 'id'
+        assert len(threads) > 2
+        assert threading.main_thread() not in threads
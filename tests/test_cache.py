@@ -0,0 +1,195 @@
+# -*- encoding: utf-8
+
+import time
+
+import mock
+
+from wechat import mpapi
+from wechat.api import Api
+from wechat.cache import ResponseCache
+from wechat.result import build_from_response
+
+
+API_URL = u'https://api.weixin.qq.com/cgi-bin/{}'
+
+
+def _build_result(fake_response, text=u'{"ip_list": ["127.0.0.1"]}'):
+    return build_from_response(fake_response(text=text))
+
+
+class TestResponseCache:
+
+    def test_ttl_rules(self):
+        cache = ResponseCache(ttls={'menu/get': 60, 'get': 1})
+
+        assert cache.ttl_for(API_URL.format('menu/get')) == 60
+        assert cache.ttl_for(API_URL.format('tags/get')) == 1
+        assert cache.ttl_for(API_URL.format('user/info')) is None
+
+    def test_default_ttl(self):
+        cache = ResponseCache(ttls={'menu/get': 60}, default_ttl=5)
+
+        assert cache.ttl_for(API_URL.format('user/info')) == 5
+
+    def test_key_excludes_auth_params(self):
+        cache = ResponseCache()
+
+        assert cache.build_key(
+            'get',
+            API_URL.format('user/info'),
+            {'access_token': 'old', 'openid': 'o1'},
+            exclude=['access_token']
+        ) == cache.build_key(
+            'GET',
+            API_URL.format('user/info'),
+            {'access_token': 'new', 'openid': 'o1'},
+            exclude=['access_token']
+        )
+
+    def test_expire(self, fake_response):
+        cache = ResponseCache()
+        cache.set('key', _build_result(fake_response), 0.01)
+
+        assert cache.get('key') is not None
+        time.sleep(0.02)
+        assert cache.get('key') is None
+        assert cache.stats()['entries'] == 0
+
+    def test_error_result_not_cached(self, fake_response):
+        cache = ResponseCache()
+        error_result = _build_result(fake_response, u'{"errcode": -1}')
+
+        assert not cache.set('key', error_result, 60)
+        assert cache.get('key') is None
+
+    def test_lru_eviction_by_bytes(self, fake_response):
+        text = u'{"a": 1}'
+        cache = ResponseCache(max_bytes=len(text) * 2)
+        for key in ('k1', 'k2'):
+            cache.set(key, _build_result(fake_response, text), 60)
+
+        cache.get('k1')
+        cache.set('k3', _build_result(fake_response, text), 60)
+
+        assert cache.get('k2') is None
+        assert cache.get('k1') is not None
+        assert cache.get('k3') is not None
+        stats = cache.stats()
+        assert stats['evictions'] == 1
+        assert stats['bytes'] == len(text) * 2
+
+    def test_lru_eviction_by_entries(self, fake_response):
+        cache = ResponseCache(max_entries=1)
+        cache.set('k1', _build_result(fake_response), 60)
+        cache.set('k2', _build_result(fake_response), 60)
+
+        assert cache.get('k1') is None
+        assert cache.stats()['evictions'] == 1
+
+    def test_too_large_result_not_cached(self, fake_response):
+        cache = ResponseCache(max_bytes=1)
+
+        assert not cache.set('key', _build_result(fake_response), 60)
+
+
+class TestApiResponseCache:
+
+    def _build_api(self, fake_response, text=u'{"ip_list": []}', **kwargs):
+        cache = ResponseCache(ttls={'getcallbackip': 60})
+        api = mpapi.formp('token', response_cache=cache, **kwargs)
+        api._execute_request = mock.Mock(
+            return_value=_build_result(fake_response, text)
+        )
+        return api, cache
+
+    def test_hit_without_network(self, fake_response):
+        api, cache = self._build_api(fake_response)
+
+        first_result = api.get('getcallbackip')
+        second_result = api.get('getcallbackip')
+
+        assert second_result is first_result
+        assert api._execute_request.call_count == 1
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['misses'] == 1
+
+    def test_hit_after_token_changed(self, fake_response):
+        api, _ = self._build_api(fake_response)
+
+        api.get('getcallbackip')
+        api._auth_token = 'new_token'
+        api.get('getcallbackip')
+
+        assert api._execute_request.call_count == 1
+
+    def test_params_in_key(self, fake_response):
+        api, _ = self._build_api(fake_response)
+
+        api.get('getcallbackip', lang='zh_CN')
+        api.get('getcallbackip', lang='en')
+
+        assert api._execute_request.call_count == 2
+
+    def test_path_without_ttl_not_cached(self, fake_response):
+        api, cache = self._build_api(fake_response)
+
+        api.get('user/info')
+        api.get('user/info')
+
+        assert api._execute_request.call_count == 2
+        assert cache.stats()['entries'] == 0
+
+    def test_post_not_cached(self, fake_response):
+        api, _ = self._build_api(fake_response)
+
+        api.post('getcallbackip', json={})
+        api.post('getcallbackip', json={})
+
+        assert api._execute_request.call_count == 2
+
+    def test_error_not_cached(self, fake_response):
+        api, cache = self._build_api(fake_response, u'{"errcode": 45009}')
+
+        api.get('getcallbackip')
+        api.get('getcallbackip')
+
+        assert api._execute_request.call_count == 2
+        assert cache.stats()['entries'] == 0
+
+    def test_web_api_excludes_secret(self, fake_response):
+        cache = ResponseCache(default_ttl=60)
+        api = Api(response_cache=cache)
+        api._execute_request = mock.Mock(
+            return_value=_build_result(fake_response)
+        )
+
+        api.get('userinfo', openid='o1', access_token='t1')
+        api.get('userinfo', openid='o1', access_token='t2')
+
+        assert api._execute_request.call_count == 1
+
+    def test_appids_not_shared(self, fake_response):
+        cache = ResponseCache(ttls={'getcallbackip': 60})
+        apis = [
+            mpapi.formp('token', response_cache=cache, appid=appid)
+            for appid in ('appid1', 'appid2', 'appid1')
+        ]
+        for api in apis:
+            api._execute_request = mock.Mock(
+                return_value=_build_result(fake_response)
+            )
+            api.get('getcallbackip')
+
+        assert [api._execute_request.call_count for api in apis] == [1, 1, 0]
+
+    def test_instances_without_appid_not_shared(self, fake_response):
+        cache = ResponseCache(ttls={'getcallbackip': 60})
+        apis = [mpapi.formp('token', response_cache=cache) for _ in range(2)]
+        for api in apis:
+            api._execute_request = mock.Mock(
+                return_value=_build_result(fake_response)
+            )
+            api.get('getcallbackip')
+            api.get('getcallbackip')
+
+        assert [api._execute_request.call_count for api in apis] == [1, 1]
@@ -0,0 +1,155 @@
+# -*- encoding: utf-8
+
+import time
+
+import pytest
+import mock
+
+from wechat import mpapi
+from wechat.circuitbreaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+from wechat.exceptions import CircuitOpenError, ReadTimeout
+from wechat.result import build_from_response
+
+
+HOST = u'https://api.weixin.qq.com'
+URL = HOST + u'/cgi-bin/user/info'
+
+
+@pytest.fixture
+def state_changes():
+    return []
+
+
+@pytest.fixture
+def breaker(state_changes):
+    return CircuitBreaker(
+        failure_threshold=2,
+        cool_down=0.05,
+        on_state_change=lambda *change: state_changes.append(change)
+    )
+
+
+def _open(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.before_request(URL)
+        breaker.record(URL, True)
+
+
+class TestCircuitBreaker:
+
+    def test_open_after_threshold(self, breaker, state_changes):
+        breaker.before_request(URL)
+        breaker.record(URL, True)
+        assert breaker.state(URL) == CLOSED
+
+        breaker.before_request(URL)
+        breaker.record(URL, True)
+        assert breaker.state(URL) == OPEN
+        assert state_changes == [(HOST, CLOSED, OPEN)]
+
+        with pytest.raises(CircuitOpenError):
+            breaker.before_request(URL)
+
+    def test_success_resets_failures(self, breaker):
+        breaker.record(URL, True)
+        breaker.record(URL, False)
+        breaker.record(URL, True)
+
+        assert breaker.state(URL) == CLOSED
+
+    def test_half_open_probe_closes(self, breaker, state_changes):
+        _open(breaker)
+        time.sleep(0.06)
+
+        breaker.before_request(URL)
+        assert breaker.state(URL) == HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_request(URL)
+
+        breaker.record(URL, False)
+        assert breaker.state(URL) == CLOSED
+        assert state_changes[1:] == [
+            (HOST, OPEN, HALF_OPEN),
+            (HOST, HALF_OPEN, CLOSED)
+        ]
+
+    def test_half_open_probe_failure_reopens(self, breaker):
+        _open(breaker)
+        time.sleep(0.06)
+
+        breaker.before_request(URL)
+        breaker.record(URL, True)
+
+        assert breaker.state(URL) == OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_request(URL)
+
+    def test_hosts_isolated(self, breaker):
+        _open(breaker)
+
+        breaker.before_request(u'https://api2.weixin.qq.com/cgi-bin/token')
+
+    def test_hook_error_ignored(self):
+        breaker = CircuitBreaker(
+            failure_threshold=1,
+            on_state_change=mock.Mock(side_effect=Exception('hook'))
+        )
+        breaker.record(URL, True)
+
+        assert breaker.state(URL) == OPEN
+
+    def test_is_failure(self, breaker, fake_response):
+        assert breaker.is_failure(error=ReadTimeout())
+        assert breaker.is_failure(
+            result=build_from_response(fake_response(503, 'busy'))
+        )
+        assert not breaker.is_failure(
+            result=build_from_response(fake_response(text='{"errcode": 1}'))
+        )
+
+    def test_is_failure_lazy(self, breaker, fake_response):
+        assert breaker.is_failure(result=build_from_response(
+            fake_response(502, 'bad gateway'),
+            lazy=True
+        ))
+        assert not breaker.is_failure(result=build_from_response(
+            fake_response(text='{}'),
+            lazy=True
+        ))
+
+
+class TestApiCircuitBreaker:
+
+    def test_fail_fast(self, breaker):
+        api = mpapi.formp('token', circuit_breaker=breaker)
+        api._execute_request = mock.Mock(side_effect=ReadTimeout())
+
+        for _ in range(2):
+            with pytest.raises(ReadTimeout):
+                api.get('user/info')
+
+        with pytest.raises(CircuitOpenError):
+            api.get('user/info')
+        assert api._execute_request.call_count == 2
+
+    def test_batch_result_of_open_circuit(self, breaker):
+        _open(breaker)
+        api = mpapi.formp('token', circuit_breaker=breaker)
+        api._execute_request = mock.Mock()
+
+        result, = api.map([('GET', 'user/info')])
+
+        assert result.is_failed
+        assert isinstance(result.exception, CircuitOpenError)
+        api._execute_request.assert_not_called()
+
+    def test_api_errcode_not_failure(self, breaker, fake_response):
+        api = mpapi.formp('token', circuit_breaker=breaker)
+        api._execute_request = mock.Mock(return_value=build_from_response(
+            fake_response(text='{"errcode": 45009}')
+        ))
+
+        for _ in range(3):
+            api.get('user/info')
+
+        assert breaker.state(URL) == CLOSED
@@ -0,0 +1,120 @@
+# -*- encoding: utf-8
+
+import time
+
+import pytest
+import mock
+
+from wechat import mpapi
+from wechat.deadline import Deadline, DeadlineTimeout, DeadlineRetry
+from wechat.exceptions import DeadlineExceeded, RequestException
+from wechat.result import build_from_response
+
+
+class TestDeadline:
+
+    def test_remaining(self):
+        deadline = Deadline(0.05)
+
+        assert 0 < deadline.remaining() <= 0.05
+        time.sleep(0.06)
+        assert deadline.remaining() == 0
+        with pytest.raises(DeadlineExceeded):
+            deadline.check()
+
+    def test_invalid_budget(self):
+        with pytest.raises(ValueError):
+            Deadline(0)
+
+    @pytest.mark.parametrize('timeout, expected', [
+        (None, 1),
+        (0.5, 0.5),
+        (5, 1),
+        ((0.5, 5), (0.5, 1)),
+    ])
+    def test_attempt_timeout(self, timeout, expected):
+        deadline = Deadline(1)
+
+        assert deadline.attempt_timeout(timeout) == pytest.approx(
+            expected,
+            abs=0.01
+        )
+
+    def test_timeout_clone_to_remaining(self):
+        deadline = Deadline(1)
+        timeout = DeadlineTimeout(deadline, 5)
+        time.sleep(0.1)
+
+        cloned = timeout.clone()
+        assert cloned.total <= 0.9
+        assert cloned.connect_timeout <= 0.9
+
+    def test_retry_exhausted_by_deadline(self):
+        deadline = Deadline(0.05)
+        retry = DeadlineRetry.for_deadline(deadline).new()
+
+        assert retry.deadline is deadline
+        assert not retry.is_exhausted()
+        time.sleep(0.06)
+        assert retry.is_exhausted()
+        assert retry.get_backoff_time() == 0
+
+
+class TestApiDeadline:
+
+    @pytest.fixture
+    def api(self, mp_access_token):
+        return mpapi.formp(mp_access_token)
+
+    def test_bound_retries(self, api, httpbin, max_retries_time):
+        start = time.time()
+
+        with pytest.raises(DeadlineExceeded):
+            api.get(httpbin('status/502'), deadline=0.05)
+
+        assert time.time() - start < max_retries_time
+
+    def test_bound_slow_response(self, api, httpbin):
+        start = time.time()
+
+        with pytest.raises(RequestException):
+            api.get(httpbin('delay/1'), timeout=5, deadline=0.2)
+
+        assert time.time() - start < 0.8
+
+    def test_in_budget(self, api, httpbin):
+        result = api.get(httpbin('get'), deadline=5)
+
+        assert not result.is_failed
+
+    def test_client_default(self, fake_response, mp_access_token):
+        api = mpapi.formp(mp_access_token, deadline=2)
+        api._execute_request = mock.Mock(
+            return_value=build_from_response(fake_response(text='{}'))
+        )
+
+        api.post('message/custom/send', json={})
+
+        timeout = api._execute_request.call_args[1]['timeout']
+        assert isinstance(timeout, DeadlineTimeout)
+        assert timeout.deadline.budget == 2
+
+    def test_retry_hook_stops_after_deadline(
+        self, fake_response, mp_access_token, auth_expired_ret
+    ):
+        def slow_auth_update():
+            time.sleep(0.1)
+            return 'new_token'
+
+        api = mpapi.formp(
+            mp_access_token,
+            auth_update_callback=slow_auth_update
+        )
+        api._execute_request = mock.Mock(return_value=build_from_response(
+            fake_response(text=auth_expired_ret)
+        ))
+
+        with pytest.raises(DeadlineExceeded):
+            api.get('user/info', deadline=0.05)
+
+        assert api._execute_request.call_count == 1
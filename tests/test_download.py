@@ -0,0 +1,125 @@
+# -*- encoding: utf-8
+
+import io
+
+import pytest
+import requests
+from urllib3.response import HTTPResponse
+
+from wechat import mpapi
+from wechat.result import build_from_stream, StreamResult
+
+
+def _response(body, content_type=None, status_code=200):
+    headers = {}
+    if content_type is not None:
+        headers['Content-Type'] = content_type
+
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers)
+    response.raw = HTTPResponse(
+        body=io.BytesIO(body),
+        headers=headers,
+        status=status_code,
+        preload_content=False
+    )
+    return response
+
+
+class TestBuildFromStream:
+
+    def test_stream(self):
+        result = build_from_stream(_response(b'x' * 100, 'image/jpeg'))
+
+        assert isinstance(result, StreamResult)
+        assert not result.is_failed
+        assert b''.join(result.iter_content(10)) == b'x' * 100
+        assert result.size == 100
+
+    @pytest.mark.parametrize('content_type', [
+        None,
+        'application/json; encoding=utf-8',
+        'text/plain',
+        'application/octet-stream',
+    ])
+    def test_sniff_errcode(self, content_type):
+        result = build_from_stream(_response(
+            b'{"errcode": 40007, "errmsg": "invalid media_id"}',
+            content_type
+        ))
+
+        assert result.is_failed
+        assert result.errcode == 40007
+
+    def test_json_answer(self):
+        result = build_from_stream(_response(
+            b'{"title": "video", "down_url": "http://example.com/v"}',
+            'text/plain'
+        ))
+
+        assert not result.is_failed
+        assert result.title == 'video'
+
+    def test_failed_status(self):
+        result = build_from_stream(_response(b'bad gateway', None, 502))
+
+        assert result.errcode == 502
+
+
+class TestDownload:
+
+    def test_iter_content(self, httpbin):
+        result = mpapi.formp('token').download(httpbin('stream-bytes/1000'))
+
+        assert isinstance(result, StreamResult)
+        assert result.response._content is False
+        chunks = list(result.iter_content(100))
+        assert sum(len(chunk) for chunk in chunks) == 1000
+        assert max(len(chunk) for chunk in chunks) <= 100
+
+    def test_save_to_path(self, httpbin, tmpdir):
+        dest = str(tmpdir.join('media'))
+
+        result = mpapi.formp('token').download(httpbin('bytes/1000'), dest)
+
+        assert result.size == 1000
+        assert result.content_length == 1000
+        with open(dest, 'rb') as dest_file:
+            assert len(dest_file.read()) == 1000
+
+    def test_save_to_file(self, httpbin):
+        dest = io.BytesIO()
+
+        with mpapi.formp('token').download(httpbin('bytes/100')) as result:
+            assert result.save(dest) == 100
+
+        assert len(dest.getvalue()) == 100
+
+    def test_error(self, httpbin):
+        # {"errcode": 40007}
+        result = mpapi.formp('token').download(
+            httpbin('base64/eyJlcnJjb2RlIjogNDAwMDd9'),
+            io.BytesIO()
+        )
+
+        assert result.errcode == 40007
+
+    def test_post(self, httpbin):
+        result = mpapi.formp('token').download(
+            httpbin('post'),
+            method='POST',
+            json={'media_id': 'media_id'}
+        )
+
+        assert result.json['json'] == {'media_id': 'media_id'}
+
+    def test_not_coalesced(self, httpbin):
+        api = mpapi.formp('token', coalesce=True)
+
+        assert api._lookup_flight_key(
+            'GET',
+            httpbin('bytes/10'),
+            {},
+            {'stream': True}
+        ) is None
@@ -0,0 +1,180 @@
+# -*- encoding: utf-8
+
+import pytest
+import mock
+from urllib3.connectionpool import HTTPConnectionPool
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from wechat import mpapi
+from wechat.hostpool import HostPool
+from wechat.compat import urlparse
+from wechat.exceptions import (ConnectionError, ConnectTimeout, ReadTimeout,
+                               RequestException)
+from wechat.result import build_from_response
+
+
+PRIMARY = u'https://api.weixin.qq.com'
+BACKUP = u'https://api2.weixin.qq.com'
+
+
+def _connect_error(url):
+    reason = NewConnectionError(None, 'connection refused')
+    return ConnectionError(MaxRetryError(None, url, reason))
+
+
+@pytest.fixture
+def pool():
+    return HostPool([PRIMARY, BACKUP], decay=0.5)
+
+
+class TestHostPool:
+
+    def test_candidates(self, pool):
+        assert pool.candidates(PRIMARY + u'/cgi-bin/user/info?a=1') == [
+            PRIMARY + u'/cgi-bin/user/info?a=1',
+            BACKUP + u'/cgi-bin/user/info?a=1'
+        ]
+
+    def test_unknown_host(self, pool):
+        url = u'https://api.mch.weixin.qq.com/pay/orderquery'
+
+        assert pool.candidates(url) == [url]
+
+    def test_prefer_faster_host(self, pool):
+        pool.report(PRIMARY, latency=0.5)
+        pool.report(BACKUP, latency=0.1)
+
+        assert pool.select() == [BACKUP, PRIMARY]
+
+    def test_error_rate_penalty(self, pool):
+        pool.report(PRIMARY, latency=0.1)
+        pool.report(BACKUP, latency=0.2)
+        pool.report(PRIMARY, error=ReadTimeout())
+
+        assert pool.select() == [BACKUP, PRIMARY]
+        assert pool.health()[PRIMARY]['error_rate'] == 0.5
+
+    def test_connect_error_marks_down(self, pool):
+        pool.report(PRIMARY, latency=0.01)
+        pool.report(BACKUP, latency=1)
+        pool.report(PRIMARY, error=_connect_error(PRIMARY))
+
+        health = pool.health()
+        assert not health[PRIMARY]['available']
+        assert health[PRIMARY]['failures'] == 1
+        assert pool.select() == [BACKUP, PRIMARY]
+
+    def test_server_error_result(self, pool, fake_response):
+        result = build_from_response(fake_response(503, 'busy'))
+        pool.report(PRIMARY, latency=0.1, result=result)
+
+        assert pool.health()[PRIMARY]['failures'] == 1
+        assert pool.should_failover('GET', result=result)
+        assert not pool.should_failover('POST', result=result)
+
+    def test_server_error_lazy_result(self, pool, fake_response):
+        result = build_from_response(fake_response(503, 'busy'), lazy=True)
+        pool.report(PRIMARY, latency=0.1, result=result)
+
+        assert result.response is None
+        assert pool.health()[PRIMARY]['failures'] == 1
+        assert pool.should_failover('GET', result=result)
+
+    @pytest.mark.parametrize('method, error, failover', [
+        ('GET', ReadTimeout(), True),
+        ('POST', ReadTimeout(), False),
+        ('POST', ConnectTimeout(), True),
+        ('POST', _connect_error(PRIMARY), True),
+        ('POST', ConnectionError('reset'), False),
+    ])
+    def test_should_failover(self, pool, method, error, failover):
+        assert pool.should_failover(method, error=error) == failover
+
+
+class TestApiFailover:
+
+    def _build_api(self, pool):
+        return mpapi.formp('token', host_pool=pool)
+
+    def test_failover_on_connect_error(self, pool, fake_response):
+        api = self._build_api(pool)
+        api._execute_request = mock.Mock(side_effect=[
+            _connect_error(PRIMARY),
+            build_from_response(fake_response(text='{}'))
+        ])
+
+        result = api.post('message/custom/send', json={})
+
+        assert not result.is_failed
+        urls = [args[0][1] for args in api._execute_request.call_args_list]
+        assert urls == [
+            PRIMARY + u'/cgi-bin/message/custom/send',
+            BACKUP + u'/cgi-bin/message/custom/send'
+        ]
+        assert not pool.health()[PRIMARY]['available']
+
+    def test_failover_on_5xx(self, pool, fake_response):
+        api = self._build_api(pool)
+        api._execute_request = mock.Mock(side_effect=[
+            build_from_response(fake_response(503, 'busy')),
+            build_from_response(fake_response(text='{}'))
+        ])
+
+        assert not api.get('user/info').is_failed
+        assert api._execute_request.call_count == 2
+
+    def test_no_failover_for_post_read_timeout(self, pool):
+        api = self._build_api(pool)
+        api._execute_request = mock.Mock(side_effect=ReadTimeout())
+
+        with pytest.raises(RequestException):
+            api.post('message/custom/send', json={})
+
+        assert api._execute_request.call_count == 1
+
+    def test_all_hosts_failed(self, pool):
+        api = self._build_api(pool)
+        api._execute_request = mock.Mock(side_effect=ReadTimeout())
+
+        with pytest.raises(ReadTimeout):
+            api.get('user/info')
+
+        assert api._execute_request.call_count == 2
+
+    def test_retry_uses_failover_url(self, pool, fake_response,
+                                     auth_expired_ret):
+        api = mpapi.formp(
+            'token',
+            host_pool=pool,
+            auth_update_callback=lambda: 'new_token'
+        )
+        api._execute_request = mock.Mock(side_effect=[
+            _connect_error(PRIMARY),
+            build_from_response(fake_response(text=auth_expired_ret)),
+            build_from_response(fake_response(text='{}'))
+        ])
+
+        assert not api.get('user/info').is_failed
+        assert api._execute_request.call_args[0][1].startswith(BACKUP)
+
+    def test_no_transport_retry_before_failover(self, httpbin):
+        primary = httpbin().rstrip('/')
+        backup = primary.replace(urlparse(primary).hostname, 'localhost')
+        api = self._build_api(HostPool([primary, backup]))
+        hosts = []
+        make_request = HTTPConnectionPool._make_request
+
+        def _make_request(conn_pool, *args, **kwargs):
+            hosts.append(conn_pool.host)
+            return make_request(conn_pool, *args, **kwargs)
+
+        with mock.patch.object(
+            HTTPConnectionPool,
+            '_make_request',
+            autospec=True,
+            side_effect=_make_request
+        ):
+            result = api.get(httpbin('status', '502'))
+
+        assert result.status_code == 502
+        assert hosts == [urlparse(primary).hostname, 'localhost']
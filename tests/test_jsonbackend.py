@@ -0,0 +1,81 @@
+# -*- encoding: utf-8
+
+import pytest
+
+from wechat import jsonbackend, mpapi
+
+
+@pytest.fixture(params=jsonbackend.BACKENDS)
+def backend(request):
+    pytest.importorskip(request.param)
+    jsonbackend.use(request.param)
+    yield request.param
+    jsonbackend.use()
+
+
+class TestJsonBackend:
+
+    def test_use(self, backend):
+        assert jsonbackend.backend_name() == backend
+
+    def test_loads(self, backend):
+        document = u'{"nickname": "微信", "tagid_list": [1, 2]}'
+        expected = {u'nickname': u'微信', u'tagid_list': [1, 2]}
+
+        assert jsonbackend.loads(document) == expected
+        assert jsonbackend.loads(document.encode('utf-8')) == expected
+
+    def test_loads_invalid(self, backend):
+        with pytest.raises(ValueError):
+            jsonbackend.loads(b'{"openid":}')
+
+    def test_dumps(self, backend):
+        obj = {u'content': u'你好', u'url': u'http://mp.weixin.qq.com/'}
+
+        assert jsonbackend.loads(jsonbackend.dumps(obj)) == obj
+        assert u'你好' in jsonbackend.dumps(obj)
+        assert u'\\/' not in jsonbackend.dumps(obj)
+        assert jsonbackend.dumps_bytes(obj) == (
+            jsonbackend.dumps(obj).encode('utf-8')
+        )
+
+    def test_unknown(self):
+        with pytest.raises(ValueError):
+            jsonbackend.use('marshal')
+
+    def test_default_is_fastest(self):
+        installed = []
+        for name in jsonbackend.BACKENDS:
+            try:
+                __import__(name)
+            except ImportError:
+                continue
+            installed.append(name)
+
+        jsonbackend.use()
+        assert jsonbackend.backend_name() == installed[0]
+
+
+class TestJsonBody:
+
+    def test_post(self, backend, httpbin):
+        result = mpapi.formp('token').post(
+            httpbin('post'),
+            json={u'touser': u'openid', u'text': {u'content': u'你好'}}
+        )
+
+        assert result.json['json'] == {
+            u'touser': u'openid',
+            u'text': {u'content': u'你好'}
+        }
+        assert result.headers['Content-Type'] == 'application/json'
+        assert u'你好' in result.data
+
+    def test_data_kept(self, httpbin):
+        result = mpapi.formp('token').post(
+            httpbin('post'),
+            data={'k': 'v'},
+            json={'ignored': True}
+        )
+
+        assert result.form == {'k': 'v'}
@@ -0,0 +1,295 @@
+# -*- encoding: utf-8
+
+import time
+
+import pytest
+import mock
+from urllib3.exceptions import (MaxRetryError, ReadTimeoutError,
+                                NewConnectionError)
+
+from wechat import mpapi, api as api_module
+from wechat.latency import LatencyHistogram, AdaptiveTimeout
+from wechat.circuitbreaker import CircuitBreaker
+from wechat.ratelimit import RateLimiter
+from wechat.exceptions import ReadTimeout, ConnectionError
+from wechat.result import build_from_response
+
+
+URL = u'https://api.weixin.qq.com/cgi-bin/getcallbackip'
+
+
+def _warm_up(adaptive_timeout, latency, count=20, url=URL):
+    for _ in range(count):
+        adaptive_timeout.observe(url, latency)
+
+
+class TestLatencyHistogram:
+
+    def test_quantile(self):
+        histogram = LatencyHistogram()
+        for _ in range(99):
+            histogram.observe(0.01)
+        histogram.observe(1)
+
+        assert histogram.quantile(0.5) == pytest.approx(0.01, rel=0.25)
+        assert histogram.quantile(0.99) == pytest.approx(0.01, rel=0.25)
+        assert histogram.quantile(1) == pytest.approx(1, rel=0.25)
+
+    def test_empty(self):
+        assert LatencyHistogram().quantile(0.99) is None
+
+    def test_window_fades_old_samples(self):
+        histogram = LatencyHistogram(window=10)
+        for _ in range(9):
+            histogram.observe(1)
+        for _ in range(20):
+            histogram.observe(0.01)
+
+        assert histogram.count < 10
+        assert histogram.quantile(0.5) == pytest.approx(0.01, rel=0.25)
+
+
+class TestAdaptiveTimeout:
+
+    def test_default_before_enough_samples(self):
+        adaptive_timeout = AdaptiveTimeout(
+            min_samples=20,
+            initial={'pay/refund': 10}
+        )
+        _warm_up(adaptive_timeout, 0.05, count=19)
+
+        assert adaptive_timeout.timeout_for(URL, 1) == 1
+        assert adaptive_timeout.timeout_for(
+            u'https://api.mch.weixin.qq.com/secapi/pay/refund',
+            1
+        ) == 10
+
+    @pytest.mark.parametrize('latency, expected', [
+        (0.05, 0.1),
+        (0.5, 1.0),
+        (20, 30),
+    ])
+    def test_bounded_p99_timeout(self, latency, expected):
+        adaptive_timeout = AdaptiveTimeout(factor=2, floor=0.2, ceiling=30)
+        _warm_up(adaptive_timeout, latency)
+
+        timeout = adaptive_timeout.timeout_for(URL, 1)
+        assert 0.2 <= timeout <= 30
+        assert timeout == pytest.approx(max(expected, 0.2), rel=0.3)
+
+    def test_endpoints_isolated(self):
+        adaptive_timeout = AdaptiveTimeout(floor=0.01)
+        _warm_up(adaptive_timeout, 0.01)
+        _warm_up(adaptive_timeout, 2, url=URL.replace('getcallbackip', 'x'))
+
+        assert adaptive_timeout.timeout_for(URL) < 0.1
+        stats = adaptive_timeout.stats()
+        assert stats[URL]['count'] == 20
+        assert len(stats) == 2
+
+    def test_hedge_delay(self):
+        adaptive_timeout = AdaptiveTimeout(hedge=True)
+        assert adaptive_timeout.hedge_delay(URL) is None
+
+        _warm_up(adaptive_timeout, 0.05)
+        assert adaptive_timeout.hedge_delay(URL) == pytest.approx(
+            0.05,
+            rel=0.25
+        )
+        assert AdaptiveTimeout().hedge_delay(URL) is None
+
+
+class TestApiAdaptiveTimeout:
+
+    def _build_api(self, fake_response, adaptive_timeout):
+        api = mpapi.formp('token', adaptive_timeout=adaptive_timeout)
+        api._execute_request = mock.Mock(
+            return_value=build_from_response(fake_response(text='{}'))
+        )
+        return api
+
+    def test_adapted_timeout(self, fake_response):
+        adaptive_timeout = AdaptiveTimeout(factor=2, floor=0.2)
+        _warm_up(adaptive_timeout, 0.5)
+        api = self._build_api(fake_response, adaptive_timeout)
+
+        api.get('getcallbackip')
+
+        timeout = api._execute_request.call_args[1]['timeout']
+        assert timeout == pytest.approx(1.0, rel=0.3)
+
+    def test_explicit_timeout_respected(self, fake_response):
+        adaptive_timeout = AdaptiveTimeout()
+        _warm_up(adaptive_timeout, 0.5)
+        api = self._build_api(fake_response, adaptive_timeout)
+
+        api.get('getcallbackip', timeout=5)
+
+        assert api._execute_request.call_args[1]['timeout'] == 5
+
+    def test_observe(self, fake_response):
+        adaptive_timeout = AdaptiveTimeout()
+        api = self._build_api(fake_response, adaptive_timeout)
+
+        api.get('getcallbackip')
+
+        assert adaptive_timeout.stats()[URL]['count'] == 1
+
+    def test_observe_timeout(self):
+        adaptive_timeout = AdaptiveTimeout()
+        api = mpapi.formp('token', adaptive_timeout=adaptive_timeout)
+        api._execute_request = mock.Mock(side_effect=ReadTimeout())
+
+        with pytest.raises(ReadTimeout):
+            api.get('getcallbackip')
+
+        assert adaptive_timeout.stats()[URL]['count'] == 1
+
+    @pytest.mark.parametrize('reason, count', [
+        (ReadTimeoutError(None, URL, 'read timed out'), 1),
+        (NewConnectionError(None, 'connection refused'), 0),
+    ])
+    def test_observe_retried_timeout(self, reason, count):
+        # the read timeout retried by urllib3 is raised as ConnectionError
+        adaptive_timeout = AdaptiveTimeout()
+        api = mpapi.formp('token', adaptive_timeout=adaptive_timeout)
+        api._execute_request = mock.Mock(
+            side_effect=ConnectionError(MaxRetryError(None, URL, reason))
+        )
+
+        with pytest.raises(ConnectionError):
+            api.get('getcallbackip')
+
+        assert adaptive_timeout.stats()[URL]['count'] == count
+
+
+class TestHedging:
+
+    def _build_api(self, fake_response, delays):
+        adaptive_timeout = AdaptiveTimeout(hedge=True)
+        _warm_up(adaptive_timeout, 0.02)
+        api = mpapi.formp('token', adaptive_timeout=adaptive_timeout)
+        delays = iter(delays)
+
+        def _execute(*args, **kwargs):
+            delay = next(delays)
+            time.sleep(delay)
+            return build_from_response(
+                fake_response(text='{{"delay": {}}}'.format(delay))
+            )
+
+        api._execute_request = mock.Mock(side_effect=_execute)
+        return api
+
+    def test_hedge_slow_request(self, fake_response):
+        api = self._build_api(fake_response, [0.5, 0.01])
+        start = time.time()
+
+        result = api.get('getcallbackip')
+
+        assert result.delay == 0.01
+        assert api._execute_request.call_count == 2
+        assert time.time() - start < 0.3
+
+    def test_no_hedge_for_fast_request(self, fake_response):
+        api = self._build_api(fake_response, [0.001])
+
+        api.get('getcallbackip')
+
+        assert api._execute_request.call_count == 1
+
+    def test_no_hedge_for_post(self, fake_response):
+        api = self._build_api(fake_response, [0.1])
+
+        api.post('getcallbackip', json={})
+
+        assert api._execute_request.call_count == 1
+
+    def test_hedge_failed_then_primary_wins(self, fake_response):
+        adaptive_timeout = AdaptiveTimeout(hedge=True)
+        _warm_up(adaptive_timeout, 0.02)
+        api = mpapi.formp('token', adaptive_timeout=adaptive_timeout)
+        responses = iter([0.2, ReadTimeout()])
+
+        def _execute(*args, **kwargs):
+            response = next(responses)
+            if isinstance(response, Exception):
+                raise response
+            time.sleep(response)
+            return build_from_response(fake_response(text='{}'))
+
+        api._execute_request = mock.Mock(side_effect=_execute)
+
+        assert not api.get('getcallbackip').is_failed
+
+    def _build_hedged_api(self, fake_response, responses, **kwargs):
+        adaptive_timeout = AdaptiveTimeout(hedge=True)
+        _warm_up(adaptive_timeout, 0.02)
+        api = mpapi.formp(
+            'token',
+            adaptive_timeout=adaptive_timeout,
+            **kwargs
+        )
+        responses = iter(responses)
+
+        def _execute(*args, **kwargs):
+            delay, response = next(responses)
+            time.sleep(delay)
+            if isinstance(response, Exception):
+                raise response
+            return build_from_response(response)
+
+        api._execute_request = mock.Mock(side_effect=_execute)
+        return api
+
+    def test_hedge_counted_by_breaker(self, fake_response):
+        breaker = CircuitBreaker()
+        api = self._build_hedged_api(fake_response, [
+            (0.2, ReadTimeout()),
+            (0.01, fake_response(text='{}'))
+        ], circuit_breaker=breaker)
+
+        assert not api.get('getcallbackip').is_failed
+        time.sleep(0.3)
+
+        assert api._execute_request.call_count == 2
+        assert list(breaker.states().values()) == [
+            {'state': 'closed', 'failures': 1}
+        ]
+
+    def test_hedge_rate_limited(self, fake_response):
+        api = self._build_hedged_api(fake_response, [
+            (0.2, fake_response(text='{}')),
+            (0.01, fake_response(text='{}'))
+        ], rate_limiter=RateLimiter(rate=0.1, capacity=1))
+
+        start = time.time()
+        assert not api.get('getcallbackip').is_failed
+
+        assert api._execute_request.call_count == 1
+        assert time.time() - start >= 0.2
+
+    def test_no_hedge_when_workers_busy(self, fake_response):
+        api = self._build_hedged_api(fake_response, [
+            (0.2, fake_response(text='{}')),
+        ])
+
+        with mock.patch.object(api_module, '_hedge_slots', mock.Mock(
+            acquire=mock.Mock(return_value=False)
+        )):
+            assert not api.get('getcallbackip').is_failed
+
+        assert api._execute_request.call_count == 1
+
+    def test_lost_response_closed(self, fake_response):
+        lost_response = fake_response(text='{}')
+        lost_response.close = mock.Mock()
+        api = self._build_hedged_api(fake_response, [
+            (0.2, lost_response),
+            (0.01, fake_response(text='{"hedge": 1}'))
+        ])
+
+        assert api.get('getcallbackip').hedge == 1
+        time.sleep(0.3)
+
+        lost_response.close.assert_called_once_with()
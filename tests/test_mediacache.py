@@ -0,0 +1,177 @@
+# -*- encoding: utf-8
+
+import io
+import time
+
+import pytest
+import mock
+
+from wechat import mpapi
+from wechat.mediacache import (MemoryMediaCache, SQLiteMediaCache,
+                               content_digest, media_expires_at)
+from wechat.result import build_from, build_from_response
+from wechat.settings import MEDIA_EXPIRES_IN
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def media_cache(request, tmpdir):
+    if request.param == 'memory':
+        return MemoryMediaCache()
+    return SQLiteMediaCache(str(tmpdir.join('media.db')))
+
+
+@pytest.fixture
+def media_path(tmpdir):
+    path = tmpdir.join('a.jpg')
+    path.write_binary(b'jpeg')
+    return str(path)
+
+
+class TestContentDigest:
+
+    def test_same_content(self, media_path):
+        digest = content_digest('image', b'jpeg')
+
+        assert content_digest('image', media_path) == digest
+        assert content_digest('image', ('a.jpg', io.BytesIO(b'jpeg'))) == (
+            digest
+        )
+        assert content_digest('thumb', b'jpeg') != digest
+        assert content_digest('image', b'png') != digest
+
+    def test_file_position_kept(self):
+        media = io.BytesIO(b'jpeg')
+        content_digest('image', media)
+
+        assert media.tell() == 0
+
+    def test_iterable(self):
+        assert content_digest('voice', ('a.amr', iter([b'amr']), None, 3)) is (
+            None
+        )
+
+    def test_expires_at(self):
+        result = build_from({'media_id': 'id', 'created_at': 1000})
+
+        assert 1000 < media_expires_at(result) < 1000 + MEDIA_EXPIRES_IN
+
+
+class TestMediaCache:
+
+    def test_get_set(self, media_cache):
+        media_cache.set('appid', 'digest', 'media_id', time.time() + 60)
+
+        assert media_cache.get('appid', 'digest') == 'media_id'
+        assert media_cache.get('other', 'digest') is None
+
+        media_cache.delete('appid', 'digest')
+        assert media_cache.get('appid', 'digest') is None
+
+    def test_expired(self, media_cache):
+        media_cache.set('appid', 'expired', 'media_id', time.time() - 1)
+        media_cache.set('appid', 'valid', 'media_id', time.time() + 60)
+
+        assert media_cache.get('appid', 'expired') is None
+        media_cache.purge()
+        assert len(media_cache) == 1
+
+    def test_lru(self):
+        media_cache = MemoryMediaCache(max_entries=2)
+        expires_at = time.time() + 60
+        media_cache.set('appid', 'a', 'media_a', expires_at)
+        media_cache.set('appid', 'b', 'media_b', expires_at)
+        media_cache.get('appid', 'a')
+        media_cache.set('appid', 'c', 'media_c', expires_at)
+
+        assert media_cache.get('appid', 'a') == 'media_a'
+        assert media_cache.get('appid', 'b') is None
+        assert len(media_cache) == 2
+
+    def test_full_evicts_expired_first(self):
+        media_cache = MemoryMediaCache(max_entries=2)
+        media_cache.set('appid', 'a', 'media_a', time.time() + 60)
+        media_cache.set('appid', 'expired', 'media', time.time() - 1)
+        media_cache.set('appid', 'c', 'media_c', time.time() + 60)
+
+        assert media_cache.get('appid', 'a') == 'media_a'
+
+    def test_sqlite_evicts_expired_on_write(self, tmpdir):
+        media_cache = SQLiteMediaCache(str(tmpdir.join('media.db')))
+        media_cache.set('appid', 'expired', 'media', time.time() - 1)
+        media_cache.set('appid', 'valid', 'media', time.time() + 60)
+
+        assert len(media_cache) == 1
+
+
+class TestMpApiMediaCache:
+
+    def _build_api(self, fake_response, media_cache):
+        api = mpapi.formp('token', media_cache=media_cache, appid='appid')
+        api._execute_request = mock.Mock(return_value=build_from_response(
+            fake_response(text=u'{{"type": "image", "media_id": "id", '
+                               u'"created_at": {}}}'.format(int(time.time())))
+        ))
+        return api
+
+    def test_cached(self, fake_response, media_cache, media_path):
+        api = self._build_api(fake_response, media_cache)
+
+        assert api.upload_media('image', media_path).media_id == 'id'
+        result = api.upload_media('image', b'jpeg')
+
+        assert result.media_id == 'id'
+        assert result.type == 'image'
+        assert api._execute_request.call_count == 1
+
+    def test_thumb(self, fake_response, media_path):
+        media_cache = MemoryMediaCache()
+        api = mpapi.formp('token', media_cache=media_cache, appid='appid')
+        api._execute_request = mock.Mock(return_value=build_from_response(
+            fake_response(text=u'{"type": "thumb", "thumb_media_id": "id"}')
+        ))
+
+        assert api.upload_media('thumb', media_path).thumb_media_id == 'id'
+        result = api.upload_media('thumb', media_path)
+
+        assert result.thumb_media_id == 'id'
+        assert result.type == 'thumb'
+        assert api._execute_request.call_count == 1
+
+    def test_group_shares_cache(self, fake_response, media_path):
+        api = self._build_api(fake_response, MemoryMediaCache())
+        api.upload_media('image', media_path)
+
+        group = api.group()
+        group._execute_request = mock.Mock()
+
+        assert group.upload_media('image', media_path).media_id == 'id'
+        assert group._execute_request.call_count == 0
+
+    def test_failed_not_cached(self, fake_response, media_path):
+        media_cache = MemoryMediaCache()
+        api = mpapi.formp('token', media_cache=media_cache, appid='appid')
+        api._execute_request = mock.Mock(return_value=build_from_response(
+            fake_response(text=u'{"errcode": 40004}')
+        ))
+
+        assert api.upload_media('image', media_path).is_failed
+        assert len(media_cache) == 0
+
+    def test_iterable_not_cached(self, fake_response):
+        api = self._build_api(fake_response, MemoryMediaCache())
+
+        api.upload_media('voice', ('a.amr', iter([b'amr']), 'audio/amr', 3))
+        api.upload_media('voice', ('a.amr', iter([b'amr']), 'audio/amr', 3))
+
+        assert api._execute_request.call_count == 2
+
+    def test_appid_required(self):
+        with pytest.raises(ValueError):
+            mpapi.formp('token', media_cache=MemoryMediaCache())
+
+        manager = mock.Mock(appid='appid')
+        api = mpapi.formp(
+            token_manager=manager,
+            media_cache=MemoryMediaCache()
+        )
+        assert api._appid == 'appid'
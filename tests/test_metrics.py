@@ -0,0 +1,241 @@
+# -*- encoding: utf-8
+
+import pytest
+import mock
+
+from wechat import mpapi, metrics
+from wechat.metrics import MetricsRegistry
+from wechat.retrypolicy import RetryPolicy
+from wechat.tokens import AccessTokenManager
+from wechat.exceptions import ReadTimeout
+from wechat.result import build_from, build_from_response
+from wechat.message import new_pipeline, build_message_crypto_for
+
+
+ENDPOINT = u'/cgi-bin/getcallbackip'
+
+RAW_MESSAGE = u"""<xml>
+<ToUserName><![CDATA[toUser]]></ToUserName>
+<FromUserName><![CDATA[fromUser]]></FromUserName>
+<CreateTime>1348831860</CreateTime>
+<MsgType><![CDATA[text]]></MsgType>
+<Content><![CDATA[this is a test]]></Content>
+<MsgId>1234567890123456</MsgId>
+</xml>"""
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    metrics.default_registry.clear()
+    yield
+    metrics.enable()
+
+
+def _samples(name):
+    return metrics.snapshot()[name]['samples']
+
+
+class TestMetricsRegistry:
+
+    def test_counter(self):
+        registry = MetricsRegistry()
+        counter = registry.counter('calls_total', 'Calls', ('endpoint', ))
+        counter.inc(('a', ))
+        counter.inc(('a', ), 2)
+
+        assert counter.value(('a', )) == 3
+        assert registry.counter('calls_total', 'Calls') is counter
+        assert registry.snapshot()['calls_total'] == {
+            'type': 'counter',
+            'help': 'Calls',
+            'samples': [{'labels': {'endpoint': 'a'}, 'value': 3}]
+        }
+
+    def test_histogram(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram('latency', 'Latency', buckets=(1, 2))
+        for value in (0.5, 1.5, 3):
+            histogram.observe(value)
+
+        value = registry.snapshot()['latency']['samples'][0]['value']
+        assert value['buckets'] == {1: 1, 2: 2, float('inf'): 3}
+        assert value['sum'] == 5
+        assert value['count'] == 3
+
+    def test_prometheus_text(self):
+        registry = MetricsRegistry()
+        registry.counter('calls_total', 'Calls', ('path', )).inc(('"a"\n', ))
+        registry.histogram('latency', 'Latency', buckets=(1, )).observe(0.5)
+
+        assert registry.to_prometheus() == u'\n'.join([
+            u'# HELP calls_total Calls',
+            u'# TYPE calls_total counter',
+            u'calls_total{path="\\"a\\"\\n"} 1',
+            u'# HELP latency Latency',
+            u'# TYPE latency histogram',
+            u'latency_bucket{le="1"} 1',
+            u'latency_bucket{le="+Inf"} 1',
+            u'latency_sum 0.5',
+            u'latency_count 1',
+        ]) + u'\n'
+
+    def test_invalid_labels(self):
+        registry = MetricsRegistry()
+        counter = registry.counter('calls_total', 'Calls', ('endpoint', ))
+
+        with pytest.raises(ValueError):
+            counter.inc()
+
+        with pytest.raises(ValueError):
+            registry.histogram('calls_total', 'Calls')
+
+
+class TestApiMetrics:
+
+    def test_request(self, fake_response):
+        api = mpapi.formp('token')
+        api._execute_request = mock.Mock(return_value=build_from_response(
+            fake_response(text=u'{"errcode": 45009}')
+        ))
+
+        api.get('getcallbackip')
+
+        assert metrics.requests_total.value(
+            (ENDPOINT, 'GET', 200, 45009)
+        ) == 1
+        assert _samples('wechat_request_duration_seconds')[0][
+            'value'
+        ]['count'] == 1
+
+    def test_mixed_success_and_failure(self, fake_response):
+        api = mpapi.formp('token')
+        api._execute_request = mock.Mock(side_effect=[
+            build_from_response(fake_response(text=u'{"errcode": 0}')),
+            ReadTimeout()
+        ])
+
+        api.get('getcallbackip')
+        with pytest.raises(ReadTimeout):
+            api.get('getcallbackip')
+
+        text = metrics.to_prometheus()
+        assert (
+            u'endpoint="/cgi-bin/getcallbackip",method="GET",'
+            u'status="200",errcode="0"'
+        ) in text
+        assert u'status="exception",errcode="ReadTimeout"' in text
+
+    def test_request_error(self):
+        api = mpapi.formp('token')
+        api._execute_request = mock.Mock(side_effect=ReadTimeout())
+
+        with pytest.raises(ReadTimeout):
+            api.get('getcallbackip')
+
+        assert metrics.requests_total.value(
+            (ENDPOINT, 'GET', 'exception', 'ReadTimeout')
+        ) == 1
+
+    def test_bytes(self, httpbin):
+        mpapi.formp('token').post(httpbin('post'), data=b'x' * 10)
+
+        assert metrics.bytes_sent.value(('/post', )) == 10
+        assert metrics.bytes_received.value(('/post', )) > 10
+
+    def test_retries(self, fake_response):
+        api = mpapi.formp(
+            'token',
+            retry_policy=RetryPolicy(backoff_factor=0.001)
+        )
+        api._execute_request = mock.Mock(side_effect=[
+            build_from_response(fake_response(text=u'{"errcode": -1}')),
+            build_from_response(fake_response(text=u'{}'))
+        ])
+
+        api.get('getcallbackip')
+
+        assert metrics.retries_total.value((ENDPOINT, 'policy')) == 1
+        assert metrics.requests_total.value((ENDPOINT, 'GET', 200, 0)) == 1
+
+    def test_retry_hook(self, fake_response, auth_expired_ret):
+        api = mpapi.formp(
+            'token',
+            auth_update_callback=lambda: 'new_token'
+        )
+        api._execute_request = mock.Mock(side_effect=[
+            build_from_response(fake_response(text=auth_expired_ret)),
+            build_from_response(fake_response(text=u'{}'))
+        ])
+
+        api.get('getcallbackip')
+
+        assert metrics.retries_total.value((ENDPOINT, 'hook')) == 1
+
+    def test_disabled(self, fake_response):
+        metrics.disable()
+        api = mpapi.formp('token')
+        api._execute_request = mock.Mock(
+            return_value=build_from_response(fake_response(text=u'{}'))
+        )
+
+        api.get('getcallbackip')
+
+        assert _samples('wechat_requests_total') == []
+
+
+class TestTokenRefreshMetrics:
+
+    def test_refresh(self):
+        manager = AccessTokenManager('appid', 'secret', fetcher=lambda: (
+            build_from({'access_token': 'token', 'expires_in': 7200})
+        ))
+
+        manager.get_token()
+
+        assert metrics.token_refreshes_total.value(('appid', 'success')) == 1
+
+    def test_refresh_failed(self):
+        manager = AccessTokenManager('appid', 'secret', fetcher=lambda: (
+            build_from({'errcode': -1, 'errmsg': 'busy'})
+        ))
+
+        with pytest.raises(Exception):
+            manager.get_token()
+
+        assert metrics.token_refreshes_total.value(('appid', 'failure')) == 1
+
+
+class TestMessageMetrics:
+
+    def test_crypto(self):
+        crypto = build_message_crypto_for(
+            'token',
+            'abcdefghijklmnopqrstuvwxyz0123456789ABCDEFG',
+            'wx2c2769f8efd9abc2'
+        )
+
+        crypto.encrypt(u'message')
+        with pytest.raises(Exception):
+            crypto.decrypt(u'not xml', 'signature', 1409735669, 'nonce')
+
+        labels = [
+            sample['labels']
+            for sample in _samples('wechat_message_crypto_duration_seconds')
+        ]
+        assert {'operation': 'encrypt', 'result': 'success'} in labels
+        assert {'operation': 'decrypt', 'result': 'failure'} in labels
+
+    def test_pipeline_handler(self):
+        class EchoHandler(object):
+
+            def handle(self, message, context):
+                return 'echo'
+
+        new_pipeline([EchoHandler()]).handle(RAW_MESSAGE)
+
+        samples = _samples('wechat_pipeline_handler_duration_seconds')
+        assert samples[0]['labels'] == {
+            'handler': 'EchoHandler',
+            'result': 'success'
+        }
+        assert samples[0]['value']['count'] == 1
@@ -5,7 +5,7 @@ import pytest
 import mock
 
 from wechat import mpapi, RequestException
-from wechat import settings
+from wechat import settings, jsonbackend
 
 from .compat import parse_qsl, urlparse
 
@@ -254,3 +254,99 @@ class TestMpApiGroup:
 
         group.get('/user')
         auth_update.assert_called_once_with()
+
+
+@pytest.mark.usefixtures('response_builder')
+class TestMpApiMap:
+
+    def test_keep_order(self, mp_access_token):
+        mpapi_instance = mpapi.formp(mp_access_token)
+
+        def fake_request(method, url, params=None, **kwargs):
+            time.sleep(0.01 * (5 - int(params['index'])))
+            return self.response(text='{{"index": {}}}'.format(
+                params['index']
+            ))
+
+        mpapi_instance.session.request = mock.Mock(side_effect=fake_request)
+        results = mpapi_instance.map(
+            [('GET', '/user/info', {'index': i}) for i in range(5)],
+            max_concurrency=5
+        )
+
+        assert [result.index for result in results] == list(range(5))
+
+    def test_call_formats(self, mp_access_token):
+        mpapi_instance = mpapi.formp(mp_access_token)
+        mpapi_instance.session.request = mock.Mock(
+            return_value=self.response(text='{}')
+        )
+        mpapi_instance.map([
+            ('GET', '/a'),
+            ('POST', '/b', None, {'json': {'k': 'v'}}),
+            {'method': 'GET', 'api_path': '/c', 'params_dict': {'q': 1}},
+        ])
+
+        calls = sorted(
+            mpapi_instance.session.request.call_args_list,
+            key=lambda call: call[0][1]
+        )
+        assert calls[0][0][1].endswith('/a')
+        assert jsonbackend.loads(calls[1][1]['data']) == {'k': 'v'}
+        assert calls[2][1]['params']['q'] == 1
+
+    def test_invalid_call(self, mp_access_token):
+        with pytest.raises(ValueError):
+            mpapi.formp(mp_access_token).map([('GET',)])
+
+    def test_attach_call_error(self, mp_access_token):
+        mpapi_instance = mpapi.formp(mp_access_token)
+        mpapi_instance.session.request = mock.Mock(side_effect=[
+            self.response(text='{}'),
+            RequestException('timed out'),
+            self.response(text='{"errcode": 40003}'),
+        ])
+        results = mpapi_instance.map(
+            [('GET', '/user/info')] * 3,
+            max_concurrency=1
+        )
+
+        assert not results[0].is_failed
+        assert results[1].is_failed
+        assert results[1].errcode == u'REQUEST_EXCEPTION'
+        assert isinstance(results[1].exception, RequestException)
+        assert results[2].errcode == 40003
+
+    def test_bounded_concurrency(self, mp_access_token):
+        mpapi_instance = mpapi.formp(mp_access_token)
+        in_flight = []
+        max_in_flight = []
+
+        def fake_request(*args, **kwargs):
+            in_flight.append(1)
+            max_in_flight.append(len(in_flight))
+            time.sleep(0.01)
+            in_flight.pop()
+            return self.response(text='{}')
+
+        mpapi_instance.session.request = mock.Mock(side_effect=fake_request)
+        mpapi_instance.map([('GET', '/')] * 20, max_concurrency=3)
+
+        assert max(max_in_flight) <= 3
+
+    def test_retry_under_concurrency(self, mp_access_token, auth_expired_ret):
+        auth_update = mock.Mock(return_value='new_token')
+        mpapi_instance = mpapi.formp(
+            mp_access_token,
+            auth_update_callback=auth_update
+        )
+
+        def fake_request(method, url, params=None, **kwargs):
+            if params['access_token'] == 'new_token':
+                return self.response(text='{}')
+            return self.response(text=auth_expired_ret)
+
+        mpapi_instance.session.request = mock.Mock(side_effect=fake_request)
+        results = mpapi_instance.map([('GET', '/')] * 10, max_concurrency=5)
+
+        assert all(not result.is_failed for result in results)
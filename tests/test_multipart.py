@@ -0,0 +1,212 @@
+# -*- encoding: utf-8
+
+import io
+
+import pytest
+import mock
+
+from wechat import jsonbackend, mpapi
+from wechat.multipart import MultipartEncoder
+from wechat.result import build_from_response
+
+
+EXPECTED_BODY = (
+    b'--boundary\r\n'
+    b'Content-Disposition: form-data; name="description"\r\n\r\n'
+    b'{"title": "t"}\r\n'
+    b'--boundary\r\n'
+    b'Content-Disposition: form-data; name="media"; filename="a.jpg"\r\n'
+    b'Content-Type: image/jpeg\r\n\r\n'
+    b'jpeg\r\n'
+    b'--boundary--\r\n'
+)
+
+
+def _read_all(encoder, size):
+    chunks = []
+    while True:
+        chunk = encoder.read(size)
+        if not chunk:
+            return b''.join(chunks)
+        assert size < 0 or len(chunk) <= size
+        chunks.append(chunk)
+
+
+class TestMultipartEncoder:
+
+    @pytest.mark.parametrize('size', [1, 7, 1024, -1])
+    def test_body(self, size):
+        encoder = MultipartEncoder(
+            fields={'description': '{"title": "t"}'},
+            files={'media': ('a.jpg', b'jpeg')},
+            boundary='boundary'
+        )
+
+        assert len(encoder) == len(EXPECTED_BODY)
+        assert _read_all(encoder, size) == EXPECTED_BODY
+        assert encoder.content_type == (
+            'multipart/form-data; boundary=boundary'
+        )
+
+    def test_path(self, media_path):
+        with MultipartEncoder(
+            fields=[('description', '{"title": "t"}')],
+            files={'media': media_path},
+            boundary='boundary'
+        ) as encoder:
+            assert encoder.read() == EXPECTED_BODY
+
+    @mock.patch('wechat.multipart.is_py2', True)
+    def test_path_without_memoryview(self, media_path):
+        # py27 slices the mmap and bytes directly
+        with MultipartEncoder(
+            fields=[('description', '{"title": "t"}')],
+            files={'media': media_path},
+            boundary='boundary'
+        ) as encoder:
+            assert _read_all(encoder, 3) == EXPECTED_BODY
+            assert encoder.rewind()
+            assert _read_all(encoder, 3) == EXPECTED_BODY
+
+    def test_empty_file(self, tmpdir):
+        path = tmpdir.join('empty.jpg')
+        path.write_binary(b'')
+
+        with MultipartEncoder(files={'media': str(path)}) as encoder:
+            assert len(encoder.read()) == len(encoder)
+
+    def test_file_object(self):
+        media = io.BytesIO(b'skipjpeg')
+        media.name = '/tmp/a.jpg'
+        media.seek(4)
+
+        encoder = MultipartEncoder(
+            fields={'description': '{"title": "t"}'},
+            files={'media': media},
+            boundary='boundary'
+        )
+        assert encoder.read() == EXPECTED_BODY
+
+        encoder.close()
+        assert not media.closed
+
+    def test_iterable(self):
+        encoder = MultipartEncoder(
+            fields={'description': '{"title": "t"}'},
+            files={'media': ('a.jpg', iter([b'jp', b'eg']), None, 4)},
+            boundary='boundary'
+        )
+
+        assert not encoder.rewindable
+        assert encoder.rewind()
+        assert _read_all(encoder, 3) == EXPECTED_BODY
+        assert not encoder.rewind()
+
+    @pytest.mark.parametrize('chunks', [
+        [b'jp', b'e'],
+        [b'jp', b'egg'],
+        [b'jpeg', b'', b'g'],
+    ])
+    def test_iterable_length_mismatch(self, chunks):
+        encoder = MultipartEncoder(
+            files={'media': ('a.jpg', iter(chunks), None, 4)}
+        )
+
+        with pytest.raises(ValueError):
+            _read_all(encoder, 3)
+
+    def test_iterable_empty_chunks(self):
+        encoder = MultipartEncoder(
+            fields={'description': '{"title": "t"}'},
+            files={'media': ('a.jpg', iter([b'', b'jpeg', b'']), None, 4)},
+            boundary='boundary'
+        )
+
+        assert _read_all(encoder, 3) == EXPECTED_BODY
+
+    def test_iterable_without_length(self):
+        with pytest.raises(ValueError):
+            MultipartEncoder(files={'media': iter([b'jpeg'])})
+
+    def test_rewind(self, media_path):
+        encoder = MultipartEncoder(files={'media': media_path})
+        body = encoder.read()
+
+        assert encoder.rewind()
+        assert encoder.read() == body
+
+
+class TestUpload:
+
+    def test_upload(self, httpbin, media_path):
+        result = mpapi.formp('token').upload(
+            httpbin('post'),
+            {'media': media_path},
+            {'description': '{"title": "t"}'},
+            type='image'
+        )
+
+        assert result.files == {'media': 'jpeg'}
+        assert result.form == {'description': '{"title": "t"}'}
+        assert result.args['type'] == 'image'
+        assert result.headers['Content-Type'].startswith(
+            'multipart/form-data; boundary='
+        )
+
+    def _build_api(self, fake_response, auth_expired_ret, bodies):
+        api = mpapi.formp('token', auth_update_callback=lambda: 'new_token')
+        results = iter([auth_expired_ret, u'{"media_id": "id"}'])
+
+        def _execute(method, url, params_dict=None, **kwargs):
+            bodies.append(kwargs['data'].read())
+            return build_from_response(fake_response(text=next(results)))
+
+        api._execute_request = mock.Mock(side_effect=_execute)
+        return api
+
+    def test_no_rewind_without_retry(self, fake_response):
+        api = mpapi.formp('token', auth_update_callback=lambda: 'new_token')
+        encoder = mock.Mock(spec=MultipartEncoder)
+        result = build_from_response(fake_response(text=u'{"errcode": 40004}'))
+
+        assert api._retry(result, 'POST', 'url', {}, data=encoder) is result
+        assert not encoder.rewind.called
+
+    def test_rewind_on_token_expired(self, fake_response, auth_expired_ret,
+                                     media_path):
+        bodies = []
+        api = self._build_api(fake_response, auth_expired_ret, bodies)
+
+        result = api.add_material('image', media_path)
+
+        assert result.media_id == 'id'
+        assert len(bodies) == 2
+        assert bodies[0] == bodies[1]
+
+    def test_iterable_not_retried(self, fake_response, auth_expired_ret):
+        bodies = []
+        api = self._build_api(fake_response, auth_expired_ret, bodies)
+
+        result = api.upload_media(
+            'voice',
+            ('a.amr', iter([b'amr']), 'audio/amr', 3)
+        )
+
+        assert result.is_failed
+        assert len(bodies) == 1
+
+    def test_add_material_description(self, media_path):
+        api = mpapi.formp('token')
+
+        with mock.patch.object(api, 'upload') as upload:
+            api.add_material(
+                'video',
+                media_path,
+                {'title': u'标题', 'introduction': 'intro'}
+            )
+
+        files, fields = upload.call_args[0][1:3]
+        assert files == {'media': media_path}
+        assert fields['description'] == jsonbackend.dumps(
+            {'title': u'标题', 'introduction': 'intro'}
+        )
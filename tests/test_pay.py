@@ -5,7 +5,7 @@ import mock
 
 from bs4 import BeautifulSoup
 
-from wechat import pay, settings
+from wechat import pay, settings, jsonbackend, sign
 from wechat.result import build_from_response
 
 
@@ -75,6 +75,22 @@ class TestPay:
         assert soup.appid.text == 'fake_app_id'
         assert soup.mch_id.text == 'fake_mchid'
 
+    def test_json_field(self):
+        self.pay.unifiedorder(
+            out_trade_no='trade_no',
+            detail={'goods_detail': [{'goods_name': u'商品 & <赠品>'}]}
+        )
+
+        send_body = self.pay._execute_request.call_args[1]['data']
+        soup = BeautifulSoup(send_body, 'xml')
+        assert jsonbackend.loads(soup.detail.text) == {
+            'goods_detail': [{'goods_name': u'商品 & <赠品>'}]
+        }
+
+        fields = {tag.name: tag.text for tag in soup.xml.find_all()}
+        signature = fields.pop('sign')
+        assert signature == sign.sign_for_pay(self.pay._signkey, **fields)
+
 
 def test_build_jspay_params(pay_signkey, mp_appid):
     params = pay.build_jspay_params(pay_signkey, mp_appid, 'dummy_prepayid')
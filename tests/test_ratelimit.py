@@ -0,0 +1,175 @@
+# -*- encoding: utf-8
+
+import time
+
+import pytest
+import mock
+
+from wechat import mpapi
+from wechat.deadline import Deadline
+from wechat.exceptions import RateLimitExceeded, DeadlineExceeded
+from wechat.ratelimit import (TokenBucket, FileTokenBucket,
+                              FileBucketBackend, RateLimiter)
+
+
+API_URL = u'https://api.weixin.qq.com/cgi-bin/{}'
+
+
+class TestTokenBucket:
+
+    def test_burst_then_wait(self):
+        bucket = TokenBucket(rate=10, capacity=2)
+
+        assert bucket.try_acquire() == 0
+        assert bucket.try_acquire() == 0
+        assert 0 < bucket.try_acquire() <= 0.1
+
+    def test_refill(self):
+        bucket = TokenBucket(rate=100, capacity=1)
+        bucket.try_acquire()
+        time.sleep(0.02)
+
+        assert bucket.try_acquire() == 0
+
+    def test_invalid_rate(self):
+        with pytest.raises(ValueError):
+            TokenBucket(rate=0)
+
+    def test_file_bucket_shared(self, tmpdir):
+        path = str(tmpdir.join('shared.bucket'))
+        bucket = FileTokenBucket(path, rate=1, capacity=2)
+        sibling_bucket = FileTokenBucket(path, rate=1, capacity=2)
+
+        assert bucket.try_acquire() == 0
+        assert sibling_bucket.try_acquire() == 0
+        assert bucket.try_acquire() > 0
+
+        sibling_bucket.refund()
+        assert bucket.try_acquire() == 0
+
+
+class TestRateLimiter:
+
+    def test_fail_fast(self):
+        limiter = RateLimiter(rate=1, mode=RateLimiter.FAIL_FAST)
+        limiter.acquire(API_URL.format('user/info'))
+
+        with pytest.raises(RateLimitExceeded):
+            limiter.acquire(API_URL.format('user/info'))
+
+    def test_block(self):
+        limiter = RateLimiter(rate=20, capacity=1)
+        start = time.time()
+        for _ in range(3):
+            limiter.acquire(API_URL.format('user/info'))
+
+        assert time.time() - start >= 0.09
+
+    def test_block_exceed_max_wait(self):
+        limiter = RateLimiter(rate=1, max_wait=0.1)
+        limiter.acquire(API_URL.format('user/info'))
+
+        with pytest.raises(RateLimitExceeded, match='wait'):
+            limiter.acquire(API_URL.format('user/info'))
+
+    def test_block_exceed_deadline(self):
+        limiter = RateLimiter(rate=1)
+        limiter.acquire(API_URL.format('user/info'))
+        start = time.time()
+
+        with pytest.raises(DeadlineExceeded):
+            limiter.acquire(API_URL.format('user/info'), Deadline(0.1))
+
+        assert time.time() - start < 0.1
+
+    def test_path_rules(self):
+        limiter = RateLimiter(
+            rules={'message/custom/send': 1, '/user/info/': (1, 2)},
+            mode=RateLimiter.FAIL_FAST
+        )
+
+        limiter.acquire(API_URL.format('message/custom/send'))
+        with pytest.raises(RateLimitExceeded):
+            limiter.acquire(API_URL.format('message/custom/send'))
+
+        limiter.acquire(API_URL.format('user/info?openid=1'))
+        limiter.acquire(API_URL.format('user/info'))
+        for _ in range(10):
+            limiter.acquire(API_URL.format('menu/get'))
+
+    def test_refund_path_token_when_global_exceeded(self):
+        limiter = RateLimiter(
+            rate=1,
+            rules={'user/info': (1, 2)},
+            mode=RateLimiter.FAIL_FAST
+        )
+        limiter.acquire(API_URL.format('menu/get'))
+
+        with pytest.raises(RateLimitExceeded):
+            limiter.acquire(API_URL.format('user/info'))
+
+        bucket = limiter._match_bucket(API_URL.format('user/info'))
+        assert bucket.try_acquire() == 0
+        assert bucket.try_acquire() == 0
+
+    def test_file_backend_share_budget(self, tmpdir):
+        backend = FileBucketBackend(str(tmpdir.join('buckets')))
+        limiter = RateLimiter(
+            rate=1,
+            name='appid',
+            backend=backend,
+            mode=RateLimiter.FAIL_FAST
+        )
+        sibling_limiter = RateLimiter(
+            rate=1,
+            name='appid',
+            backend=backend,
+            mode=RateLimiter.FAIL_FAST
+        )
+        other_app_limiter = RateLimiter(
+            rate=1,
+            name='other_appid',
+            backend=backend,
+            mode=RateLimiter.FAIL_FAST
+        )
+
+        limiter.acquire(API_URL.format('user/info'))
+        other_app_limiter.acquire(API_URL.format('user/info'))
+        with pytest.raises(RateLimitExceeded):
+            sibling_limiter.acquire(API_URL.format('user/info'))
+
+    def test_invalid_mode(self):
+        with pytest.raises(ValueError):
+            RateLimiter(rate=1, mode='drop')
+
+
+@pytest.mark.usefixtures('response_builder')
+class TestMpApiRateLimit:
+
+    def test_fail_fast_without_request(self, mp_access_token):
+        limiter = RateLimiter(rate=1, mode=RateLimiter.FAIL_FAST)
+        mpapi_instance = mpapi.formp(mp_access_token, rate_limiter=limiter)
+        mpapi_instance.session.request = mock.Mock(
+            return_value=self.response(text='{}')
+        )
+
+        mpapi_instance.get('user/info')
+        with pytest.raises(RateLimitExceeded):
+            mpapi_instance.group().get('user/info')
+
+        assert mpapi_instance.session.request.call_count == 1
+
+    def test_block_bounded_by_deadline(self, mp_access_token):
+        limiter = RateLimiter(rate=1)
+        mpapi_instance = mpapi.formp(mp_access_token, rate_limiter=limiter)
+        mpapi_instance.session.request = mock.Mock(
+            return_value=self.response(text='{}')
+        )
+
+        mpapi_instance.get('user/info')
+        start = time.time()
+        with pytest.raises(DeadlineExceeded):
+            mpapi_instance.get('user/info', deadline=0.1)
+
+        assert time.time() - start < 0.1
+        assert mpapi_instance.session.request.call_count == 1
@@ -1,9 +1,11 @@
 # -*- encoding: utf-8
 
 import pytest
+import requests
+import mock
 import six
 
-from wechat import result
+from wechat import api, result
 from wechat.compat import json
 
 
@@ -246,3 +248,78 @@ class TestResultParseFromResponse:
 
         assert request_result.is_failed
         assert request_result.errcode == status_code
+
+
+def _requests_response(content, status_code=200):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content
+    return response
+
+
+class TestLazyResult:
+
+    def test_parsed_when_accessed(self):
+        response = _requests_response(b'{"openid": "openid"}')
+
+        with mock.patch.object(result.jsonbackend, 'loads') as loads:
+            request_result = result.build_from_response(response, lazy=True)
+            assert loads.call_count == 0
+
+        assert not request_result.is_failed
+        assert request_result.response is None
+        assert request_result.status_code == 200
+        assert request_result.openid == 'openid'
+        assert request_result.json is request_result.json
+        assert request_result.text == u'{"openid": "openid"}'
+        assert request_result.content == b'{"openid": "openid"}'
+
+    @pytest.mark.parametrize("content,errcode", [
+        (b'{"errcode": 40001, "errmsg": "invalid credential"}', 40001),
+        (b'bad gateway', 502),
+    ])
+    def test_error(self, content, errcode):
+        response = _requests_response(
+            content,
+            200 if content.startswith(b'{') else 502
+        )
+
+        request_result = result.build_from_response(response, lazy=True)
+
+        assert request_result.is_failed
+        assert request_result.errcode == errcode
+        assert request_result.response is None
+        assert request_result.content == content
+
+    def test_errcode_zero(self):
+        response = _requests_response(b'{"errcode": 0, "msgid": 1}')
+
+        request_result = result.build_from_response(response, lazy=True)
+
+        assert not request_result.is_failed
+        assert request_result.msgid == 1
+
+    def test_invalid_json(self):
+        response = _requests_response(b'{"openid":}')
+
+        request_result = result.build_from_response(response, lazy=True)
+
+        assert not request_result.is_failed
+        assert request_result.json == {}
+        assert request_result.text == u'{"openid":}'
+
+    def test_slots(self):
+        request_result = result.build_from({'openid': 'openid'})
+
+        assert not hasattr(request_result, '__dict__')
+        with pytest.raises(AttributeError):
+            request_result.openid = 'other'
+
+    def test_api(self, httpbin):
+        request_result = api.Api(lazy_result=True).get(
+            httpbin('get'),
+            openid='openid'
+        )
+
+        assert request_result.response is None
+        assert request_result.args == {'openid': 'openid'}
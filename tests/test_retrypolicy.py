@@ -0,0 +1,206 @@
+# -*- encoding: utf-8
+
+import time
+
+import pytest
+import mock
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from wechat import mpapi, auth
+from wechat.retrypolicy import RetryPolicy, RetryBudget
+from wechat.exceptions import ConnectionError, ReadTimeout
+from wechat.result import build_from_response
+
+
+API_URL = u'https://api.weixin.qq.com/cgi-bin/{}'
+
+
+def _connect_error():
+    return ConnectionError(MaxRetryError(
+        None,
+        API_URL.format('user/info'),
+        NewConnectionError(None, 'connection refused')
+    ))
+
+
+def _result(fake_response, text=u'{}', status_code=200, lazy=False):
+    return build_from_response(fake_response(status_code, text), lazy=lazy)
+
+
+@pytest.fixture
+def policy():
+    return RetryPolicy(
+        max_retries=2,
+        backoff_factor=0.001,
+        idempotent={'orderquery': True, 'user/info': False}
+    )
+
+
+class TestRetryBudget:
+
+    def test_ratio(self):
+        budget = RetryBudget(ratio=0.5, min_retries=0)
+        for _ in range(4):
+            budget.record_request()
+
+        assert budget.try_spend()
+        assert budget.try_spend()
+        assert not budget.try_spend()
+        assert budget.stats() == {'requests': 4, 'retries': 2}
+
+    def test_min_retries(self):
+        budget = RetryBudget(ratio=0, min_retries=1)
+
+        assert budget.try_spend()
+        assert not budget.try_spend()
+
+
+class TestRetryPolicy:
+
+    @pytest.mark.parametrize('method, api_path, idempotent', [
+        ('GET', 'menu/get', True),
+        ('POST', 'menu/create', False),
+        ('POST', 'pay/orderquery', True),
+        ('GET', 'user/info', False),
+    ])
+    def test_idempotent(self, policy, method, api_path, idempotent):
+        assert policy.is_idempotent(
+            method,
+            API_URL.format(api_path)
+        ) == idempotent
+
+    @pytest.mark.parametrize('method, error, retry', [
+        ('POST', _connect_error(), True),
+        ('POST', ReadTimeout(), False),
+        ('GET', ReadTimeout(), True),
+    ])
+    def test_transport_error(self, policy, method, error, retry):
+        url = API_URL.format('menu')
+
+        assert policy.should_retry(method, url, 0, error=error) == retry
+
+    @pytest.mark.parametrize('text, status_code, retry', [
+        (u'{"errcode": -1}', 200, True),
+        (u'{"errcode": 45009}', 200, False),
+        (u'{"errcode": 40001}', 200, False),
+        (u'bad gateway', 502, True),
+        (u'{}', 200, False),
+    ])
+    def test_result(self, policy, fake_response, text, status_code, retry):
+        result = _result(fake_response, text, status_code)
+
+        assert policy.should_retry(
+            'GET',
+            API_URL.format('menu/get'),
+            0,
+            result=result
+        ) == retry
+
+    def test_lazy_result(self, policy, fake_response):
+        result = _result(fake_response, u'bad gateway', 502, lazy=True)
+
+        assert policy.should_retry(
+            'GET',
+            API_URL.format('menu/get'),
+            0,
+            result=result
+        )
+
+    def test_max_retries(self, policy):
+        assert not policy.should_retry(
+            'GET',
+            API_URL.format('menu/get'),
+            2,
+            error=ReadTimeout()
+        )
+
+    def test_budget_exhausted(self):
+        policy = RetryPolicy(budget=RetryBudget(ratio=0, min_retries=0))
+
+        assert not policy.should_retry(
+            'GET',
+            API_URL.format('menu/get'),
+            0,
+            error=ReadTimeout()
+        )
+
+    def test_full_jitter_backoff(self):
+        policy = RetryPolicy(backoff_factor=1, backoff_max=3)
+
+        for retries in range(5):
+            assert 0 <= policy.backoff(retries) <= min(3, 2 ** retries)
+
+
+class TestApiRetryPolicy:
+
+    def test_retry_busy(self, policy, fake_response):
+        api = mpapi.formp('token', retry_policy=policy)
+        api._execute_request = mock.Mock(side_effect=[
+            _result(fake_response, u'{"errcode": -1}'),
+            _result(fake_response)
+        ])
+
+        assert not api.get('menu/get').is_failed
+        assert api._execute_request.call_count == 2
+
+    def test_never_retry_post_blindly(self, policy, fake_response):
+        api = mpapi.formp('token', retry_policy=policy)
+        api._execute_request = mock.Mock(side_effect=ReadTimeout())
+
+        with pytest.raises(ReadTimeout):
+            api.post('message/custom/send', json={})
+
+        assert api._execute_request.call_count == 1
+
+    def test_retry_connect_error_of_post(self, policy, fake_response):
+        api = mpapi.formp('token', retry_policy=policy)
+        api._execute_request = mock.Mock(side_effect=[
+            _connect_error(),
+            _result(fake_response)
+        ])
+
+        assert not api.post('message/custom/send', json={}).is_failed
+
+    def test_give_up(self, policy, fake_response):
+        api = mpapi.formp('token', retry_policy=policy)
+        api._execute_request = mock.Mock(
+            return_value=_result(fake_response, u'{"errcode": -1}')
+        )
+
+        assert api.get('menu/get').errcode == -1
+        assert api._execute_request.call_count == 3
+
+    def test_token_expired_left_to_hook(self, policy, fake_response,
+                                        auth_expired_ret):
+        api = mpapi.formp(
+            'token',
+            retry_policy=policy,
+            auth_update_callback=lambda: 'new_token'
+        )
+        api._execute_request = mock.Mock(side_effect=[
+            _result(fake_response, auth_expired_ret),
+            _result(fake_response)
+        ])
+
+        assert not api.get('menu/get').is_failed
+        assert api._execute_request.call_count == 2
+
+    def test_mp_auth_busy_retried_by_policy(self, policy, fake_response,
+                                            mp_appid, mp_secret):
+        api = auth.MpOuthApi(mp_appid, mp_secret, retry_policy=policy)
+        api._execute_request = mock.Mock(
+            return_value=_result(fake_response, u'{"errcode": -1}')
+        )
+
+        api.get('/token', grant_type='client_credential')
+
+        assert api._execute_request.call_count == 3
+
+    def test_urllib3_retries_disabled(self, policy, httpbin):
+        api = mpapi.formp('token', retry_policy=policy)
+        start = time.time()
+
+        result = api.get(httpbin('status/502'))
+
+        assert result.errcode == 502
+        assert time.time() - start < 0.5
@@ -0,0 +1,218 @@
+# -*- encoding: utf-8
+
+import time
+import threading
+
+import pytest
+import mock
+
+from wechat import mpapi, pay
+from wechat.exceptions import DeadlineExceeded
+from wechat.singleflight import SingleFlight
+from wechat.result import build_from_response
+
+
+def _run_threads(target, count):
+    results = [None] * count
+
+    def _run(index):
+        results[index] = target()
+
+    threads = [
+        threading.Thread(target=_run, args=(index, ))
+        for index in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _slow_execute(fake_response, text=u'{"nickname": "n"}'):
+    def _execute(*args, **kwargs):
+        time.sleep(0.1)
+        return build_from_response(fake_response(text=text))
+
+    return mock.Mock(side_effect=_execute)
+
+
+class TestSingleFlight:
+
+    def test_share_result(self):
+        flight = SingleFlight()
+        func = mock.Mock(side_effect=lambda: time.sleep(0.1) or object())
+
+        results = _run_threads(lambda: flight.do('key', func), 5)
+
+        assert func.call_count == 1
+        assert all(result is results[0] for result in results)
+        assert flight.stats() == {
+            'in_flight': 0,
+            'executed': 1,
+            'shared': 4,
+            'timed_out': 0
+        }
+
+    def test_share_exception(self):
+        flight = SingleFlight()
+        errors = []
+
+        def _raise():
+            time.sleep(0.1)
+            raise ValueError('fail')
+
+        def _call():
+            try:
+                flight.do('key', _raise)
+            except ValueError as call_error:
+                errors.append(call_error)
+
+        _run_threads(_call, 3)
+
+        assert len(errors) == 3
+        assert flight.stats()['executed'] == 1
+
+    def test_follower_timeout(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        leader = threading.Thread(
+            target=lambda: flight.do('key', lambda: release.wait(5) and 0)
+        )
+        leader.start()
+        time.sleep(0.05)
+
+        start = time.time()
+        result = flight.do('key', lambda: 1, timeout=0.1)
+        release.set()
+        leader.join()
+
+        assert result == 1
+        assert time.time() - start < 1
+        assert flight.stats()['timed_out'] == 1
+
+    def test_sequential_calls_not_shared(self):
+        flight = SingleFlight()
+        func = mock.Mock(return_value=1)
+
+        flight.do('key', func)
+        flight.do('key', func)
+
+        assert func.call_count == 2
+
+
+class TestApiCoalesce:
+
+    def test_coalesce_get(self, fake_response):
+        api = mpapi.formp('token', coalesce=True)
+        api._execute_request = _slow_execute(fake_response)
+
+        results = _run_threads(lambda: api.get('user/info', openid='o1'), 5)
+
+        assert api._execute_request.call_count == 1
+        assert all(result is results[0] for result in results)
+
+    def _hanging_leader(self, fake_response):
+        api = mpapi.formp('token', coalesce=True)
+        hanging = threading.Event()
+        calls = []
+
+        def _execute(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 1:
+                hanging.wait(5)
+            return build_from_response(fake_response(text=u'{}'))
+
+        api._execute_request = mock.Mock(side_effect=_execute)
+        leader = threading.Thread(target=lambda: api.get('user/info'))
+        leader.start()
+        time.sleep(0.05)
+        return api, hanging, leader, calls
+
+    @pytest.mark.parametrize('timeout', [0.2, (0.1, 0.1)])
+    def test_follower_bounded_by_timeout(self, fake_response, timeout):
+        api, hanging, leader, calls = self._hanging_leader(fake_response)
+
+        start = time.time()
+        try:
+            result = api.get('user/info', timeout=timeout)
+        finally:
+            hanging.set()
+            leader.join()
+
+        assert not result.is_failed
+        assert time.time() - start < 1
+        assert len(calls) == 2
+
+    def test_follower_bounded_by_deadline(self, fake_response):
+        api, hanging, leader, calls = self._hanging_leader(fake_response)
+
+        start = time.time()
+        try:
+            with pytest.raises(DeadlineExceeded):
+                api.get('user/info', timeout=10, deadline=0.2)
+        finally:
+            hanging.set()
+            leader.join()
+
+        assert time.time() - start < 1
+        assert len(calls) == 1
+
+    def test_different_params_not_coalesced(self, fake_response):
+        api = mpapi.formp('token', coalesce=True)
+        api._execute_request = _slow_execute(fake_response)
+        openids = iter(['o{}'.format(i) for i in range(3)])
+        lock = threading.Lock()
+
+        def _get():
+            with lock:
+                openid = next(openids)
+            return api.get('user/info', openid=openid)
+
+        _run_threads(_get, 3)
+
+        assert api._execute_request.call_count == 3
+
+    def test_post_not_coalesced_by_default(self, fake_response):
+        api = mpapi.formp('token', coalesce=True)
+        api._execute_request = _slow_execute(fake_response)
+
+        _run_threads(lambda: api.post('message/send', json={'a': 1}), 3)
+
+        assert api._execute_request.call_count == 3
+
+    @pytest.mark.parametrize('api_path, call_count', [
+        ('user/info', 1),
+        ('menu/get', 3)
+    ])
+    def test_coalesce_api_paths(self, fake_response, api_path, call_count):
+        api = mpapi.formp('token', coalesce=['user/info'])
+        api._execute_request = _slow_execute(fake_response)
+
+        _run_threads(lambda: api.get(api_path), 3)
+
+        assert api._execute_request.call_count == call_count
+
+    def test_not_coalesced_by_default(self, fake_response):
+        api = mpapi.formp('token')
+        api._execute_request = _slow_execute(fake_response)
+
+        _run_threads(lambda: api.get('user/info'), 3)
+
+        assert api._execute_request.call_count == 3
+
+    def test_orderquery_coalesced(self, fake_response, mp_appid):
+        wxpay = pay.for_merchant(
+            mp_appid,
+            'dummy_mchid',
+            'dummy_signkey',
+            coalesce=['orderquery']
+        )
+        wxpay._execute_request = _slow_execute(
+            fake_response,
+            u'<xml><return_code>SUCCESS</return_code></xml>'
+        )
+
+        _run_threads(lambda: wxpay.orderquery(out_trade_no='no1'), 3)
+
+        assert wxpay._execute_request.call_count == 1
@@ -0,0 +1,196 @@
+# -*- encoding: utf-8
+
+import time
+import threading
+
+import pytest
+import mock
+
+from wechat import mpapi, RequestException
+from wechat.result import build_from, build_from_response
+from wechat.tokens import AccessTokenManager
+
+
+class FakeFetcher(object):
+
+    def __init__(self, expires_in=7200, delay=0):
+        self.count = 0
+        self.expires_in = expires_in
+        self.delay = delay
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        time.sleep(self.delay)
+        with self._lock:
+            self.count += 1
+            return build_from({
+                'access_token': 'token{}'.format(self.count),
+                'expires_in': self.expires_in
+            })
+
+
+def run_concurrently(func, count):
+    threads = [threading.Thread(target=func) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class TestAccessTokenManager:
+
+    def test_cache_token(self, mp_appid, mp_secret):
+        fetcher = FakeFetcher()
+        manager = AccessTokenManager(mp_appid, mp_secret, fetcher=fetcher)
+
+        assert manager.get_token() == 'token1'
+        assert manager.get_token() == 'token1'
+        assert fetcher.count == 1
+        assert manager.expires_at > time.time() + 7000
+
+    def test_cached_token(self, mp_appid, mp_secret):
+        fetcher = FakeFetcher()
+        manager = AccessTokenManager(
+            mp_appid,
+            mp_secret,
+            refresh_ahead=60,
+            fetcher=fetcher
+        )
+
+        assert manager.cached_token() is None
+        assert manager.get_token() == 'token1'
+        assert manager.cached_token() == 'token1'
+
+        fetcher.expires_in = 30
+        manager.refresh(force=True)
+        assert manager.cached_token() is None
+        assert fetcher.count == 2
+
+    def test_fetch_when_expired(self, mp_appid, mp_secret):
+        fetcher = FakeFetcher(expires_in=0)
+        manager = AccessTokenManager(
+            mp_appid,
+            mp_secret,
+            refresh_ahead=0,
+            fetcher=fetcher
+        )
+
+        assert manager.get_token() == 'token1'
+        assert manager.get_token() == 'token2'
+
+    def test_coalesce_concurrent_refresh(self, mp_appid, mp_secret):
+        fetcher = FakeFetcher(delay=0.05)
+        manager = AccessTokenManager(mp_appid, mp_secret, fetcher=fetcher)
+        stale_token = manager.get_token()
+
+        run_concurrently(lambda: manager.refresh(stale_token), 10)
+
+        assert fetcher.count == 2
+        assert manager.get_token() == 'token2'
+
+    def test_coalesce_cold_start(self, mp_appid, mp_secret):
+        fetcher = FakeFetcher(delay=0.05)
+        manager = AccessTokenManager(mp_appid, mp_secret, fetcher=fetcher)
+
+        run_concurrently(manager.get_token, 10)
+
+        assert fetcher.count == 1
+
+    def test_force_refresh(self, mp_appid, mp_secret):
+        fetcher = FakeFetcher()
+        manager = AccessTokenManager(mp_appid, mp_secret, fetcher=fetcher)
+        manager.get_token()
+
+        assert manager.refresh(force=True) == 'token2'
+
+    def test_refresh_ahead_in_background(self, mp_appid, mp_secret):
+        fetcher = FakeFetcher(expires_in=60, delay=0.05)
+        manager = AccessTokenManager(
+            mp_appid,
+            mp_secret,
+            refresh_ahead=120,
+            fetcher=fetcher
+        )
+        assert manager.get_token() == 'token1'
+
+        start = time.time()
+        for _ in range(5):
+            assert manager.get_token() == 'token1'
+        assert time.time() - start < 0.05
+
+        time.sleep(0.1)
+        assert fetcher.count == 2
+        assert manager._token == 'token2'
+
+    def test_fetch_failed(self, mp_appid, mp_secret):
+        manager = AccessTokenManager(
+            mp_appid,
+            mp_secret,
+            fetcher=lambda: build_from({'errcode': 40013, 'errmsg': 'appid'})
+        )
+
+        with pytest.raises(RequestException, match='40013'):
+            manager.get_token()
+
+    def test_default_fetcher(self, mocker, mp_appid, mp_secret):
+        patched_get_token = mocker.patch(
+            'wechat.tokens.get_mp_access_token',
+            return_value=build_from({
+                'access_token': 'token',
+                'expires_in': 7200
+            })
+        )
+        manager = AccessTokenManager(mp_appid, mp_secret, timeout=3)
+
+        assert manager.get_token() == 'token'
+        patched_get_token.assert_called_once_with(
+            mp_appid,
+            mp_secret,
+            timeout=3
+        )
+
+
+@pytest.mark.usefixtures('response_builder')
+class TestMpApiWithTokenManager:
+
+    def test_use_manager_token(self, mp_appid, mp_secret):
+        manager = AccessTokenManager(
+            mp_appid,
+            mp_secret,
+            fetcher=FakeFetcher()
+        )
+        mpapi_instance = mpapi.formp(token_manager=manager)
+        mpapi_instance.session.request = mock.Mock(
+            return_value=self.response(text='{}')
+        )
+
+        mpapi_instance.get('user/info')
+        group = mpapi_instance.group(root_path='/user')
+
+        assert mpapi_instance.session.request.call_args[1]['params'] == {
+            'access_token': 'token1'
+        }
+        assert group._token_manager is manager
+
+    def test_no_token_and_manager(self):
+        with pytest.raises(ValueError):
+            mpapi.formp()
+
+    def test_no_refresh_storm(self, mp_appid, mp_secret, auth_expired_ret):
+        fetcher = FakeFetcher(delay=0.02)
+        manager = AccessTokenManager(mp_appid, mp_secret, fetcher=fetcher)
+        mpapi_instance = mpapi.formp(token_manager=manager)
+        manager.get_token()
+
+        def fake_execute(method, url, params_dict=None, **kwargs):
+            if params_dict['access_token'] == 'token1':
+                text = auth_expired_ret
+            else:
+                text = '{}'
+            return build_from_response(self.response(text=text))
+
+        mpapi_instance._execute_request = fake_execute
+        results = mpapi_instance.map([('GET', '/')] * 20, max_concurrency=10)
+
+        assert all(not result.is_failed for result in results)
+        assert fetcher.count == 2
@@ -0,0 +1,206 @@
+# -*- encoding: utf-8
+
+import time
+import json
+import threading
+
+import pytest
+
+from wechat.result import build_from
+from wechat.tokens import AccessTokenManager
+from wechat.tokenstore import (MemoryTokenStore, FileTokenStore,
+                               SQLiteTokenStore, RedisTokenStore)
+
+
+class FakeRedis(object):
+    """Local fake of the redis commands used by RedisTokenStore"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _alive(self, name):
+        item = self._data.get(name)
+        if item is None:
+            return None
+
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.time():
+            del self._data[name]
+            return None
+        return value
+
+    def get(self, name):
+        with self._lock:
+            value = self._alive(name)
+            return value.encode('utf-8') if value is not None else None
+
+    def set(self, name, value, nx=False, px=None):
+        with self._lock:
+            if nx and self._alive(name) is not None:
+                return None
+
+            expires_at = time.time() + px / 1000.0 if px else None
+            self._data[name] = (value, expires_at)
+            return True
+
+    def eval(self, script, numkeys, *keys_and_args):
+        """the scripts of RedisTokenStore, run under the lock like redis"""
+        name, args = keys_and_args[0], keys_and_args[numkeys:]
+        with self._lock:
+            current = self._alive(name)
+            if script == RedisTokenStore._CAS_SCRIPT:
+                expected_token, value, px = args
+                current_token = u''
+                if current is not None:
+                    current_token = json.loads(current)['token']
+                if current_token != expected_token:
+                    return 0
+
+                self._data[name] = (value, time.time() + px / 1000.0)
+                return 1
+
+            if script == RedisTokenStore._RELEASE_SCRIPT:
+                if current != args[0]:
+                    return 0
+                del self._data[name]
+                return 1
+
+            raise ValueError('unknown script')
+
+
+@pytest.fixture(params=['memory', 'file', 'sqlite', 'redis'])
+def store(request, tmpdir):
+    if request.param == 'memory':
+        return MemoryTokenStore()
+    elif request.param == 'file':
+        return FileTokenStore(str(tmpdir.join('tokens.json')))
+    elif request.param == 'sqlite':
+        return SQLiteTokenStore(str(tmpdir.join('tokens.db')))
+    else:
+        return RedisTokenStore(FakeRedis())
+
+
+class TestTokenStore:
+
+    def test_compare_and_set(self, store):
+        expires_at = time.time() + 100
+
+        assert store.get('appid') is None
+        assert store.compare_and_set('appid', None, 'token1', expires_at)
+        assert store.get('appid') == ('token1', expires_at)
+
+        assert not store.compare_and_set('appid', None, 'token2', expires_at)
+        assert not store.compare_and_set('appid', 'x', 'token2', expires_at)
+        assert store.compare_and_set('appid', 'token1', 'token2', expires_at)
+        assert store.get('appid')[0] == 'token2'
+        assert store.get('other_appid') is None
+
+    def test_lease(self, store):
+        assert store.acquire_lease('appid', 'owner1', 10)
+        assert store.acquire_lease('appid', 'owner1', 10)
+        assert not store.acquire_lease('appid', 'owner2', 10)
+        assert store.acquire_lease('other_appid', 'owner2', 10)
+
+        store.release_lease('appid', 'owner2')
+        assert not store.acquire_lease('appid', 'owner2', 10)
+
+        store.release_lease('appid', 'owner1')
+        assert store.acquire_lease('appid', 'owner2', 10)
+
+    def test_lease_expired(self, store):
+        assert store.acquire_lease('appid', 'owner1', 0.05)
+        time.sleep(0.1)
+        assert store.acquire_lease('appid', 'owner2', 10)
+
+    def test_lease_lost(self, store):
+        expires_at = time.time() + 100
+        assert store.acquire_lease('appid', 'owner1', 0.05)
+        time.sleep(0.1)
+        assert store.acquire_lease('appid', 'owner2', 10)
+        assert store.compare_and_set('appid', None, 'token2', expires_at)
+
+        # owner1 finishes its slow fetch after the lease expired
+        assert not store.compare_and_set('appid', None, 'token1', expires_at)
+        store.release_lease('appid', 'owner1')
+
+        assert store.get('appid')[0] == 'token2'
+        assert not store.acquire_lease('appid', 'owner1', 10)
+
+
+class CountFetcher(object):
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        time.sleep(0.05)
+        with self._lock:
+            self.count += 1
+            return build_from({
+                'access_token': 'token{}'.format(self.count),
+                'expires_in': 7200
+            })
+
+
+class TestSharedTokenManager:
+
+    def _managers(self, store, fetcher, count, mp_appid, mp_secret):
+        return [
+            AccessTokenManager(
+                mp_appid,
+                mp_secret,
+                fetcher=fetcher,
+                store=store
+            ) for _ in range(count)
+        ]
+
+    def test_only_one_fetch(self, store, mp_appid, mp_secret):
+        fetcher = CountFetcher()
+        managers = self._managers(store, fetcher, 5, mp_appid, mp_secret)
+        tokens = []
+
+        threads = [
+            threading.Thread(target=lambda m=m: tokens.append(m.get_token()))
+            for m in managers
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert fetcher.count == 1
+        assert set(tokens) == set(['token1'])
+        assert store.get(mp_appid)[0] == 'token1'
+
+    def test_refresh_stale_token(self, store, mp_appid, mp_secret):
+        fetcher = CountFetcher()
+        manager, sibling = self._managers(
+            store,
+            fetcher,
+            2,
+            mp_appid,
+            mp_secret
+        )
+        stale_token = manager.get_token()
+        assert sibling.get_token() == stale_token
+
+        assert manager.refresh(stale_token) == 'token2'
+        assert sibling.refresh(stale_token) == 'token2'
+        assert fetcher.count == 2
+
+    def test_wait_lease_timeout(self, store, mp_appid, mp_secret):
+        from wechat import RequestException
+
+        manager = AccessTokenManager(
+            mp_appid,
+            mp_secret,
+            fetcher=CountFetcher(),
+            store=store,
+            lease_ttl=0.1
+        )
+        store.acquire_lease(mp_appid, 'other process', 10)
+
+        with pytest.raises(RequestException, match='timeout'):
+            manager.get_token()
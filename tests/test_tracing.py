@@ -0,0 +1,199 @@
+# -*- encoding: utf-8
+
+import threading
+
+import pytest
+import mock
+
+from wechat import mpapi, tracing
+from wechat.result import build_from_response
+from wechat.message import new_pipeline
+
+
+RAW_MESSAGE = u"""<xml>
+<ToUserName><![CDATA[toUser]]></ToUserName>
+<FromUserName><![CDATA[fromUser]]></FromUserName>
+<CreateTime>1348831860</CreateTime>
+<MsgType><![CDATA[text]]></MsgType>
+<Content><![CDATA[this is a test]]></Content>
+<MsgId>1234567890123456</MsgId>
+</xml>"""
+
+
+class RecordedSpan(tracing.Span):
+
+    def __init__(self, name, parent, attributes):
+        self.name = name
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.exception = None
+        self.ended = False
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def record_exception(self, exception):
+        self.exception = exception
+
+    def end(self):
+        self.ended = True
+
+
+class RecordingTracer(tracing.Tracer):
+
+    def __init__(self):
+        self.spans = []
+
+    def start_span(self, name, parent=None, attributes=None):
+        span = RecordedSpan(name, parent, attributes)
+        self.spans.append(span)
+        return span
+
+    def find(self, name):
+        return [span for span in self.spans if span.name == name]
+
+
+@pytest.fixture
+def tracer():
+    tracer = RecordingTracer()
+    tracing.set_tracer(tracer)
+    yield tracer
+    tracing.set_tracer(None)
+
+
+class TestTracing:
+
+    def test_disabled(self):
+        with tracing.span('noop') as span:
+            assert tracing.current_span() is None
+            span.set_attribute('key', 'value')
+
+        assert not tracing.is_enabled()
+
+    def test_nested(self, tracer):
+        with tracing.span('parent') as parent:
+            with tracing.span('child', {'key': 'value'}) as child:
+                assert tracing.current_span() is child
+
+            assert tracing.current_span() is parent
+
+        assert tracing.current_span() is None
+        assert child.parent is parent
+        assert child.attributes == {'key': 'value'}
+        assert parent.ended and child.ended
+
+    def test_exception(self, tracer):
+        with pytest.raises(ValueError):
+            with tracing.span('failed'):
+                raise ValueError()
+
+        assert isinstance(tracer.spans[0].exception, ValueError)
+        assert tracer.spans[0].ended
+
+    def test_wrap(self, tracer):
+        def _run():
+            with tracing.span('child'):
+                pass
+
+        with tracing.span('parent') as parent:
+            thread = threading.Thread(target=tracing.wrap(_run))
+            thread.start()
+            thread.join()
+
+        assert tracer.find('child')[0].parent is parent
+
+
+class TestApiTracing:
+
+    def test_spans(self, tracer, httpbin):
+        mpapi.formp('token').get(httpbin('get'))
+
+        request_span = tracer.find('wechat.request')[0]
+        execute_span = tracer.find('wechat.execute')[0]
+        parse_span = tracer.find('wechat.parse')[0]
+        assert execute_span.parent is request_span
+        assert parse_span.parent is execute_span
+        assert execute_span.attributes['http.status_code'] == 200
+        for phase in ('connect', 'send', 'ttfb', 'download', 'parse'):
+            assert execute_span.attributes['wechat.phase.' + phase] >= 0
+
+    def test_retry(self, tracer, fake_response, auth_expired_ret):
+        api = mpapi.formp('token', auth_update_callback=lambda: 'new_token')
+        api._execute_request = mock.Mock(side_effect=[
+            build_from_response(fake_response(text=auth_expired_ret)),
+            build_from_response(fake_response(text=u'{}'))
+        ])
+
+        api.get('getcallbackip')
+
+        retry_span = tracer.find('wechat.retry')[0]
+        assert retry_span.parent is tracer.find('wechat.request')[0]
+        assert retry_span.attributes['wechat.errcode'] in (
+            40001, 40014, 41001, 42001
+        )
+
+    def test_failed_request(self, tracer, fake_response):
+        api = mpapi.formp('token')
+        api._execute_request = mock.Mock(return_value=build_from_response(
+            fake_response(text=u'{"errcode": 45009}')
+        ))
+
+        api.get('getcallbackip')
+
+        request_span = tracer.find('wechat.request')[0]
+        assert request_span.attributes['wechat.errcode'] == 45009
+
+
+class TestPipelineTracing:
+
+    def test_handler_spans(self, tracer, fake_response):
+        api = mpapi.formp('token')
+        api._execute_request = mock.Mock(
+            return_value=build_from_response(fake_response(text=u'{}'))
+        )
+
+        class ApiHandler(object):
+
+            def handle(self, message, context):
+                context.span.set_attribute('user', message.FromUserName)
+                return api.get('getcallbackip')
+
+        parent = tracing.Span()
+        new_pipeline([ApiHandler()]).handle(RAW_MESSAGE, trace_parent=parent)
+
+        handle_span = tracer.find('wechat.message.handle')[0]
+        handler_span = tracer.find('wechat.message.handler')[0]
+        assert handle_span.parent is parent
+        assert handle_span.attributes['user'] == 'fromUser'
+        assert handler_span.parent is handle_span
+        assert handler_span.attributes['wechat.handler'] == 'ApiHandler'
+        assert tracer.find('wechat.request')[0].parent is handler_span
+
+
+class TestOpenTelemetryTracer:
+
+    def test_spans(self):
+        sdk_trace = pytest.importorskip('opentelemetry.sdk.trace')
+        export = pytest.importorskip('opentelemetry.sdk.trace.export')
+        in_memory = pytest.importorskip(
+            'opentelemetry.sdk.trace.export.in_memory_span_exporter'
+        )
+        exporter = in_memory.InMemorySpanExporter()
+        provider = sdk_trace.TracerProvider()
+        provider.add_span_processor(export.SimpleSpanProcessor(exporter))
+        tracing.set_tracer(tracing.OpenTelemetryTracer(
+            provider.get_tracer('test')
+        ))
+
+        try:
+            with tracing.span('parent'):
+                with pytest.raises(ValueError):
+                    with tracing.span('child', {'key': 'value'}):
+                        raise ValueError()
+        finally:
+            tracing.set_tracer(None)
+
+        child, parent = exporter.get_finished_spans()
+        assert child.parent.span_id == parent.context.span_id
+        assert child.attributes['key'] == 'value'
+        assert not child.status.is_ok
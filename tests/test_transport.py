@@ -0,0 +1,71 @@
+# -*- encoding: utf-8
+
+import pytest
+
+from wechat import mpapi
+from wechat.api import Api
+from wechat.transport import TransportRegistry
+
+
+@pytest.fixture
+def registry():
+    _registry = TransportRegistry(pool_maxsize=2, idle_timeout=60)
+    yield _registry
+    _registry.clear()
+
+
+class TestTransportRegistry:
+
+    def test_adapter_keyed_by_host_and_cert(self, registry):
+        adapter = registry.get_adapter('https://api.weixin.qq.com/cgi-bin/a')
+
+        assert adapter is registry.get_adapter('https://API.weixin.qq.com/b')
+        assert adapter is not registry.get_adapter('https://api2.qq.com')
+        assert adapter is not registry.get_adapter(
+            'https://api.weixin.qq.com',
+            cert=('cert.pem', 'key.pem')
+        )
+
+    def test_sockets_reused_across_api_instances(self, registry, httpbin):
+        for _ in range(3):
+            Api(transport_registry=registry).get(httpbin('get'))
+
+        stats = registry.stats()
+        assert stats['total']['created'] == 1
+        assert stats['total']['reused'] == 2
+        assert stats['total']['requests'] == 3
+        assert stats['total']['idle'] == 1
+        assert stats['total']['in_use'] == 0
+        assert len(stats['hosts']) == 1
+
+    def test_group_share_pool(self, registry, mp_access_token):
+        mp = mpapi.formp(mp_access_token, transport_registry=registry)
+        group = mp.group(root_path='/user')
+
+        assert group._transport_registry is registry
+        url = u'https://api.weixin.qq.com'
+        assert group.session.get_adapter(url).registry is registry
+        assert mp.session.get_adapter(url).registry is registry
+
+    def test_reap_idle(self, registry, httpbin):
+        Api(transport_registry=registry).get(httpbin('get'))
+
+        assert registry.reap_idle(idle_timeout=60) == 0
+        assert registry.reap_idle(idle_timeout=0) == 1
+        assert registry.stats()['total']['idle'] == 0
+
+        Api(transport_registry=registry).get(httpbin('get'))
+        assert registry.stats()['total']['created'] == 2
+
+    def test_configure(self, registry):
+        adapter = registry.get_adapter('https://api.weixin.qq.com')
+        registry.configure(pool_maxsize=20, pool_block=True)
+        new_adapter = registry.get_adapter('https://api.weixin.qq.com')
+
+        assert new_adapter is not adapter
+        assert new_adapter._pool_maxsize == 20
+        assert new_adapter._pool_block
+
+    def test_configure_unknown_option(self, registry):
+        with pytest.raises(ValueError, match='pool_size'):
+            registry.configure(pool_size=20)
@@ -1,8 +1,10 @@
 # -*- encoding: utf-8
 
 
-from wechat.compat import json
-from wechat import utils
+from collections import OrderedDict
+
+from wechat import utils, jsonbackend
+from wechat.xmlparser import parse_flat_xml
 
 
 class TestXmlSerialize:
@@ -34,4 +36,61 @@ class TestXmlSerialize:
             u'<xml>\n'
             u'  <dict><![CDATA[{}]]></dict>\n'
             u'</xml>'
-        ).format(json.dumps(_dict, ensure_ascii=False))
+        ).format(jsonbackend.dumps(_dict))
+
+
+class TestXmlBytesSerialize:
+
+    def test_empty(self):
+        assert utils.serialize_to_xml_bytes({}) == b'<xml>\n</xml>'
+        assert utils.serialize_to_xml_bytes({}, compact=True) == (
+            b'<xml></xml>'
+        )
+
+    def test_pretty(self):
+        xml_bytes = utils.serialize_to_xml_bytes(OrderedDict([
+            ('ToUserName', 'toUser'),
+            ('CreateTime', 1348831860),
+            ('Content', u'汉字 <a href="#">&</a>'),
+            ('MsgId', None),
+        ]))
+
+        assert xml_bytes == (
+            u'<xml>\n'
+            u'  <ToUserName><![CDATA[toUser]]></ToUserName>\n'
+            u'  <CreateTime>1348831860</CreateTime>\n'
+            u'  <Content><![CDATA[汉字 <a href="#">&</a>]]></Content>\n'
+            u'</xml>'
+        ).encode('utf-8')
+
+    def test_cdata_end(self):
+        xml_bytes = utils.serialize_to_xml_bytes({'Content': u'a]]>b'})
+
+        assert parse_flat_xml(xml_bytes) == {u'Content': u'a]]>b'}
+
+    def test_nested(self):
+        xml_bytes = utils.serialize_to_xml_bytes(OrderedDict([
+            ('ArticleCount', 2),
+            ('Articles', [
+                OrderedDict([('Title', 't1'), ('Url', 'http://a.com/?a=1')]),
+                {'Title': 't2'},
+            ]),
+            ('Music', {'Title': 'm'}),
+        ]), compact=True)
+
+        assert xml_bytes == (
+            b'<xml><ArticleCount>2</ArticleCount><Articles>'
+            b'<item><Title><![CDATA[t1]]></Title>'
+            b'<Url><![CDATA[http://a.com/?a=1]]></Url></item>'
+            b'<item><Title><![CDATA[t2]]></Title></item>'
+            b'</Articles><Music><Title><![CDATA[m]]></Title></Music></xml>'
+        )
+
+    def test_escape(self):
+        class Value(object):
+            def __str__(self):
+                return '<&>'
+
+        assert b'<v>&lt;&amp;&gt;</v>' in utils.serialize_to_xml_bytes(
+            {'v': Value()}
+        )
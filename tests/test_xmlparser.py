@@ -0,0 +1,103 @@
+# -*- encoding: utf-8
+
+import pytest
+
+from wechat import result
+from wechat.xmlparser import parse_flat_xml, parse_xml_tags
+
+
+UNIFIEDORDER_XML = u'''<xml>
+   <return_code><![CDATA[SUCCESS]]></return_code>
+   <return_msg><![CDATA[OK]]></return_msg>
+   <appid><![CDATA[wx2421b1c4370ec43b]]></appid>
+   <mch_id><![CDATA[10000100]]></mch_id>
+   <nonce_str><![CDATA[IITRi8Iabbblz1Jc]]></nonce_str>
+   <sign><![CDATA[7921E432F65EB8ED0CE9755F0E86D72F]]></sign>
+   <result_code><![CDATA[SUCCESS]]></result_code>
+   <prepay_id><![CDATA[wx201411101639507cbf6ffd8b0779950874]]></prepay_id>
+   <trade_type><![CDATA[JSAPI]]></trade_type>
+   <total_fee>1</total_fee>
+   <attach><![CDATA[<b>支付</b> & 测试]]></attach>
+</xml>'''
+
+
+class TestParseFlatXml:
+
+    @pytest.mark.parametrize("xml_text", [
+        UNIFIEDORDER_XML,
+        UNIFIEDORDER_XML.encode('utf-8'),
+        u'<xml></xml>',
+        u'<xml> </xml>',
+        u'<xml><a>1</a><b/><c> 2 </c><a>3</a></xml>',
+        u'<xml><coupon><id>1</id><fee>2</fee></coupon></xml>',
+        u'<xml><msg>a &amp; b</msg></xml>',
+    ])
+    def test_same_as_soup(self, xml_text):
+        assert parse_flat_xml(xml_text) == result._parse_xml_by_soup(xml_text)
+
+    def test_cdata(self):
+        fields = parse_flat_xml(UNIFIEDORDER_XML)
+
+        assert fields[u'attach'] == u'<b>支付</b> & 测试'
+        assert fields[u'total_fee'] == u'1'
+
+    @pytest.mark.parametrize("xml_text", [
+        u'<xml><a>1</xml>',
+        u'<root><a>1</a></root>',
+        u'<!DOCTYPE xml [<!ENTITY a "b">]><xml><a>&a;</a></xml>',
+        u'<xml><a>1</a></xml><xml></xml>',
+    ])
+    def test_invalid(self, xml_text):
+        with pytest.raises(ValueError):
+            parse_flat_xml(xml_text)
+
+
+class TestBuildFromXml:
+
+    def test_parsed(self):
+        request_result = result.build_from(UNIFIEDORDER_XML)
+
+        assert not request_result.is_failed
+        assert request_result.prepay_id == (
+            u'wx201411101639507cbf6ffd8b0779950874'
+        )
+
+    def test_error(self):
+        request_result = result.build_from(
+            u'<xml><return_code>SUCCESS</return_code>'
+            u'<result_code>FAIL</result_code>'
+            u'<err_code>ORDERPAID</err_code>'
+            u'<err_code_des>商户订单已支付</err_code_des></xml>'
+        )
+
+        assert request_result.is_failed
+        assert request_result.errcode == u'ORDERPAID'
+        assert request_result.errmsg == u'商户订单已支付'
+
+    def test_soup_fallback(self):
+        request_result = result.build_from(
+            u'<xml><return_code>FAIL</return_code><return_msg>msg</xml>'
+        )
+
+        assert request_result.is_failed
+        assert request_result.errcode == u'FAIL'
+
+
+class TestParseXmlTags:
+
+    def test_nested(self):
+        fields = parse_xml_tags(
+            u'<xml><Event>scancode_push</Event>'
+            u'<ScanCodeInfo><ScanType>qrcode</ScanType>'
+            u'<ScanResult>1</ScanResult></ScanCodeInfo>'
+            u'<ScanType>ignored</ScanType></xml>'
+        )
+
+        assert fields[u'Event'] == u'scancode_push'
+        assert fields[u'ScanCodeInfo'] == u'qrcode1'
+        assert fields[u'ScanType'] == u'qrcode'
+        assert fields[u'xml'] == u'scancode_pushqrcode1ignored'
+
+    def test_malformed(self):
+        with pytest.raises(ValueError):
+            parse_xml_tags(u'<xml><a>1</xml>')